@@ -0,0 +1,222 @@
+"""
+Adaptive polling for ETF Tracker daemon mode
+Tick cadence follows price and premium/discount activity and upstream errors, within per-source request budgets
+"""
+
+import math
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlparse
+
+import config
+from scheduler import Scheduler
+
+# Requests a source is expected to cost per tick before any were counted
+INITIAL_COST = {'nse': 1.0, 'spot': 2.0, 'forex': 1.0}
+
+
+class SourceBudget:
+    """Token bucket of `per_hour` requests, allowed to run `burst` requests ahead"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'cost', 'errors', 'requests')
+
+    def __init__(self, per_hour, burst, cost, now):
+        self.rate = per_hour / 3600
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+        # Smoothed requests per tick and share of ticks with an error
+        self.cost = cost
+        self.errors = 0.0
+        self.requests = 0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now):
+        """Seconds until the bucket holds one tick's worth of requests"""
+        self.refill(now)
+        missing = self.cost - self.tokens
+        return missing / self.rate if missing > 0 and self.rate > 0 else 0.0
+
+
+class SymbolActivity:
+    __slots__ = ('ltp', 'premium', 'seen', 'activity')
+
+    def __init__(self):
+        self.ltp = None
+        self.premium = None
+        self.seen = None
+        # 1.0 is the reference activity, polled every base_interval
+        self.activity = 1.0
+
+
+class AdaptivePolicy:
+    """
+    How long to wait before the next tick.
+
+    Each ETF gets an activity score: its LTP move and premium/discount
+    change since the last tick, scaled to a per-minute figure (moves grow
+    with the square root of time, so long quiet gaps are not mistaken for
+    jumps) and divided by ADAPTIVE_CONFIG's reference moves. The score
+    rises quickly and decays with a half-life of `activity_halflife`
+    seconds. A symbol at the reference activity wants a tick every
+    `base_interval` seconds, twice as active every half that, within
+    [min_interval, max_interval]. NSE serves every ETF from the same bulk
+    listing, so the tick interval is the shortest symbol interval.
+
+    Every upstream counts its requests through a response hook on the
+    tracker's sessions. The interval grows with the worst recent error
+    rate, and never undercuts what a source's hourly budget (a token
+    bucket) can pay for, so a long volatile stretch settles at the budget
+    rather than the rate limit. Requests made in shard worker processes
+    are not seen by the hook.
+    """
+
+    def __init__(self, api_config, etfs=None, adaptive_config=None, clock=time.monotonic):
+        """
+        Args:
+            api_config: Resolved API_CONFIG, to tell which upstream a URL belongs to
+            etfs: ETF registry, config.ETFS if None
+            adaptive_config: Overrides for config.ADAPTIVE_CONFIG
+            clock: Monotonic clock in seconds
+        """
+        self.etfs = config.ETFS if etfs is None else etfs
+        self.adaptive_config = dict(config.ADAPTIVE_CONFIG, **(adaptive_config or {}))
+        self.alpha = 1 - 0.5 ** (1 / self.adaptive_config['error_halflife'])
+        self.clock = clock
+        # host:port -> source; every stub server in the benchmark shares a host
+        self.sources = {urlparse(api_config['nse_base_url']).netloc: 'nse',
+                        urlparse(api_config['forex_api_url']).netloc: 'forex'}
+        for source in api_config['spot_sources']:
+            self.sources[urlparse(source['url']).netloc] = 'spot'
+        now = clock()
+        self.budgets = {name: SourceBudget(per_hour, self.adaptive_config['burst'],
+                                           INITIAL_COST.get(name, 1.0), now)
+                        for name, per_hour in self.adaptive_config['budgets'].items()}
+        self.symbols = {symbol: SymbolActivity() for symbol in self.etfs}
+        self._lock = threading.Lock()
+        # Counted by the response hook since the last observe()
+        self._counts = {}
+        self._failures = set()
+
+    def attach(self, tracker):
+        """Count the tracker's upstream requests"""
+        for session in (tracker.http, tracker.nse.session):
+            session.hooks['response'].append(self.record_response)
+
+    def record_response(self, response, *args, **kwargs):
+        """requests response hook"""
+        source = self.sources.get(urlparse(response.url).netloc)
+        if source is None:
+            return
+        with self._lock:
+            self._counts[source] = self._counts.get(source, 0) + 1
+            if response.status_code >= 400:
+                self._failures.add(source)
+
+    def observe(self, quotes, mcx_data, forex_data, metrics):
+        """Update activity, error rates and budgets after a tick"""
+        now = self.clock()
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            failures, self._failures = self._failures, set()
+
+        # Data missing after the fetch stage is a failure even without an
+        # HTTP error, e.g. a timeout or a connection reset
+        if not quotes or any(not quotes.get(symbol) for symbol in self.etfs):
+            failures.add('nse')
+        if any(mcx_data.price(etf.get('commodity')) is None for etf in self.etfs.values()
+               if etf.get('commodity') in ('gold', 'silver')):
+            failures.add('spot')
+        if forex_data is None:
+            failures.add('forex')
+
+        for name, budget in self.budgets.items():
+            budget.refill(now)
+            spent = counts.get(name, 0)
+            budget.tokens -= spent
+            budget.requests += spent
+            budget.cost += self.alpha * (spent - budget.cost)
+            budget.errors += self.alpha * ((name in failures) - budget.errors)
+
+        move_pct = self.adaptive_config['move_pct']
+        premium_move = self.adaptive_config['premium_move']
+        for symbol, state in self.symbols.items():
+            quote = quotes.get(symbol)
+            if not quote or quote.ltp is None:
+                continue
+            premium = (metrics.get(symbol) or {}).get('premium_discount')
+            if state.seen is not None:
+                minutes = math.sqrt(max(now - state.seen, 1.0) / 60)
+                score = 0.0
+                if state.ltp:
+                    score = abs(quote.ltp / state.ltp - 1) * 100 / minutes / move_pct
+                if premium is not None and state.premium is not None:
+                    score = max(score, abs(premium - state.premium) / minutes / premium_move)
+                # Decays per second, not per tick, so a quiet spell with sparse
+                # ticks still calms down; a jump is taken at least halfway at once
+                alpha = 1 - 0.5 ** ((now - state.seen) / self.adaptive_config['activity_halflife'])
+                if score > state.activity:
+                    alpha = max(alpha, 0.5)
+                state.activity += alpha * (score - state.activity)
+            state.ltp = quote.ltp
+            state.premium = premium
+            state.seen = now
+
+    def symbol_interval(self, symbol):
+        """Seconds between ticks this symbol's recent activity calls for"""
+        cfg = self.adaptive_config
+        activity = self.symbols[symbol].activity
+        interval = cfg['base_interval'] / activity if activity > 0 else cfg['max_interval']
+        return min(cfg['max_interval'], max(cfg['min_interval'], interval))
+
+    def interval(self):
+        """Seconds until the next tick"""
+        interval = min((self.symbol_interval(symbol) for symbol in self.symbols),
+                       default=self.adaptive_config['max_interval'])
+        errors = max((budget.errors for budget in self.budgets.values()), default=0.0)
+        interval *= 1 + self.adaptive_config['error_backoff'] * errors
+        interval = min(interval, self.adaptive_config['max_interval'])
+        now = self.clock()
+        # The budget is a hard limit, even past max_interval
+        return max([interval] + [budget.wait(now) for budget in self.budgets.values()])
+
+
+class AdaptiveScheduler(Scheduler):
+    """
+    Scheduler whose open-market ticks follow an AdaptivePolicy.
+
+    Between publishes the tracker ticks as often as the policy allows;
+    ticks on the `publish_interval` grid and at the open and close still
+    happen and send the Telegram message, so the update cadence is the
+    same as with the fixed grid. Closed-market behavior is unchanged.
+    """
+
+    def __init__(self, tracker, daemon_config=None, adaptive_config=None, clock=None):
+        super().__init__(tracker, daemon_config, clock)
+        self.policy = AdaptivePolicy(tracker.api_config, adaptive_config=adaptive_config)
+        self.policy.attach(tracker)
+
+    def next_tick(self, now):
+        session = self.calendar.session_at(now)
+        if not session:
+            return super().next_tick(now)
+        market_open, market_close = session
+        if now == market_open:
+            return now, True
+        steps = math.floor((now - market_open) / self.publish_interval) + 1
+        next_publish = market_open + steps * self.publish_interval
+        tick = min(now + timedelta(seconds=self.policy.interval()), next_publish, market_close)
+        return tick, self.is_publish_tick(tick, market_open, market_close)
+
+    def tick(self, publish):
+        try:
+            quotes, mcx_data, forex_data, metrics, _ = self.tracker.run(publish=publish)
+            self.policy.observe(quotes, mcx_data, forex_data, metrics)
+        except Exception as e:
+            print(f"❌ Tick failed: {e}")
+            return
+        print(f"🎚️  Next tick in {self.policy.interval():.0f}s")
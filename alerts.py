@@ -0,0 +1,294 @@
+"""
+Threshold alert engine for ETF Tracker
+Rules indexed by (symbol, metric) and threshold, evaluated by binary search with hysteresis
+"""
+
+import bisect
+import json
+import os
+
+import config
+
+ABOVE = 'above'
+BELOW = 'below'
+
+
+class AlertRule:
+    """
+    Fires when `metric` for `symbol` goes above (or below) `threshold`.
+
+    After firing the rule is disarmed until the value retreats past
+    `threshold -/+ hysteresis`, so it does not fire again every tick.
+    """
+
+    __slots__ = ('rule_id', 'symbol', 'metric', 'direction', 'threshold', 'hysteresis', 'label')
+
+    def __init__(self, symbol, metric, direction, threshold, hysteresis=0.0, label=None,
+                 rule_id=None):
+        if direction not in (ABOVE, BELOW):
+            raise ValueError(f"Unknown alert direction: {direction}")
+        self.symbol = symbol
+        self.metric = metric
+        self.direction = direction
+        self.threshold = float(threshold)
+        self.hysteresis = float(hysteresis)
+        self.label = label
+        self.rule_id = rule_id or f"{symbol}:{metric}:{direction}:{self.threshold:g}"
+
+    @property
+    def rearm_level(self):
+        if self.direction == ABOVE:
+            return self.threshold - self.hysteresis
+        return self.threshold + self.hysteresis
+
+
+class MetricIndex:
+    """Sorted thresholds and re-arm levels for one (symbol, metric)"""
+
+    def __init__(self):
+        # Parallel sorted lists: keys for bisect, rules alongside
+        self.fire = {ABOVE: ([], []), BELOW: ([], [])}
+        self.rearm = {ABOVE: ([], []), BELOW: ([], [])}
+
+    @staticmethod
+    def _insert(pair, key, rule):
+        keys, rules = pair
+        i = bisect.bisect_right(keys, key)
+        keys.insert(i, key)
+        rules.insert(i, rule)
+
+    def add(self, rule):
+        self._insert(self.fire[rule.direction], rule.threshold, rule)
+        self._insert(self.rearm[rule.direction], rule.rearm_level, rule)
+
+    def crossed(self, pair, direction, previous, current):
+        """Rules whose key lies between previous and current in the given direction"""
+        keys, rules = pair
+        if direction == ABOVE:
+            # Rising: keys in [previous, current)
+            lo = bisect.bisect_left(keys, previous)
+            hi = bisect.bisect_left(keys, current)
+        else:
+            # Falling: keys in (current, previous]
+            lo = bisect.bisect_right(keys, current)
+            hi = bisect.bisect_right(keys, previous)
+        return rules[lo:hi]
+
+    def beyond(self, value):
+        """Rules whose condition already holds at `value`: above or below their threshold"""
+        keys, rules = self.fire[ABOVE]
+        above = rules[:bisect.bisect_left(keys, value)]
+        keys, rules = self.fire[BELOW]
+        return above + rules[bisect.bisect_right(keys, value):]
+
+
+class AlertEngine:
+    """
+    Evaluate many alert rules per tick.
+
+    For each updated metric only the rules whose threshold lies between the
+    previous and the new value are touched, found by binary search, so the
+    cost is O(log n + rules crossed) instead of a scan of every rule.
+    """
+
+    def __init__(self, rules=()):
+        self.indexes = {}
+        self.rules = {}
+        self.last_values = {}
+        self.disarmed = set()
+        for rule in rules:
+            self.add_rule(rule)
+
+    def add_rule(self, rule):
+        self.rules[rule.rule_id] = rule
+        self.indexes.setdefault((rule.symbol, rule.metric), MetricIndex()).add(rule)
+
+    def last_value(self, symbol, metric):
+        return self.last_values.get((symbol, metric))
+
+    def update(self, symbol, metric, value):
+        """
+        Feed one new value.
+
+        Returns:
+            List of rules that fired
+        """
+        if value is None:
+            return []
+        key = (symbol, metric)
+        previous = self.last_values.get(key)
+        self.last_values[key] = value
+        index = self.indexes.get(key)
+        if index is None or value == previous:
+            return []
+        # The first value only sets the baseline: nothing fires on the first
+        # tick, after a restart without state or when alerts are first
+        # enabled. Rules already past their threshold start disarmed, so they
+        # fire only after the value has been back on the other side, and a
+        # 'cross' pair needs a real change of side
+        if previous is None:
+            self.disarmed.update(rule.rule_id for rule in index.beyond(value))
+            return []
+
+        fired = []
+        if value > previous:
+            for rule in index.crossed(index.fire[ABOVE], ABOVE, previous, value):
+                if rule.rule_id not in self.disarmed:
+                    self.disarmed.add(rule.rule_id)
+                    fired.append(rule)
+            for rule in index.crossed(index.rearm[BELOW], ABOVE, previous, value):
+                self.disarmed.discard(rule.rule_id)
+        else:
+            for rule in index.crossed(index.fire[BELOW], BELOW, previous, value):
+                if rule.rule_id not in self.disarmed:
+                    self.disarmed.add(rule.rule_id)
+                    fired.append(rule)
+            for rule in index.crossed(index.rearm[ABOVE], BELOW, previous, value):
+                self.disarmed.discard(rule.rule_id)
+        return fired
+
+    def evaluate(self, values):
+        """
+        Feed a tick of values.
+
+        Args:
+            values: Dict of (symbol, metric) -> value
+
+        Returns:
+            List of (rule, value) for every rule that fired
+        """
+        fired = []
+        for (symbol, metric), value in values.items():
+            for rule in self.update(symbol, metric, value):
+                fired.append((rule, value))
+        return fired
+
+    def to_state(self):
+        return {
+            'last_values': [[symbol, metric, value]
+                            for (symbol, metric), value in self.last_values.items()],
+            'disarmed': sorted(self.disarmed),
+        }
+
+    def load_state(self, state):
+        self.last_values = {(symbol, metric): value
+                            for symbol, metric, value in state.get('last_values', [])}
+        self.disarmed = set(state.get('disarmed', [])) & set(self.rules)
+
+
+def alert_values(engine, quotes, metrics, mcx_data, forex_data, analytics=None):
+    """
+    Values alert rules can watch for one tick, keyed by (symbol, metric).
+
+    Args:
+        engine: AlertEngine, for the previous volume behind 'volume_delta'
+        quotes: Dict of symbol -> records.Quote
+        metrics: Output of inav.calculate_metrics()
+        mcx_data: records.SpotPrices
+        forex_data: records.FxRate, or None
+        analytics: Output of Analytics.update() for the tick, or None
+    """
+    values = {
+        ('MARKET', 'gold_usd_oz'): mcx_data.gold_usd_oz,
+        ('MARKET', 'silver_usd_oz'): mcx_data.silver_usd_oz,
+        ('MARKET', 'usd_inr'): forex_data.usd_inr if forex_data else None,
+    }
+    for symbol, quote in quotes.items():
+        if not quote:
+            continue
+        values[(symbol, 'ltp')] = quote.ltp
+        values[(symbol, 'pChange')] = quote.pChange
+        values[(symbol, 'premium_discount')] = (metrics.get(symbol) or {}).get('premium_discount')
+
+        # Volume traded since the last tick; NSE volume is cumulative for the day
+        volume = quote.volume
+        previous_volume = engine.last_value(symbol, 'volume')
+        if volume is not None and previous_volume is not None and volume >= previous_volume:
+            values[(symbol, 'volume_delta')] = volume - previous_volume
+        values[(symbol, 'volume')] = volume
+
+    if analytics:
+        for symbol, stats in analytics.items():
+            if symbol == 'MARKET':
+                values[('MARKET', 'gold_silver_ratio')] = stats['gold_silver_ratio']
+                values[('MARKET', 'gold_silver_ratio_zscore')] = stats['ratio_zscore']
+            else:
+                values[(symbol, 'premium_zscore')] = stats['premium_zscore']
+    return values
+
+
+def rules_from_config(alert_config=None, etfs=None):
+    """
+    Build rules from ALERT_CONFIG.
+
+    The legacy keys map to: '<commodity>_price_threshold' -> LTP crossing
+    (both directions) for every ETF of that commodity, and
+    'premium_threshold' -> a +/- premium/discount band for every ETF.
+    ALERT_CONFIG['rules'] adds arbitrary rules, see config.py.
+    """
+    alert_config = dict(config.ALERT_CONFIG, **(alert_config or {}))
+    etfs = config.ETFS if etfs is None else etfs
+    hysteresis = alert_config.get('hysteresis', {})
+    rules = []
+
+    for symbol, etf in etfs.items():
+        threshold = alert_config.get(f"{etf.get('commodity')}_price_threshold")
+        if threshold is not None:
+            h = hysteresis.get('ltp', 0.0)
+            rules.append(AlertRule(symbol, 'ltp', ABOVE, threshold, h))
+            rules.append(AlertRule(symbol, 'ltp', BELOW, threshold, h))
+
+        premium = alert_config.get('premium_threshold')
+        if premium is not None:
+            h = hysteresis.get('premium_discount', 0.0)
+            rules.append(AlertRule(symbol, 'premium_discount', ABOVE, premium, h))
+            rules.append(AlertRule(symbol, 'premium_discount', BELOW, -premium, h))
+
+    for spec in alert_config.get('rules', []):
+        kind = spec['type']
+        h = spec.get('hysteresis', hysteresis.get(spec['metric'], 0.0))
+        if kind == 'band':
+            rules.append(AlertRule(spec['symbol'], spec['metric'], ABOVE, spec['high'], h,
+                                   spec.get('label')))
+            rules.append(AlertRule(spec['symbol'], spec['metric'], BELOW, spec['low'], h,
+                                   spec.get('label')))
+        elif kind == 'cross':
+            rules.append(AlertRule(spec['symbol'], spec['metric'], ABOVE, spec['threshold'], h,
+                                   spec.get('label')))
+            rules.append(AlertRule(spec['symbol'], spec['metric'], BELOW, spec['threshold'], h,
+                                   spec.get('label')))
+        else:
+            rules.append(AlertRule(spec['symbol'], spec['metric'], kind, spec['threshold'], h,
+                                   spec.get('label')))
+
+    # One rule per id: a second copy would be indexed twice and fire twice
+    unique = {}
+    for rule in rules:
+        if rule.rule_id in unique:
+            print(f"⚠️  Ignoring duplicate alert rule {rule.rule_id}")
+            continue
+        unique[rule.rule_id] = rule
+    return list(unique.values())
+
+
+def load_engine(path, alert_config=None):
+    """Alert engine for the configured rules, with state from the last run if any"""
+    engine = AlertEngine(rules_from_config(alert_config))
+    try:
+        with open(path) as f:
+            engine.load_state(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable alert state {path}: {e}")
+    return engine
+
+
+def save_engine(engine, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(engine.to_state(), f)
+    os.replace(tmp_path, path)
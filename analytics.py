@@ -0,0 +1,349 @@
+"""
+Rolling analytics for ETF Tracker
+Premium/discount statistics, EWMA, gold/silver ratio and return correlations, O(1) per update
+"""
+
+import json
+import math
+import os
+
+import config
+from market_calendar import IST
+
+NS = 1_000_000_000
+DAY_NS = 86400 * NS
+IST_OFFSET_NS = int(IST.utcoffset(None).total_seconds()) * NS
+
+
+class Welford:
+    """Running mean and sample variance of every value since the last reset"""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+
+class RollingStats:
+    """
+    Mean and sample variance of the last `window` values.
+
+    Values sit in a fixed ring buffer. Once it is full, a new value replaces
+    the oldest in a single Welford-style update of the mean and sum of
+    squares, so a push costs the same whatever the window size.
+    """
+
+    __slots__ = ('values', 'index', 'count', 'mean', 'm2')
+
+    def __init__(self, window):
+        self.values = [0.0] * window
+        self.index = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, value):
+        window = len(self.values)
+        if self.count == window:
+            oldest = self.values[self.index]
+            previous_mean = self.mean
+            self.mean += (value - oldest) / window
+            self.m2 += (value - oldest) * (value - self.mean + oldest - previous_mean)
+            # Rounding can leave a tiny negative sum for a constant series
+            if self.m2 < 0.0:
+                self.m2 = 0.0
+        else:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        self.values[self.index] = value
+        self.index = (self.index + 1) % window
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+
+    def zscore(self, value):
+        """Standard deviations `value` lies from the window mean, None without spread"""
+        std = self.std
+        return (value - self.mean) / std if std else None
+
+
+class EWMA:
+    """Exponentially weighted mean and variance; `alpha` is the newest value's weight"""
+
+    __slots__ = ('alpha', 'count', 'mean', 'var')
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+
+    def push(self, value):
+        if self.count == 0:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            increment = self.alpha * delta
+            self.mean += increment
+            self.var = (1 - self.alpha) * (self.var + delta * increment)
+        self.count += 1
+
+
+class RollingCorrelation:
+    """Pearson correlation of the last `window` (x, y) pairs, ring buffer with O(1) updates"""
+
+    __slots__ = ('pairs', 'index', 'count', 'mean_x', 'mean_y', 'm2_x', 'm2_y', 'c')
+
+    def __init__(self, window):
+        self.pairs = [(0.0, 0.0)] * window
+        self.index = 0
+        self.count = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m2_x = self.m2_y = self.c = 0.0
+
+    def _remove(self, x, y):
+        count = self.count - 1
+        if count == 0:
+            self.count = 0
+            self.mean_x = self.mean_y = 0.0
+            self.m2_x = self.m2_y = self.c = 0.0
+            return
+        # Undo the add of (x, y): recover the means from before it
+        mean_x = (self.count * self.mean_x - x) / count
+        mean_y = (self.count * self.mean_y - y) / count
+        self.m2_x -= (x - mean_x) * (x - self.mean_x)
+        self.m2_y -= (y - mean_y) * (y - self.mean_y)
+        self.c -= (x - mean_x) * (y - self.mean_y)
+        self.mean_x, self.mean_y, self.count = mean_x, mean_y, count
+
+    def push(self, x, y):
+        window = len(self.pairs)
+        if self.count == window:
+            self._remove(*self.pairs[self.index])
+        self.count += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.count
+        self.mean_y += dy / self.count
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c += dx * (y - self.mean_y)
+        self.pairs[self.index] = (x, y)
+        self.index = (self.index + 1) % window
+
+    @property
+    def value(self):
+        if self.count < 2 or self.m2_x <= 0.0 or self.m2_y <= 0.0:
+            return None
+        return max(-1.0, min(1.0, self.c / math.sqrt(self.m2_x * self.m2_y)))
+
+
+class SymbolAnalytics:
+    """Per-ETF premium/discount statistics and LTP-vs-spot return correlation"""
+
+    __slots__ = ('day', 'session', 'rolling', 'ewma', 'last_ltp', 'spot_correlation')
+
+    def __init__(self, window, alpha):
+        self.day = None
+        self.session = Welford()
+        self.rolling = RollingStats(window)
+        self.ewma = EWMA(alpha)
+        self.last_ltp = None
+        self.spot_correlation = RollingCorrelation(window)
+
+
+def simple_return(previous, current):
+    if previous is None or current is None or not previous:
+        return None
+    return current / previous - 1
+
+
+class Analytics:
+    """
+    Rolling statistics updated once per tick.
+
+    Per ETF: session (intraday) mean and stddev of the premium/discount, a
+    rolling window mean/stddev, the z-score of the new value against that
+    window, an EWMA, and the correlation of LTP returns with the spot
+    returns of its commodity. For the market: the gold/silver ratio with
+    the same rolling statistics, and the gold/silver return correlation.
+
+    Every statistic is an incremental update over a fixed ring buffer, so a
+    tick costs the same at any window size and grows only linearly with
+    the number of ETFs; nothing is recomputed from stored history.
+    """
+
+    def __init__(self, etfs=None, analytics_config=None):
+        self.etfs = config.ETFS if etfs is None else etfs
+        self.analytics_config = dict(config.ANALYTICS_CONFIG, **(analytics_config or {}))
+        self.window = self.analytics_config['window']
+        self.alpha = 1 - 0.5 ** (1 / self.analytics_config['ewma_halflife'])
+        self.min_samples = self.analytics_config['min_samples']
+        self.symbols = {}
+        self.ratio = RollingStats(self.window)
+        self.ratio_ewma = EWMA(self.alpha)
+        self.metals = RollingCorrelation(self.window)
+        self.last_spot = {'gold': None, 'silver': None}
+
+    def symbol(self, symbol):
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = SymbolAnalytics(self.window, self.alpha)
+            self.symbols[symbol] = state
+        return state
+
+    def zscore(self, stats, value):
+        return stats.zscore(value) if stats.count >= self.min_samples else None
+
+    def update(self, ts_ns, quotes, mcx_data, metrics):
+        """
+        Feed one tick.
+
+        Args:
+            ts_ns: Tick time, epoch ns
+            quotes: Dict of symbol -> records.Quote
+            mcx_data: records.SpotPrices
+            metrics: Output of inav.calculate_metrics()
+
+        Returns:
+            Dict of symbol -> statistics, plus 'MARKET' for the gold/silver
+            ratio. Z-scores compare the new value with the window before it
+            and are None until `min_samples` values are in.
+        """
+        day = (ts_ns + IST_OFFSET_NS) // DAY_NS
+        spot_returns = {
+            'gold': simple_return(self.last_spot['gold'], mcx_data.gold_usd_oz),
+            'silver': simple_return(self.last_spot['silver'], mcx_data.silver_usd_oz),
+        }
+        result = {}
+        for symbol, etf in self.etfs.items():
+            quote = quotes.get(symbol)
+            if not quote:
+                continue
+            state = self.symbol(symbol)
+            premium = (metrics.get(symbol) or {}).get('premium_discount')
+            stats = {'premium_discount': premium, 'premium_zscore': None}
+            if premium is not None:
+                if state.day != day:
+                    state.day = day
+                    state.session.reset()
+                stats['premium_zscore'] = self.zscore(state.rolling, premium)
+                state.session.push(premium)
+                state.rolling.push(premium)
+                state.ewma.push(premium)
+            stats.update(premium_mean=state.rolling.mean if state.rolling.count else None,
+                         premium_std=state.rolling.std,
+                         premium_ewma=state.ewma.mean if state.ewma.count else None,
+                         session_mean=state.session.mean if state.session.count else None,
+                         session_std=state.session.std)
+
+            ltp_return = simple_return(state.last_ltp, quote.ltp)
+            spot_return = spot_returns.get(etf.get('commodity'))
+            if ltp_return is not None and spot_return is not None:
+                state.spot_correlation.push(ltp_return, spot_return)
+            if quote.ltp is not None:
+                state.last_ltp = quote.ltp
+            stats['spot_correlation'] = state.spot_correlation.value
+            result[symbol] = stats
+
+        ratio = None
+        ratio_zscore = None
+        if mcx_data.gold_usd_oz and mcx_data.silver_usd_oz:
+            ratio = mcx_data.gold_usd_oz / mcx_data.silver_usd_oz
+            ratio_zscore = self.zscore(self.ratio, ratio)
+            self.ratio.push(ratio)
+            self.ratio_ewma.push(ratio)
+        if spot_returns['gold'] is not None and spot_returns['silver'] is not None:
+            self.metals.push(spot_returns['gold'], spot_returns['silver'])
+        for metal in self.last_spot:
+            price = mcx_data.price(metal)
+            if price:
+                self.last_spot[metal] = price
+        result['MARKET'] = {
+            'gold_silver_ratio': ratio,
+            'ratio_zscore': ratio_zscore,
+            'ratio_mean': self.ratio.mean if self.ratio.count else None,
+            'ratio_ewma': self.ratio_ewma.mean if self.ratio_ewma.count else None,
+            'gold_silver_correlation': self.metals.value,
+        }
+        return result
+
+    def to_state(self):
+        """Everything needed to carry on after a restart, as JSON-friendly lists"""
+        def dump(obj):
+            return [dump(value) if hasattr(value, '__slots__') else value
+                    for value in (getattr(obj, name) for name in obj.__slots__)]
+        return {
+            'window': self.window,
+            'symbols': {symbol: dump(state) for symbol, state in self.symbols.items()},
+            'market': [dump(self.ratio), dump(self.ratio_ewma), dump(self.metals)],
+            'last_spot': self.last_spot,
+        }
+
+    def load_state(self, state):
+        # A different window size cannot reuse the old ring buffers
+        if state.get('window') != self.window:
+            return
+
+        def load(obj, values):
+            for name, value in zip(obj.__slots__, values):
+                current = getattr(obj, name)
+                if hasattr(current, '__slots__'):
+                    load(current, value)
+                elif name == 'alpha':
+                    # Set from ewma_halflife, which may have changed since
+                    continue
+                elif name == 'pairs':
+                    setattr(obj, name, [tuple(pair) for pair in value])
+                else:
+                    setattr(obj, name, value)
+
+        for symbol, values in state.get('symbols', {}).items():
+            load(self.symbol(symbol), values)
+        for obj, values in zip((self.ratio, self.ratio_ewma, self.metals),
+                               state.get('market', [])):
+            load(obj, values)
+        self.last_spot.update(state.get('last_spot', {}))
+
+
+def load_analytics(path, analytics_config=None):
+    """Analytics with the rolling state of the last run, if any"""
+    analytics = Analytics(analytics_config=analytics_config)
+    if not path:
+        return analytics
+    try:
+        with open(path) as f:
+            analytics.load_state(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError) as e:
+        print(f"⚠️  Ignoring unreadable analytics state {path}: {e}")
+    return analytics
+
+
+def save_analytics(analytics, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(analytics.to_state(), f)
+    os.replace(tmp_path, path)
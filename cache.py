@@ -0,0 +1,176 @@
+"""
+TTL cache for ETF Tracker
+Sits in front of slow-moving upstreams (spot prices, forex) with stale-while-revalidate
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import config
+import metrics
+
+
+class MemoryBackend:
+    """In-process backend, values are lost when the process exits"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+
+
+class SQLiteBackend:
+    """
+    On-disk backend so cached values survive one-shot runs.
+
+    In GitHub Actions the file is carried between runs with actions/cache.
+    Values are stored as JSON.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)')
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, stored_at FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), stored_at))
+            self._conn.commit()
+
+
+class TTLCache:
+    """
+    Per-source TTL cache with stale-while-revalidate.
+
+    A value younger than the source's `ttl` is served as is. Between `ttl`
+    and `ttl + stale_ttl` the stale value is served immediately and refreshed
+    in the background. Older or missing values are fetched inline. If a fetch
+    fails, any stale value is served rather than nothing.
+    """
+
+    def __init__(self, backend, ttls, stale_ttls):
+        """
+        Args:
+            backend: MemoryBackend, SQLiteBackend or anything with get/set
+            ttls: Dict of source -> seconds a value stays fresh
+            stale_ttls: Dict of source -> extra seconds a stale value may be served
+        """
+        self.backend = backend
+        self.ttls = ttls
+        self.stale_ttls = stale_ttls
+        self._refreshing = {}
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, source, key, fetch):
+        """
+        Return the cached value for `key` or call `fetch()` to get it.
+
+        Args:
+            source: Source name used to look up TTLs, e.g. 'spot' or 'forex'
+            key: Cache key, unique per value
+            fetch: Zero-argument callable returning the value, or None on failure
+        """
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            ttl = self.ttls.get(source, 0)
+            if age < ttl:
+                metrics.inc('etf_cache_requests', source=source, result='hit')
+                return value
+            if age < ttl + self.stale_ttls.get(source, 0):
+                metrics.inc('etf_cache_requests', source=source, result='stale')
+                self._refresh_in_background(key, fetch)
+                return value
+
+        metrics.inc('etf_cache_requests', source=source, result='miss')
+        fresh = self._fetch_and_store(key, fetch)
+        if fresh is None and entry is not None:
+            print(f"⚠️  Serving stale {key} after a failed refresh")
+            return entry[0]
+        return fresh
+
+    def _fetch_and_store(self, key, fetch):
+        value = fetch()
+        if value is not None:
+            self.backend.set(key, value, time.time())
+        return value
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            thread = threading.Thread(target=self._refresh, args=(key, fetch),
+                                      name=f"refresh-{key}", daemon=True)
+            self._refreshing[key] = thread
+        thread.start()
+
+    def _refresh(self, key, fetch):
+        try:
+            self._fetch_and_store(key, fetch)
+        except Exception as e:
+            print(f"❌ Background refresh of {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+
+    def drain(self, timeout=None):
+        """Wait for background refreshes, so one-shot runs persist them before exiting"""
+        with self._lock:
+            threads = list(self._refreshing.values())
+        end = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if end is None else max(end - time.monotonic(), 0))
+
+
+class NullCache:
+    """Cache that always fetches, used when caching is disabled"""
+
+    def get_or_fetch(self, source, key, fetch):
+        return fetch()
+
+    def drain(self, timeout=None):
+        pass
+
+
+def create_cache(cache_config=None):
+    """Build the cache described by config.CACHE_CONFIG"""
+    cache_config = dict(config.CACHE_CONFIG, **(cache_config or {}))
+    if not cache_config['enabled']:
+        return NullCache()
+
+    backend = MemoryBackend()
+    if cache_config['backend'] == 'sqlite':
+        try:
+            backend = SQLiteBackend(cache_config['path'])
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️  Cache file unavailable, using memory cache: {e}")
+
+    return TTLCache(backend, cache_config['ttl'], cache_config['stale_ttl'])
@@ -1,6 +1,9 @@
 # Configuration for ETF Tracker
 
 # ETF Configuration
+# Optional per-ETF keys:
+#   'expense_ratio': annual expense ratio in percent, accrued daily into iNAV
+#   'nse_listing': NSE bulk listing to read the quote from (see QUOTE_CONFIG)
 ETFS = {
     'TATAGOLD': {
         'name': 'Tata Gold ETF',
@@ -18,24 +21,200 @@ ETFS = {
     }
 }
 
+# Quote Engine Configuration
+# Symbols are fetched from NSE bulk listings: 'etf' is the all-ETF listing,
+# any other value is an index name for the equity-stockIndices listing.
+QUOTE_CONFIG = {
+    'default_listing': 'etf',
+    'max_concurrency': 4,       # Listing/fallback requests in flight at once
+    'fallback_to_quote': True   # Per-symbol quote for symbols missing from a listing
+}
+
 # Market Configuration
 MARKET_CONFIG = {
-    'timezone': 'Asia/Kolkata',
+    'timezone': 'Asia/Kolkata',            # No DST, handled as fixed UTC+05:30 (market_calendar.IST)
     'market_open_time': '09:15',
     'market_close_time': '15:30',
-    'weekdays_only': True
+    'weekdays_only': True,
+    'holidays_file': 'nse_holidays.json',  # NSE holidays and special sessions
+    'skip_closed_sessions': True           # One-shot runs exit early when closed
+}
+
+# Daemon Configuration (python etf_tracker.py --daemon)
+DAEMON_CONFIG = {
+    'open_interval': 30,         # Seconds between ticks while the market is open
+    'publish_interval': 30 * 60, # Seconds between Telegram messages while open
+    'closed_interval': 0,        # Seconds between ticks while closed, 0 = sleep until open
+    'catch_up_grace': 5          # Seconds late before a tick counts as missed
+}
+
+# Adaptive Polling Configuration (--daemon --adaptive, see adaptive.py)
+# Between Telegram publishes the daemon ticks more often while prices or
+# premium/discounts move and less when they are flat, backs off on upstream
+# errors, and never spends more than each source's hourly budget
+ADAPTIVE_CONFIG = {
+    'enabled': False,          # Same as passing --adaptive
+    'min_interval': 5,         # Seconds between ticks at the busiest
+    'max_interval': 900,       # Seconds between ticks when flat
+    'base_interval': 60,       # Seconds between ticks at the reference activity below
+    'move_pct': 0.05,          # Reference LTP move, % per minute
+    'premium_move': 0.05,      # Reference premium/discount change, points per minute
+    'activity_halflife': 300,  # Seconds for the activity score to halve
+    'error_halflife': 5,       # Ticks for error rates and per-tick request counts to halve
+    'error_backoff': 4,        # At a 100% error rate ticks are 1 + this times further apart
+    'budgets': {               # Requests per hour per upstream
+        'nse': 720,
+        'spot': 240,
+        'forex': 60
+    },
+    'burst': 10                # Requests a source may spend ahead of its budget
+}
+
+# Streaming Configuration (--stream)
+# Quotes are polled every 'poll_interval' seconds and aggregated into OHLC
+# bars of each 'bar_intervals' length, stored as bars_1m, bars_5m, ...
+STREAM_CONFIG = {
+    'poll_interval': 5,
+    'bar_intervals': [60, 300, 900],
+    'premium_window': 300,       # Seconds of premium/discount in the rolling average
+    'max_window_ticks': 1000     # Cap on ticks held for the rolling average
+}
+
+# Single-flight Configuration (see single_flight.py)
+# The schedule, cron-job.org and manual triggers can overlap. A one-shot run
+# takes a lease on its window in this SQLite file (the workflow persists it
+# with the cache); a run finding the window taken waits for that run and
+# then exits instead of fetching and publishing again. --force ignores it.
+SINGLE_FLIGHT_CONFIG = {
+    'enabled': True,
+    'path': '.cache/etf_tracker.sqlite',
+    'window': 30 * 60,     # Seconds per window, counted from market_open_time
+    'lease_ttl': 120,      # Seconds before a crashed run's lease can be taken over
+    'wait': 60             # Seconds a duplicate run waits for the running one
+}
+
+# Rolling Analytics Configuration (see analytics.py)
+# Per-tick premium/discount statistics, EWMA, gold/silver ratio and return
+# correlations, each updated in O(1) from a fixed ring buffer
+ANALYTICS_CONFIG = {
+    'enabled': True,
+    'window': 120,            # Ticks in the rolling window
+    'ewma_halflife': 20,      # Ticks for an EWMA weight to halve
+    'min_samples': 20,        # Ticks before z-scores are reported
+    'zscore_threshold': 2.0,  # |z| from which a premium/discount is shown as unusual
+    'state_path': '.cache/analytics_state.json',
+    'save_interval': 300      # Seconds between state saves on daemon ticks that do not
+                              # publish; publishing runs and shutdown always save
+}
+
+# Sharded Polling Configuration (see shards.py)
+# With 'workers' above 1, config.ETFS is consistently hashed over that many
+# worker processes. The listings are still fetched once by the tracker;
+# the workers decode them and compute iNAV for their share of the rows.
+# 0 or 1 = everything in one process
+SHARD_CONFIG = {
+    'workers': 0,
+    'virtual_nodes': 64,   # Ring points per worker; more gives more even shards
+    'reply_grace': 1.0     # Seconds past the tick deadline to wait for workers
+}
+
+# Metrics Configuration (see metrics.py)
+# One-shot runs write a JSON summary; --daemon and --stream serve
+# OpenMetrics at http://host:port/metrics (port 0 = no endpoint)
+METRICS_CONFIG = {
+    'enabled': True,
+    'host': '127.0.0.1',
+    'port': 9108,
+    'summary_path': '.cache/metrics.json'
+}
+
+# Query API Configuration (see query_server.py)
+# --daemon and --stream serve the latest tick and stored history as JSON at
+# http://host:port/v1/... for other local tools (port 0 = no server)
+QUERY_CONFIG = {
+    'host': '127.0.0.1',
+    'port': 9109,
+    'max_range_days': 31,   # Longest history range one request may ask for
+    'history_cache': 256    # History responses kept serialized
+}
+
+# Profiling Configuration (see profiling.py)
+# `etf_tracker.py --profile [DIR]` runs once under cProfile and tracemalloc
+# with per-request connection timings, and saves the upstream responses as
+# fixtures that `benchmark.py --fixtures` replays offline
+PROFILE_CONFIG = {
+    'path': '.cache/profile',   # run.prof, profile.json and fixtures.json
+    'top_functions': 25,        # Functions listed by cumulative time
+    'top_allocations': 15,      # Source lines listed by allocated bytes
+    'record_fixtures': True
 }
 
 # API Configuration
 API_CONFIG = {
     'nse_base_url': 'https://www.nseindia.com',
     'forex_api_url': 'https://api.exchangerate-api.com/v4/latest/USD',
-    'gold_spot_url': 'https://api.metals.live/v1/spot/gold',
-    'silver_spot_url': 'https://api.metals.live/v1/spot/silver',
-    'timeout': 10
+    # Spot price sources in order of preference (see sources.py). '{metal}'
+    # and '{symbol}' in the URL are filled in per metal, 'price_path' is the
+    # dotted path to the USD/oz price in the JSON. Sources with 'api_key_env'
+    # are skipped when that environment variable is not set.
+    'spot_sources': [
+        {
+            'name': 'goldapi.io',
+            'url': 'https://www.goldapi.io/api/{symbol}/USD',
+            'symbols': {'gold': 'XAU', 'silver': 'XAG'},
+            'price_path': 'price',
+            'api_key_env': 'GOLD_API_KEY',
+            'api_key_header': 'x-access-token'
+        },
+        {
+            'name': 'metals.live',
+            'url': 'https://api.metals.live/v1/spot/{metal}',
+            'price_path': 'price'
+        }
+    ],
+    'telegram_api_url': 'https://api.telegram.org',
+    'timeout': 10,
+    'nse_cookie_max_age': 600,  # Seconds before NSE cookies are re-primed
+    'run_deadline': 15  # Seconds to wait for the concurrent fetch stage
 }
 
-# Message Configuration
+# Spot Source Configuration
+SOURCE_CONFIG = {
+    'hedge_delay': 0.5,         # Seconds before also asking the next source
+    'deadline': 8,              # Seconds to wait for any source to answer
+    'retries': 1,               # Retries per source, with jittered backoff
+    'retry_base_delay': 0.2,
+    'failure_threshold': 3,     # Consecutive failures before a source is skipped
+    'reset_timeout': 60         # Seconds before a skipped source is tried again
+}
+
+# Cache Configuration
+# Spot prices and forex are served from cache while fresh ('ttl' seconds),
+# then served stale for up to 'stale_ttl' more seconds while refreshing in
+# the background. The SQLite file is persisted between GitHub Actions runs.
+CACHE_CONFIG = {
+    'enabled': True,
+    'backend': 'sqlite',  # 'sqlite' or 'memory'
+    'path': '.cache/etf_tracker.sqlite',
+    'ttl': {
+        'spot': 60,
+        'forex': 6 * 60 * 60
+    },
+    'stale_ttl': {
+        'spot': 5 * 60,
+        'forex': 24 * 60 * 60
+    }
+}
+
+# Storage Configuration
+# Every run appends LTP, iNAV and premium/discount per ETF to
+# <path>/quotes/<SYMBOL>/<YYYY-MM-DD>.bin (see storage.py)
+STORAGE_CONFIG = {
+    'enabled': True,
+    'path': 'data/timeseries'
+}
+
+# Message Configuration (templates in messages.py)
 MESSAGE_CONFIG = {
     'show_volume': True,
     'show_inav': True,
@@ -43,13 +222,62 @@ MESSAGE_CONFIG = {
     'show_international_prices': True,
     'show_forex': True,
     'show_performance_comparison': True,
+    'show_analytics': True,       # Gold/silver ratio and unusual premium/discount z-scores
     'decimal_places': 2
 }
 
-# Alert Configuration (optional - for future enhancement)
+# Telegram Publishing Configuration
+TELEGRAM_CONFIG = {
+    'suppress_unchanged': True,   # Skip the send when nothing moved since the last one
+    'price_epsilon_pct': 0.01,    # Price moves up to this % count as unchanged
+    'point_epsilon': 0.01,        # Premium/discount and % change moves up to this many points count as unchanged
+    'edit_previous': False,       # Edit the last message (editMessageText) instead of posting a new one
+    'state_path': '.cache/telegram_state.json',
+    # Extra chats, each with its own watchlist, e.g.
+    #   {'chat_id': '-1001234567890', 'symbols': ['TATAGOLD']}
+    # Leave out 'symbols' to send every ETF. More can be listed in
+    # subscribers_file as a JSON list of the same entries.
+    'subscribers': [],
+    'subscribers_file': 'subscribers.json'
+}
+
+# Telegram fan-out limits for subscribers (see dispatcher.py)
+# Telegram allows about 30 messages/second overall and 1/second per chat
+# (20/minute in groups)
+DISPATCH_CONFIG = {
+    'global_rate': 30,            # Messages per second across all chats
+    'global_burst': 5,
+    'per_chat_rate': 1,           # Messages per second to one chat
+    'per_chat_burst': 1,
+    'max_workers': 8,             # Concurrent HTTP requests, within the session pool
+    'max_retries': 3,             # Retries after 429s, 5xx and network errors
+    'retry_backoff': 0.5          # Seconds before the first 5xx/network retry, doubling
+}
+
+# Alert Configuration
+# Alerts are sent as a separate Telegram message when a rule fires. A rule
+# does not fire again until the value moves back past its hysteresis.
+#
+# Extra rules go in 'rules', for example:
+#   {'symbol': 'TATAGOLD', 'metric': 'ltp', 'type': 'cross', 'threshold': 100}
+#   {'symbol': 'TATSILV', 'metric': 'premium_discount', 'type': 'band', 'low': -0.5, 'high': 0.5}
+#   {'symbol': 'TATAGOLD', 'metric': 'pChange', 'type': 'above', 'threshold': 2}
+#   {'symbol': 'TATSILV', 'metric': 'volume_delta', 'type': 'above', 'threshold': 500000}
+#   {'symbol': 'MARKET', 'metric': 'gold_usd_oz', 'type': 'below', 'threshold': 2000}
+#   {'symbol': 'TATSILV', 'metric': 'premium_zscore', 'type': 'band', 'low': -3, 'high': 3}
+# Metrics: ltp, pChange, premium_discount, premium_zscore, volume_delta per ETF
+# symbol, and gold_usd_oz, silver_usd_oz, usd_inr, gold_silver_ratio,
+# gold_silver_ratio_zscore for 'MARKET'. Types: above, below, cross, band.
 ALERT_CONFIG = {
     'enable_price_alerts': False,
     'gold_price_threshold': 5000,  # Alert if gold crosses this price
     'silver_price_threshold': 70,   # Alert if silver crosses this price
     'premium_threshold': 1.0,       # Alert if premium/discount exceeds 1%
+    'hysteresis': {                 # Default re-arm distance per metric
+        'ltp': 1.0,
+        'premium_discount': 0.25,
+        'pChange': 0.25
+    },
+    'rules': [],
+    'state_path': '.cache/alert_state.json'
 }
@@ -0,0 +1,204 @@
+"""
+Telegram fan-out for ETF Tracker
+Delivers messages to many chats concurrently within Telegram's rate limits
+"""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+from records import response_json
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out send slots in arrival order.
+
+    A caller reserves a token immediately and is told how long to wait for
+    it, so queued senders are spaced `1 / rate` seconds apart without polling.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take one token. Returns the seconds to wait before using it"""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Hand out no tokens for `seconds`, e.g. after a 429 retry_after"""
+        self._refill()
+        # The next reserve() then waits exactly `seconds`
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate + 1
+
+
+def load_subscribers(path, subscribers=None, etfs=None):
+    """
+    Subscribers from TELEGRAM_CONFIG and the subscribers file.
+
+    The file is a JSON list of {"chat_id": ..., "symbols": [...]}; leaving
+    out "symbols" subscribes the chat to every ETF. Watchlists are returned
+    as tuples in config.ETFS order, or None for everything, so chats with
+    the same watchlist share one rendered message.
+
+    Returns:
+        List of {'chat_id': str, 'symbols': tuple or None}
+    """
+    etfs = config.ETFS if etfs is None else etfs
+    entries = list(subscribers or [])
+    if path:
+        try:
+            with open(path) as f:
+                entries.extend(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable subscribers file {path}: {e}")
+
+    result = []
+    for entry in entries:
+        symbols = entry.get('symbols')
+        if symbols is not None:
+            unknown = set(symbols) - set(etfs)
+            if unknown:
+                print(f"⚠️  Chat {entry['chat_id']} watches unknown ETFs: {', '.join(sorted(unknown))}")
+            symbols = tuple(symbol for symbol in etfs if symbol in symbols)
+        result.append({'chat_id': str(entry['chat_id']), 'symbols': symbols})
+    return result
+
+
+class Dispatcher:
+    """
+    Send Telegram messages to many chats at once.
+
+    Each chat gets its own queue, drained by its own coroutine, so a slow or
+    rate-limited chat only delays its own messages. Every send takes a token
+    from the chat's bucket and then from the global bucket, which keeps the
+    bot under Telegram's per-chat and overall limits. A 429 pauses that chat
+    for the `retry_after` Telegram asks for. The HTTP calls run on a small
+    thread pool over the tracker's pooled session, so connections are reused.
+    """
+
+    def __init__(self, http, api_url, token, dispatch_config=None, timeout=10):
+        """
+        Args:
+            http: requests.Session with a connection pool of at least `max_workers`
+            api_url: Telegram Bot API base URL
+            token: Bot token
+            dispatch_config: Overrides for config.DISPATCH_CONFIG
+            timeout: Seconds per HTTP request
+        """
+        self.http = http
+        self.url = f"{api_url}/bot{token}/sendMessage"
+        self.dispatch_config = dict(config.DISPATCH_CONFIG, **(dispatch_config or {}))
+        self.timeout = timeout
+        self.global_bucket = TokenBucket(self.dispatch_config['global_rate'],
+                                         self.dispatch_config['global_burst'])
+        # Kept between sends so daemon ticks respect per-chat limits too
+        self.chat_buckets = {}
+
+    def chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.dispatch_config['per_chat_rate'],
+                                 self.dispatch_config['per_chat_burst'])
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def post(self, chat_id, text):
+        """Blocking sendMessage. Returns (status code, parsed body)"""
+        response = self.http.post(self.url, json={
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': 'Markdown'
+        }, timeout=self.timeout)
+        try:
+            body = response_json(response)
+        except ValueError:
+            body = {'description': response.text}
+        return response.status_code, body
+
+    async def deliver_chat(self, loop, executor, chat_id, texts):
+        """Send one chat's queue in order. Returns the last message id or None"""
+        max_retries = self.dispatch_config['max_retries']
+        bucket = self.chat_bucket(chat_id)
+        message_id = None
+        for text in texts:
+            for attempt in range(max_retries + 1):
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                try:
+                    status, body = await loop.run_in_executor(executor, self.post, chat_id, text)
+                except Exception as e:
+                    status, body = None, {'description': str(e)}
+
+                if status == 200:
+                    message_id = body.get('result', {}).get('message_id')
+                    break
+                if status == 429:
+                    retry_after = body.get('parameters', {}).get('retry_after', 1)
+                    print(f"⏳ Chat {chat_id} rate limited, retrying in {retry_after}s")
+                    bucket.pause(retry_after)
+                    metrics.inc('etf_retries', component='telegram')
+                    continue
+                if status is not None and status < 500:
+                    # Bad request, bot blocked or chat gone: retrying will not help
+                    print(f"❌ Failed to send to chat {chat_id}: {body.get('description')}")
+                    break
+                if attempt < max_retries:
+                    metrics.inc('etf_retries', component='telegram')
+                    await asyncio.sleep(self.dispatch_config['retry_backoff'] * 2 ** attempt)
+            else:
+                print(f"❌ Giving up on chat {chat_id} after {max_retries + 1} attempts")
+        return message_id
+
+    async def deliver(self, messages):
+        queues = {}
+        for chat_id, text in messages:
+            queues.setdefault(chat_id, []).append(text)
+
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.dispatch_config['max_workers'],
+                                thread_name_prefix='telegram') as executor:
+            results = await asyncio.gather(*(
+                self.deliver_chat(loop, executor, chat_id, texts)
+                for chat_id, texts in queues.items()))
+        return dict(zip(queues, results))
+
+    def send_all(self, messages):
+        """
+        Deliver messages and wait for them all.
+
+        Args:
+            messages: List of (chat_id, text); a chat's messages keep their order
+
+        Returns:
+            Dict of chat_id -> message_id of its last message, None if it failed
+        """
+        if not messages:
+            return {}
+        started = time.monotonic()
+        results = asyncio.run(self.deliver(messages))
+        delivered = sum(1 for message_id in results.values() if message_id is not None)
+        print(f"📨 Delivered to {delivered}/{len(results)} chats "
+              f"in {time.monotonic() - started:.2f}s")
+        return results
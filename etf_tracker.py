@@ -1,59 +1,133 @@
-import requests
+import argparse
+import contextlib
 import json
+import sys
+import time
 from datetime import datetime
-import pytz
 import os
 
+import config
+import metrics as telemetry
+from alerts import alert_values, load_engine, save_engine
+from cache import create_cache
+from inav import calculate_metrics, daily_expense_accrual, inav_scalar
+from market_calendar import IST, MarketCalendar
+from messages import MessageRenderer, format_number
+from publish_state import PublishState, build_snapshot, changed_keys
+from pipeline import fan_out
+from quotes import QuoteEngine, fetch_quote
+from records import FxRate, SpotPrices, response_json
+from sources import SourceChain
+from storage import TimeSeriesStore
+
+# requests (sessions) and asyncio (dispatcher) are imported in
+# ETFTracker.__init__, so --check-open and closed-market runs never load them
+
+# Publish state chat id used when sending to subscribers rather than one chat
+SUBSCRIBERS_KEY = 'subscribers'
+
+# --check-open exit status when the market is closed. Not 1 or 2, which
+# Python uses for crashes and argparse for bad arguments
+EXIT_CLOSED = 3
+
 class ETFTracker:
-    def __init__(self):
+    def __init__(self, api_config=None, cache=None, telegram_config=None, dispatch_config=None,
+                 shard_config=None):
         self.telegram_token = os.environ.get('TELEGRAM_BOT_TOKEN')
         self.telegram_chat_id = os.environ.get('TELEGRAM_CHAT_ID')
-        self.ist = pytz.timezone('Asia/Kolkata')
+        self.telegram_config = dict(config.TELEGRAM_CONFIG, **(telegram_config or {}))
+        # Last published values, so unchanged updates are not resent
+        self.publish_state = PublishState(self.telegram_config['state_path'])
+        self.last_message_id = None
+        # Chats with their own watchlists, served through the dispatcher.
+        # Without any, the dispatcher and asyncio are never imported
+        subscribers_file = self.telegram_config['subscribers_file']
+        self.subscribers = []
+        if self.telegram_config['subscribers'] or (subscribers_file
+                                                   and os.path.exists(subscribers_file)):
+            from dispatcher import load_subscribers
+            self.subscribers = load_subscribers(subscribers_file,
+                                                self.telegram_config['subscribers'])
+        if self.subscribers and self.telegram_chat_id and self.telegram_chat_id not in {
+                subscriber['chat_id'] for subscriber in self.subscribers}:
+            self.subscribers.insert(0, {'chat_id': self.telegram_chat_id, 'symbols': None})
+        self.alert_config = dict(config.ALERT_CONFIG)
+        self.alerts = None
+        if self.alert_config['enable_price_alerts']:
+            self.alerts = load_engine(self.alert_config['state_path'])
+        self.ist = IST
+        self.calendar = MarketCalendar(self.ist)
+        # Compiled once; keeps rendered ETF blocks between runs
+        self.renderer = MessageRenderer()
+        # Overrides let the benchmark point the tracker at local stub servers
+        self.api_config = dict(config.API_CONFIG, **(api_config or {}))
+        self.timeout = self.api_config['timeout']
+        from sessions import NSESession, create_pooled_session
+        # Keep-alive pools shared by every fetch in this process
+        self.http = create_pooled_session()
+        self.nse = NSESession(self.api_config['nse_base_url'], timeout=self.timeout,
+                              cookie_max_age=self.api_config['nse_cookie_max_age'])
+        self.dispatcher = None
+        if self.subscribers:
+            from dispatcher import Dispatcher
+            self.dispatcher = Dispatcher(self.http, self.api_config['telegram_api_url'],
+                                         self.telegram_token, dispatch_config, timeout=self.timeout)
+        self.spot_sources = SourceChain(self.http, self.api_config['spot_sources'],
+                                        timeout=self.timeout)
+        self.quote_engine = QuoteEngine(self.nse, fetch_symbol=self.get_nse_data)
+        # Worker processes for large registries, see poll()
+        self.shards = None
+        shard_config = dict(config.SHARD_CONFIG, **(shard_config or {}))
+        if shard_config['workers'] > 1:
+            from shards import ShardedPoller
+            self.shards = ShardedPoller(shard_config=shard_config)
+        # Spot and forex move slowly, so they are served from a TTL cache
+        self.cache = create_cache() if cache is None else cache
+        # History of quotes, iNAV and premium/discount
+        self.store = None
+        if config.STORAGE_CONFIG['enabled']:
+            self.store = TimeSeriesStore(config.STORAGE_CONFIG['path'])
+        # Local JSON API fed after each tick, started by the long-running modes
+        self.query_server = None
+        # Rolling premium/discount and gold/silver statistics, kept across runs
+        self.analytics_config = dict(config.ANALYTICS_CONFIG)
+        self.analytics = None
+        # Ticks fed to the analytics since their state was last written
+        self.analytics_unsaved = 0
+        self.analytics_saved_at = time.monotonic()
+        if self.analytics_config['enabled']:
+            from analytics import load_analytics
+            self.analytics = load_analytics(self.analytics_config['state_path'])
         
+    def get_spot_price(self, metal):
+        """International spot price in USD per troy oz for 'gold' or 'silver', cached"""
+        return self.cache.get_or_fetch('spot', f'spot:{metal}',
+                                       lambda: self.fetch_spot_price(metal))
+    
+    def fetch_spot_price(self, metal):
+        """Fetch international spot price in USD per troy oz for 'gold' or 'silver'
+        from the first healthy source in API_CONFIG['spot_sources']"""
+        return self.spot_sources.fetch(metal)
+    
     def get_mcx_prices(self):
-        """Fetch current MCX Gold and Silver prices"""
-        try:
-            # MCX Gold (per 10 grams) and Silver (per kg)
-            # Using alternative API since direct MCX might need authentication
-            response = requests.get('https://www.goldapi.io/api/XAU/INR', 
-                                  headers={'x-access-token': os.environ.get('GOLD_API_KEY', '')},
-                                  timeout=10)
-            
-            # Fallback to web scraping or alternative source
-            mcx_data = {
-                'gold_mcx': None,  # Per 10 grams
-                'silver_mcx': None,  # Per kg
-                'timestamp': datetime.now(self.ist).strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
-            # Try NSE India API for international prices
-            try:
-                # Gold spot price in USD
-                gold_usd_response = requests.get('https://api.metals.live/v1/spot/gold', timeout=10)
-                if gold_usd_response.status_code == 200:
-                    gold_data = gold_usd_response.json()
-                    mcx_data['gold_usd_oz'] = gold_data.get('price')
-                
-                # Silver spot price in USD
-                silver_usd_response = requests.get('https://api.metals.live/v1/spot/silver', timeout=10)
-                if silver_usd_response.status_code == 200:
-                    silver_data = silver_usd_response.json()
-                    mcx_data['silver_usd_oz'] = silver_data.get('price')
-            except:
-                pass
-            
-            return mcx_data
-        except Exception as e:
-            print(f"Error fetching MCX prices: {e}")
-            return {'error': str(e)}
+        """Fetch current gold and silver prices as a SpotPrices record"""
+        # MCX Gold (per 10 grams) and Silver (per kg) need an authenticated
+        # feed, so only the international spot prices are filled in
+        return SpotPrices(self.get_spot_price('gold'), self.get_spot_price('silver'),
+                          time.time_ns())
     
     def get_forex_rates(self):
-        """Fetch USD/INR exchange rate"""
+        """USD/INR exchange rate as an FxRate record, cached"""
+        return FxRate.from_cached(
+            self.cache.get_or_fetch('forex', 'forex:USDINR', self.fetch_forex_rates))
+    
+    def fetch_forex_rates(self):
+        """Fetch USD/INR exchange rate; a plain dict, as it is stored in the cache"""
         try:
             # Using exchangerate-api.com (free tier)
-            response = requests.get('https://api.exchangerate-api.com/v4/latest/USD', timeout=10)
+            response = self.http.get(self.api_config['forex_api_url'], timeout=self.timeout)
             if response.status_code == 200:
-                data = response.json()
+                data = response_json(response)
                 return {
                     'usd_inr': data['rates'].get('INR'),
                     'timestamp': data.get('time_last_updated')
@@ -64,203 +138,199 @@ class ETFTracker:
             return None
     
     def get_nse_data(self, symbol):
-        """Fetch NSE ETF data"""
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'application/json',
-                'Accept-Language': 'en-US,en;q=0.9',
-            }
-            
-            # NSE API endpoint for ETF quotes
-            url = f'https://www.nseindia.com/api/quote-equity?symbol={symbol}'
-            
-            session = requests.Session()
-            session.get('https://www.nseindia.com', headers=headers, timeout=10)
-            
-            response = session.get(url, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                price_info = data.get('priceInfo', {})
-                
-                return {
-                    'symbol': symbol,
-                    'ltp': price_info.get('lastPrice'),
-                    'open': price_info.get('open'),
-                    'high': price_info.get('intraDayHighLow', {}).get('max'),
-                    'low': price_info.get('intraDayHighLow', {}).get('min'),
-                    'close': price_info.get('close'),
-                    'change': price_info.get('change'),
-                    'pChange': price_info.get('pChange'),
-                    'volume': data.get('marketDeptOrderBook', {}).get('totalTradedVolume'),
-                    'value': data.get('marketDeptOrderBook', {}).get('totalTradedValue'),
-                    'timestamp': datetime.now(self.ist).strftime('%Y-%m-%d %H:%M:%S')
-                }
-        except Exception as e:
-            print(f"Error fetching NSE data for {symbol}: {e}")
-            return None
+        """Fetch NSE ETF data as a Quote record, on the shared warm session"""
+        return fetch_quote(self.nse, symbol)
     
-    def calculate_inav(self, symbol, commodity_price_usd, usd_inr, units_per_etf):
+    def calculate_inav(self, symbol, commodity_price_usd, usd_inr, units_per_etf=None,
+                       expense_accrual=None):
         """
         Calculate indicative NAV (iNAV)
         
         For Gold ETF: 1 unit = 1 gram of gold
         For Silver ETF: 1 unit = 1 gram of silver
         
-        iNAV = (Commodity Price in USD per oz / 31.1035) * USD/INR
+        iNAV = (Commodity Price in USD per oz / 31.1035) * USD/INR * units_per_etf
+        
+        units_per_etf and the expense accrual default to the symbol's entry in
+        config.ETFS. inav.inav_batch is the vectorized version of this.
         """
         try:
             if commodity_price_usd and usd_inr:
-                # Convert from USD per troy oz to INR per gram
-                price_per_gram_inr = (commodity_price_usd / 31.1035) * usd_inr
-                inav = price_per_gram_inr * units_per_etf
+                etf = config.ETFS.get(symbol, {})
+                if units_per_etf is None:
+                    units_per_etf = etf.get('units_per_etf', 1)
+                if expense_accrual is None:
+                    expense_accrual = daily_expense_accrual(etf)
+                inav = inav_scalar(commodity_price_usd, usd_inr, units_per_etf, expense_accrual)
                 return round(inav, 2)
             return None
         except Exception as e:
             print(f"Error calculating iNAV: {e}")
             return None
     
-    def is_market_open(self):
-        """Check if Indian stock market is open"""
-        now = datetime.now(self.ist)
-        
-        # Market hours: Monday-Friday, 9:15 AM - 3:30 PM IST
-        if now.weekday() >= 5:  # Saturday or Sunday
-            return False
-        
-        market_start = now.replace(hour=9, minute=15, second=0)
-        market_end = now.replace(hour=15, minute=30, second=0)
-        
-        return market_start <= now <= market_end
+    def is_market_open(self, when=None):
+        """Check if Indian stock market is open, using the NSE holiday calendar"""
+        return self.calendar.is_open(when or datetime.now(self.ist))
     
-    def format_telegram_message(self, gold_data, silver_data, mcx_data, forex_data):
-        """Format comprehensive Telegram message"""
-        now = datetime.now(self.ist)
-        market_status = "🟢 OPEN" if self.is_market_open() else "🔴 CLOSED"
-        
-        message = f"""
-📊 *ETF TRACKER UPDATE*
-⏰ {now.strftime('%d-%b-%Y %I:%M %p IST')}
-📈 Market Status: {market_status}
-
-━━━━━━━━━━━━━━━━━━━━
-
-🥇 *TATA GOLD ETF (TATAGOLD)*
-"""
-        
-        if gold_data:
-            message += f"""
-💰 LTP: ₹{gold_data.get('ltp', 'N/A')}
-📊 Open: ₹{gold_data.get('open', 'N/A')}
-📈 High: ₹{gold_data.get('high', 'N/A')}
-📉 Low: ₹{gold_data.get('low', 'N/A')}
-🔄 Change: {gold_data.get('change', 'N/A')} ({gold_data.get('pChange', 'N/A')}%)
-📦 Volume: {self.format_number(gold_data.get('volume', 0))}
-"""
-            
-            # Calculate iNAV for Gold
-            if mcx_data.get('gold_usd_oz') and forex_data:
-                gold_inav = self.calculate_inav('TATAGOLD', mcx_data['gold_usd_oz'], 
-                                               forex_data['usd_inr'], 1)
-                if gold_inav:
-                    premium_discount = ((gold_data.get('ltp', 0) - gold_inav) / gold_inav * 100) if gold_inav else 0
-                    message += f"""
-🎯 iNAV: ₹{gold_inav}
-📊 Premium/Discount: {premium_discount:.2f}%
-"""
-        
-        message += f"""
-━━━━━━━━━━━━━━━━━━━━
-
-🥈 *TATA SILVER ETF (TATSILV)*
-"""
-        
-        if silver_data:
-            message += f"""
-💰 LTP: ₹{silver_data.get('ltp', 'N/A')}
-📊 Open: ₹{silver_data.get('open', 'N/A')}
-📈 High: ₹{silver_data.get('high', 'N/A')}
-📉 Low: ₹{silver_data.get('low', 'N/A')}
-🔄 Change: {silver_data.get('change', 'N/A')} ({silver_data.get('pChange', 'N/A')}%)
-📦 Volume: {self.format_number(silver_data.get('volume', 0))}
-"""
-            
-            # Calculate iNAV for Silver
-            if mcx_data.get('silver_usd_oz') and forex_data:
-                silver_inav = self.calculate_inav('TATSILV', mcx_data['silver_usd_oz'], 
-                                                 forex_data['usd_inr'], 1)
-                if silver_inav:
-                    premium_discount = ((silver_data.get('ltp', 0) - silver_inav) / silver_inav * 100) if silver_inav else 0
-                    message += f"""
-🎯 iNAV: ₹{silver_inav}
-📊 Premium/Discount: {premium_discount:.2f}%
-"""
-        
-        message += f"""
-━━━━━━━━━━━━━━━━━━━━
-
-🌍 *INTERNATIONAL PRICES*
-"""
-        
-        if mcx_data.get('gold_usd_oz'):
-            message += f"\n💛 Gold: ${mcx_data['gold_usd_oz']:.2f}/oz"
-        
-        if mcx_data.get('silver_usd_oz'):
-            message += f"\n⚪ Silver: ${mcx_data['silver_usd_oz']:.2f}/oz"
-        
-        if forex_data:
-            message += f"""
-
-💵 *FOREX*
-USD/INR: ₹{forex_data['usd_inr']:.2f}
-"""
+    def market_status(self, now):
+        """Market status line for the message"""
+        if self.is_market_open(now):
+            return "🟢 OPEN"
+        holiday = self.calendar.holiday_name(now.date())
+        if holiday:
+            return f"🔴 CLOSED ({holiday})"
+        return "🔴 CLOSED"
+    
+    def calculate_metrics(self, quotes, mcx_data, forex_data):
+        """
+        Compute iNAV and premium/discount for every configured ETF
         
-        message += f"""
-━━━━━━━━━━━━━━━━━━━━
-
-📌 *KEY METRICS*
-"""
+        Returns:
+            Dict of symbol -> {'inav', 'premium_discount', 'spot_usd_oz', 'usd_inr'}
+        """
+        return calculate_metrics(config.ETFS, quotes, mcx_data, forex_data)
+    
+    def record_history(self, quotes, metrics, ts_ns=None):
+        """Append this tick's quotes and metrics to the time-series store"""
+        if self.store is None:
+            return
+        ts_ns = time.time_ns() if ts_ns is None else ts_ns
+        try:
+            for symbol, quote in quotes.items():
+                if not quote:
+                    continue
+                values = dict(metrics.get(symbol, {}), ltp=quote.ltp, volume=quote.volume)
+                self.store.append(symbol, ts_ns, values)
+        except Exception as e:
+            print(f"❌ Error recording history: {e}")
+    
+    def update_analytics(self, quotes, mcx_data, metrics, ts_ns=None):
+        """
+        Feed this tick to the rolling analytics
         
-        # Performance comparison
-        if gold_data and silver_data:
-            gold_perf = gold_data.get('pChange', 0)
-            silver_perf = silver_data.get('pChange', 0)
-            
-            winner = "🥇 Gold" if gold_perf > silver_perf else "🥈 Silver"
-            message += f"\n🏆 Today's Winner: {winner}"
+        Returns:
+            Output of Analytics.update(), or None if analytics are disabled or failed
+        """
+        if self.analytics is None:
+            return None
+        ts_ns = time.time_ns() if ts_ns is None else ts_ns
+        try:
+            stats = self.analytics.update(ts_ns, quotes, mcx_data, metrics)
+        except Exception as e:
+            print(f"❌ Error updating analytics: {e}")
+            return None
+        self.analytics_unsaved += 1
+        return stats
+    
+    def save_analytics(self, force=False):
+        """
+        Write the analytics state if it changed and `force` is set or
+        ANALYTICS_CONFIG['save_interval'] has passed since the last write.
         
-        message += "\n\n_Automated update every 30 minutes_"
+        A one-shot run always publishes and so saves every time; the daemon's
+        recording ticks only rewrite the file every save_interval seconds.
+        """
+        if self.analytics is None or not self.analytics_unsaved:
+            return
+        if not self.analytics_config['state_path']:
+            return
+        if not force and (time.monotonic() - self.analytics_saved_at
+                          < self.analytics_config['save_interval']):
+            return
+        try:
+            from analytics import save_analytics
+            save_analytics(self.analytics, self.analytics_config['state_path'])
+            self.analytics_unsaved = 0
+            self.analytics_saved_at = time.monotonic()
+        except Exception as e:
+            print(f"❌ Error saving analytics: {e}")
+    
+    def publish_query(self, quotes, mcx_data, forex_data, metrics, analytics=None, ts_ns=None):
+        """Hand this tick to the query API, if one is serving"""
+        if self.query_server is None:
+            return
+        try:
+            self.query_server.publish(quotes, mcx_data, forex_data, metrics, analytics, ts_ns)
+        except Exception as e:
+            print(f"❌ Error publishing to the query API: {e}")
+    
+    def alert_values(self, quotes, metrics, mcx_data, forex_data, analytics=None):
+        """Values alert rules can watch, keyed by (symbol, metric)"""
+        return alert_values(self.alerts, quotes, metrics, mcx_data, forex_data, analytics)
+    
+    def check_alerts(self, quotes, metrics, mcx_data, forex_data, analytics=None):
+        """Evaluate ALERT_CONFIG rules and send one Telegram message for everything that fired"""
+        if self.alerts is None:
+            return []
+        try:
+            fired = self.alerts.evaluate(self.alert_values(quotes, metrics, mcx_data, forex_data,
+                                                           analytics))
+            save_engine(self.alerts, self.alert_config['state_path'])
+        except Exception as e:
+            print(f"❌ Error checking alerts: {e}")
+            return []
         
+        if fired:
+            print(f"🚨 {len(fired)} alert(s) fired")
+            if self.dispatcher:
+                self.send_to_subscribers(lambda symbols: self.format_alert_message(
+                    [(rule, value) for rule, value in fired
+                     if symbols is None or rule.symbol in symbols or rule.symbol not in config.ETFS]))
+            else:
+                self.send_telegram_message(self.format_alert_message(fired))
+        return fired
+    
+    def format_alert_message(self, fired):
+        """Format fired alerts as one Telegram message, None if there are none"""
+        if not fired:
+            return None
+        message = "🚨 *ETF TRACKER ALERT*\n"
+        for rule, value in fired:
+            icon = config.ETFS.get(rule.symbol, {}).get('icon', '📌')
+            arrow = "⬆️" if rule.direction == 'above' else "⬇️"
+            label = f" ({rule.label})" if rule.label else ""
+            message += (f"\n{icon} {rule.symbol} {rule.metric}: {value:.2f} "
+                        f"{arrow} {rule.direction} {rule.threshold:g}{label}")
         return message
     
+    def format_telegram_message(self, quotes, mcx_data, forex_data, metrics=None, symbols=None,
+                                now=None, analytics=None):
+        """
+        Format comprehensive Telegram message
+        
+        Args:
+            quotes: Dict of symbol -> quote for the ETFs in config.ETFS
+            mcx_data: Spot prices from get_mcx_prices()/fetch_all()
+            forex_data: USD/INR rate from get_forex_rates()
+            metrics: Output of calculate_metrics(), computed if not given
+            symbols: Watchlist to show, every ETF in config.ETFS if None
+            now: Time of the update, so every watchlist of a run shares it
+            analytics: Output of update_analytics(), for the ratio and z-score lines
+        """
+        if metrics is None:
+            metrics = self.calculate_metrics(quotes, mcx_data, forex_data)
+        now = now or datetime.now(self.ist)
+        return self.renderer.render(now.strftime('%d-%b-%Y %I:%M %p IST'), self.market_status(now),
+                                    quotes, mcx_data, forex_data, metrics, symbols, analytics)
+    
     def format_number(self, num):
         """Format large numbers for readability"""
-        try:
-            num = float(num)
-            if num >= 10000000:  # Crores
-                return f"{num/10000000:.2f}Cr"
-            elif num >= 100000:  # Lakhs
-                return f"{num/100000:.2f}L"
-            elif num >= 1000:  # Thousands
-                return f"{num/1000:.2f}K"
-            return f"{num:.0f}"
-        except:
-            return "N/A"
+        return format_number(num)
     
     def send_telegram_message(self, message):
         """Send message to Telegram"""
         try:
-            url = f"https://api.telegram.org/bot{self.telegram_token}/sendMessage"
+            url = f"{self.api_config['telegram_api_url']}/bot{self.telegram_token}/sendMessage"
             payload = {
                 'chat_id': self.telegram_chat_id,
                 'text': message,
                 'parse_mode': 'Markdown'
             }
             
-            response = requests.post(url, json=payload, timeout=10)
+            response = self.http.post(url, json=payload, timeout=self.timeout)
             
             if response.status_code == 200:
+                self.last_message_id = response_json(response).get('result', {}).get('message_id')
                 print("✅ Telegram message sent successfully")
                 return True
             else:
@@ -270,30 +340,453 @@ USD/INR: ₹{forex_data['usd_inr']:.2f}
             print(f"❌ Error sending Telegram message: {e}")
             return False
     
-    def run(self):
-        """Main execution function"""
-        print("🚀 Starting ETF Tracker...")
+    def edit_telegram_message(self, message_id, message):
+        """Replace the text of a message sent earlier"""
+        try:
+            url = f"{self.api_config['telegram_api_url']}/bot{self.telegram_token}/editMessageText"
+            payload = {
+                'chat_id': self.telegram_chat_id,
+                'message_id': message_id,
+                'text': message,
+                'parse_mode': 'Markdown'
+            }
+            
+            response = self.http.post(url, json=payload, timeout=self.timeout)
+            
+            # Telegram rejects edits that change nothing, which is fine here
+            if response.status_code == 200 or 'message is not modified' in response.text:
+                self.last_message_id = message_id
+                print("✅ Telegram message edited successfully")
+                return True
+            print(f"❌ Failed to edit Telegram message: {response.text}")
+            return False
+        except Exception as e:
+            print(f"❌ Error editing Telegram message: {e}")
+            return False
+    
+    def publish(self, message, snapshot):
+        """
+        Send the message only if something moved since the last publish
         
-        # Fetch all data
-        print("📡 Fetching NSE data...")
-        gold_data = self.get_nse_data('TATAGOLD')
-        silver_data = self.get_nse_data('TATSILV')
+        Args:
+            message: Formatted Telegram message
+            snapshot: publish_state.build_snapshot() of the values in the message
+        
+        Returns:
+            True if a message was sent or edited, None if nothing changed
+            and it was skipped, False if sending failed
+        """
+        state = self.publish_state
+        same_chat = state.chat_id == self.telegram_chat_id
+        
+        if self.telegram_config['suppress_unchanged'] and same_chat and state.snapshot:
+            changed = changed_keys(state.snapshot, snapshot,
+                                   self.telegram_config['price_epsilon_pct'],
+                                   self.telegram_config['point_epsilon'])
+            if not changed:
+                print("⏭️  Nothing changed since the last update, not sending")
+                return None
+            print(f"🔀 Changed since last update: {', '.join(changed)}")
+        
+        sent = False
+        if self.telegram_config['edit_previous'] and same_chat and state.message_id:
+            sent = self.edit_telegram_message(state.message_id, message)
+        if not sent:
+            sent = self.send_telegram_message(message)
+        
+        if sent:
+            state.save(snapshot, self.telegram_chat_id, self.last_message_id)
+        return sent
+    
+    def send_to_subscribers(self, render):
+        """
+        Render one message per distinct watchlist and deliver it to every subscriber
+        
+        Args:
+            render: Callable taking a watchlist (tuple of symbols, or None for
+                every ETF) and returning the message, or None to skip those chats
+        
+        Returns:
+            Dict of chat_id -> message_id, None for chats that failed
+        """
+        rendered = {}
+        messages = []
+        for subscriber in self.subscribers:
+            symbols = subscriber['symbols']
+            if symbols not in rendered:
+                rendered[symbols] = render(symbols)
+            if rendered[symbols]:
+                messages.append((subscriber['chat_id'], rendered[symbols]))
+        print(f"📝 {len(rendered)} message variant(s) for {len(self.subscribers)} chats")
+        return self.dispatcher.send_all(messages)
+    
+    def publish_to_subscribers(self, quotes, mcx_data, forex_data, metrics, snapshot, now=None,
+                               analytics=None):
+        """
+        Send the update to every subscriber whose watchlist moved
+        
+        Market-wide values (spot, forex, market status) concern every chat,
+        an ETF's values only the chats watching it. Edit-in-place is not used
+        here; each update is a new message. Every watchlist is rendered
+        for the same `now`, so the header is computed once.
+        
+        Returns:
+            True if at least one chat received the update, None if nothing
+            changed and it was skipped, False if every send failed
+        """
+        now = now or datetime.now(self.ist)
+        state = self.publish_state
+        changed = None
+        if self.telegram_config['suppress_unchanged'] and state.chat_id == SUBSCRIBERS_KEY and state.snapshot:
+            changed = changed_keys(state.snapshot, snapshot,
+                                   self.telegram_config['price_epsilon_pct'],
+                                   self.telegram_config['point_epsilon'])
+            if not changed:
+                print("⏭️  Nothing changed since the last update, not sending")
+                return None
+            print(f"🔀 Changed since last update: {', '.join(changed)}")
+        
+        def render(symbols):
+            if changed is not None and symbols is not None and not any(
+                    '.' not in key or key.split('.', 1)[0] in symbols for key in changed):
+                return None
+            return self.format_telegram_message(quotes, mcx_data, forex_data, metrics, symbols, now,
+                                                analytics)
+        
+        results = self.send_to_subscribers(render)
+        if not any(message_id is not None for message_id in results.values()):
+            return False
+        
+        # Only move the published keys forward, so small moves in a value
+        # nobody was sent still add up against the last value they saw
+        if changed is not None:
+            snapshot = dict(state.snapshot, **{key: snapshot[key] for key in changed})
+        state.save(snapshot, SUBSCRIBERS_KEY, None)
+        return True
+    
+    def fetch_all(self, deadline=None):
+        """
+        Fetch NSE quotes, spot prices and forex concurrently.
+        
+        Every upstream request starts at once, so a tick takes as long as the
+        slowest source rather than the sum of all of them. Sources that miss
+        the deadline come back empty and the rest are still used.
+        
+        NSE quotes come from the quote engine's bulk listings, so the number
+        of NSE requests grows with the number of listings in config.ETFS,
+        not the number of symbols.
+        
+        Returns:
+            Tuple of ({symbol: Quote}, SpotPrices, FxRate or None)
+        """
+        if deadline is None:
+            deadline = self.api_config['run_deadline']
+        end = time.monotonic() + deadline
+        
+        jobs = {name: (telemetry.timed_stage('nse_fetch', func), *args)
+                for name, (func, *args) in self.quote_engine.listing_jobs().items()}
+        jobs.update(self.market_jobs())
+        with telemetry.stage('fetch'):
+            results = fan_out(jobs, deadline)
+            
+            quotes, missing = self.quote_engine.collect(results)
+            if missing:
+                with telemetry.stage('nse_fallback'):
+                    quotes.update(self.quote_engine.fetch_missing(missing, end - time.monotonic()))
+        
+        return (quotes,) + self.market_results(results)
+    
+    def market_jobs(self):
+        """fan_out jobs for spot prices and forex"""
+        spot = telemetry.timed_stage('spot_fetch', self.get_spot_price)
+        return {
+            'gold_spot': (spot, 'gold'),
+            'silver_spot': (spot, 'silver'),
+            'forex': (telemetry.timed_stage('forex_fetch', self.get_forex_rates),),
+        }
+    
+    def market_results(self, results):
+        """(SpotPrices, FxRate or None) from fan_out results over market_jobs()"""
+        mcx_data = SpotPrices(results['gold_spot'], results['silver_spot'], time.time_ns())
+        return mcx_data, results['forex']
+    
+    def poll(self, deadline=None):
+        """
+        Fetch everything and compute iNAV for one tick.
+        
+        In one process this is fetch_all() plus calculate_metrics(). With
+        shard workers the bulk listings are still fetched once here, together
+        with spot and forex; the workers decode them, keep their share of the
+        rows, turn it into quotes and compute iNAV.
+        
+        Returns:
+            Tuple of ({symbol: Quote}, SpotPrices, FxRate or None, metrics)
+        """
+        if self.shards is None:
+            quotes, mcx_data, forex_data = self.fetch_all(deadline)
+            with telemetry.stage('inav'):
+                metrics = self.calculate_metrics(quotes, mcx_data, forex_data)
+            return quotes, mcx_data, forex_data, metrics
+        
+        if deadline is None:
+            deadline = self.api_config['run_deadline']
+        end = time.monotonic() + deadline
+        
+        jobs = {name: (telemetry.timed_stage('nse_fetch', func), *args)
+                for name, (func, *args) in self.quote_engine.body_jobs().items()}
+        jobs.update(self.market_jobs())
+        with telemetry.stage('fetch'):
+            results = fan_out(jobs, deadline)
+            mcx_data, forex_data = self.market_results(results)
+            bodies = {}
+            for listing in self.quote_engine.plan_batches():
+                fetched = results.get(f"body:{listing}")
+                if fetched:
+                    bodies[listing] = fetched
+        
+        with telemetry.stage('shards'):
+            quotes, shard_metrics, missing = self.shards.process(
+                bodies, mcx_data, forex_data, max(0.0, end - time.monotonic()))
+        
+        # Symbols no listing covered fall back to per-symbol quotes here
+        fallback = {}
+        if missing:
+            with telemetry.stage('nse_fallback'):
+                fallback = self.quote_engine.fetch_missing(missing, end - time.monotonic())
+            quotes.update(fallback)
         
-        print("📡 Fetching MCX/International prices...")
-        mcx_data = self.get_mcx_prices()
+        # Fallback quotes, and symbols of a shard that missed the deadline,
+        # are priced here; the rest came from the workers
+        metrics = shard_metrics
+        rest = {symbol: etf for symbol, etf in config.ETFS.items()
+                if symbol in fallback or symbol not in metrics}
+        if rest:
+            with telemetry.stage('inav'):
+                metrics.update(calculate_metrics(rest, fallback, mcx_data, forex_data))
+        return quotes, mcx_data, forex_data, metrics
+    
+    def run(self, publish=True):
+        """
+        Main execution function
         
-        print("📡 Fetching Forex rates...")
-        forex_data = self.get_forex_rates()
+        Args:
+            publish: Send the Telegram message. Daemon ticks between publish
+                intervals only fetch and record history.
         
-        # Format and send message
-        print("📝 Formatting message...")
-        message = self.format_telegram_message(gold_data, silver_data, mcx_data, forex_data)
+        Returns:
+            Tuple of (quotes, mcx_data, forex_data, metrics, delivered) for
+            the tick. `delivered` is False only when the Telegram update
+            could not be sent; an update skipped because nothing changed, or
+            a tick that did not publish, counts as delivered
+        """
+        print("🚀 Starting ETF Tracker...")
         
-        print("📤 Sending to Telegram...")
-        self.send_telegram_message(message)
+        # Fetch all data
+        print("📡 Fetching NSE, international and forex data...")
+        with telemetry.stage('run'):
+            quotes, mcx_data, forex_data, metrics = self.poll()
+            
+            with telemetry.stage('history'):
+                self.record_history(quotes, metrics)
+            with telemetry.stage('analytics'):
+                analytics = self.update_analytics(quotes, mcx_data, metrics)
+                self.save_analytics(force=publish)
+            self.publish_query(quotes, mcx_data, forex_data, metrics, analytics)
+            with telemetry.stage('alerts'):
+                self.check_alerts(quotes, metrics, mcx_data, forex_data, analytics)
+            
+            complete = self.is_complete(quotes, mcx_data, forex_data)
+            delivered = True
+            if publish:
+                now = datetime.now(self.ist)
+                snapshot = build_snapshot(quotes, mcx_data, forex_data, metrics,
+                                          self.is_market_open(now))
+                if self.dispatcher:
+                    # Rendered per watchlist while sending
+                    print("📤 Sending to Telegram subscribers...")
+                    with telemetry.stage('telegram_send'):
+                        published = self.publish_to_subscribers(quotes, mcx_data, forex_data,
+                                                                 metrics, snapshot, now, analytics)
+                else:
+                    # Format and send message
+                    print("📝 Formatting message...")
+                    with telemetry.stage('format'):
+                        message = self.format_telegram_message(quotes, mcx_data, forex_data, metrics,
+                                                               now=now, analytics=analytics)
+                    
+                    print("📤 Sending to Telegram...")
+                    with telemetry.stage('telegram_send'):
+                        published = self.publish(message, snapshot)
+                # None: skipped because nothing changed
+                delivered = published is not False
+            
+            # Let stale-while-revalidate refreshes land in the cache before exit
+            self.cache.drain(timeout=self.timeout)
         
-        print("✅ ETF Tracker completed!")
+        telemetry.inc('etf_runs')
+        if not delivered:
+            print("⚠️  ETF Tracker completed, but the update could not be delivered")
+        elif not complete:
+            print("⚠️  ETF Tracker completed with missing data")
+        else:
+            print("✅ ETF Tracker completed!")
+        return quotes, mcx_data, forex_data, metrics, delivered
+    
+    def is_complete(self, quotes, mcx_data, forex_data):
+        """Whether the tick has every ETF's quote, the spot prices they need and forex"""
+        if forex_data is None:
+            return False
+        for symbol, etf in config.ETFS.items():
+            if not quotes.get(symbol):
+                return False
+            if etf.get('commodity') in ('gold', 'silver') and mcx_data.price(etf['commodity']) is None:
+                return False
+        return True
+    
+    def close(self):
+        """Release files and connections held across daemon ticks"""
+        self.save_analytics(force=True)
+        self.cache.drain(timeout=self.timeout)
+        if self.shards is not None:
+            self.shards.close()
+        if self.query_server is not None:
+            self.query_server.close()
+        if self.store is not None:
+            self.store.close()
+        self.http.close()
+        self.nse.session.close()
+
+
+def serve_endpoints(tracker, metrics_config=None, query_config=None):
+    """
+    Start the /metrics and query API endpoints of the long-running modes.
+    
+    They expose metrics for scraping instead of a summary file, and the
+    latest tick for local tools. A port that cannot be bound only loses
+    that endpoint; the tracker keeps running without it.
+    
+    Args:
+        tracker: ETFTracker whose ticks the query API serves
+        metrics_config: Overrides for config.METRICS_CONFIG
+        query_config: Overrides for config.QUERY_CONFIG
+    """
+    metrics_config = dict(config.METRICS_CONFIG, **(metrics_config or {}))
+    query_config = dict(config.QUERY_CONFIG, **(query_config or {}))
+    if telemetry.registry() and metrics_config['port']:
+        try:
+            telemetry.serve(metrics_config['host'], metrics_config['port'])
+        except OSError as e:
+            print(f"⚠️  Metrics endpoint off, cannot listen on "
+                  f"{metrics_config['host']}:{metrics_config['port']}: {e}")
+    if query_config['port']:
+        from query_server import QueryServer
+        query_server = QueryServer(query_config=query_config)
+        try:
+            tracker.query_server = query_server.serve(query_config['host'], query_config['port'])
+        except OSError as e:
+            query_server.close()
+            print(f"⚠️  Query API off, cannot listen on "
+                  f"{query_config['host']}:{query_config['port']}: {e}")
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    Returns:
+        Exit status: for --check-open 0 when the market is open and
+        EXIT_CLOSED (3) when it is closed, otherwise 0
+    """
+    parser = argparse.ArgumentParser(description="ETF Tracker - Telegram updates for NSE ETFs")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running and schedule ticks in-process (see DAEMON_CONFIG)")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="with --daemon, tick faster when prices move and slower when "
+                             "flat, within request budgets (see ADAPTIVE_CONFIG)")
+    parser.add_argument('--stream', action='store_true',
+                        help="poll quotes at high frequency and write OHLC bars (see STREAM_CONFIG)")
+    parser.add_argument('--force', action='store_true',
+                        help="run even when the market is closed or this window already ran")
+    parser.add_argument('--shards', type=int, metavar='N',
+                        help="poll from N worker processes (overrides SHARD_CONFIG['workers'])")
+    parser.add_argument('--check-open', action='store_true',
+                        help="only check the NSE calendar: exit 0 if open, 3 if closed")
+    parser.add_argument('--profile', nargs='?', const=config.PROFILE_CONFIG['path'],
+                        metavar='DIR',
+                        help="profile one run: cProfile, tracemalloc, per-request timings "
+                             "and upstream fixtures written to DIR (see PROFILE_CONFIG)")
+    args = parser.parse_args(argv)
+    if args.profile and (args.daemon or args.stream):
+        parser.error("--profile profiles a single run, not --daemon or --stream")
+    
+    # Decided from the calendar alone, before requests is imported.
+    # The daemon sleeps through closed sessions itself
+    skip_closed = (config.MARKET_CONFIG['skip_closed_sessions'] and not args.force
+                   and not args.daemon)
+    if args.check_open or skip_closed:
+        calendar = MarketCalendar(IST)
+        now = datetime.now(IST)
+        if not calendar.is_open(now):
+            print(f"💤 Market closed, skipping. Next session opens "
+                  f"{calendar.next_open(now).strftime('%d-%b-%Y %I:%M %p IST')}")
+            return EXIT_CLOSED if args.check_open else 0
+        if args.check_open:
+            print("🟢 Market open")
+            return 0
+    
+    metrics_config = config.METRICS_CONFIG
+    telemetry.configure()
+    
+    shard_config = None if args.shards is None else {'workers': args.shards}
+    if args.daemon:
+        tracker = ETFTracker(shard_config=shard_config)
+        serve_endpoints(tracker)
+        if args.adaptive or config.ADAPTIVE_CONFIG['enabled']:
+            from adaptive import AdaptiveScheduler
+            AdaptiveScheduler(tracker).run_forever()
+        else:
+            from scheduler import Scheduler
+            Scheduler(tracker).run_forever()
+        return 0
+    
+    if args.stream:
+        tracker = ETFTracker(shard_config=shard_config)
+        serve_endpoints(tracker)
+        from streaming import run_stream
+        run_stream(tracker, force=args.force)
+        return 0
+    
+    # Overlapping triggers share one run per window; taken before the
+    # tracker is built, so a duplicate never loads the HTTP stack
+    from single_flight import create_single_flight, window_key
+    flight = None if args.force else create_single_flight()
+    if flight is None:
+        claim = contextlib.nullcontext(True)
+    else:
+        key = window_key(datetime.now(IST), config.SINGLE_FLIGHT_CONFIG['window'],
+                         config.MARKET_CONFIG['market_open_time'])
+        claim = flight.claim(key, os.environ.get('GITHUB_EVENT_NAME', 'local'))
+    with claim as claimed:
+        if not claimed:
+            return 0
+        tracker = ETFTracker(shard_config=shard_config)
+        try:
+            if args.profile:
+                from profiling import profile_run
+                delivered = profile_run(tracker, args.profile)[4]
+            else:
+                delivered = tracker.run()[4]
+        finally:
+            tracker.close()
+        # A run whose update could not be sent hands the window back, so a
+        # backup trigger in the same window posts instead. One that posted
+        # with some data missing keeps it; a retry would post a duplicate
+        if not delivered and flight is not None:
+            print(f"↩️  Releasing {key} for the next trigger")
+            flight.abandon(key)
+    telemetry.write_summary(metrics_config['summary_path'])
+    return 0
+
 
 if __name__ == "__main__":
-    tracker = ETFTracker()
-    tracker.run()
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+iNAV math for ETF Tracker
+Scalar helpers for the live tick and NumPy batch versions for history and backfills
+"""
+
+TROY_OUNCE_GRAMS = 31.1035
+
+
+def inav_scalar(commodity_price_usd, usd_inr, units_per_etf=1, expense_accrual=0.0):
+    """
+    iNAV of one ETF unit in INR.
+
+    Args:
+        commodity_price_usd: Spot price in USD per troy oz
+        usd_inr: USD/INR rate
+        units_per_etf: Grams of metal backing one ETF unit
+        expense_accrual: Fraction of NAV accrued as expenses, e.g. 0.0001
+
+    iNAV = (USD per oz / 31.1035) * USD/INR * units_per_etf * (1 - expense_accrual)
+    """
+    price_per_gram_inr = (commodity_price_usd / TROY_OUNCE_GRAMS) * usd_inr
+    return price_per_gram_inr * units_per_etf * (1 - expense_accrual)
+
+
+def premium_discount_scalar(ltp, inav):
+    """Premium (+) or discount (-) of the traded price to iNAV, in percent"""
+    return (ltp - inav) / inav * 100
+
+
+def daily_expense_accrual(etf):
+    """One day's share of the ETF's annual expense ratio (percent) from config.ETFS"""
+    return etf.get('expense_ratio', 0.0) / 100 / 365
+
+
+def calculate_metrics(etfs, quotes, mcx_data, forex_data):
+    """
+    iNAV and premium/discount for every ETF in `etfs`.
+
+    Args:
+        etfs: ETF registry, e.g. config.ETFS or one shard of it
+        quotes: Dict of symbol -> records.Quote
+        mcx_data: records.SpotPrices
+        forex_data: records.FxRate, or None
+
+    Returns:
+        Dict of symbol -> {'inav', 'premium_discount', 'spot_usd_oz', 'usd_inr'}
+    """
+    usd_inr = forex_data.usd_inr if forex_data else None
+    metrics = {}
+    for symbol, etf in etfs.items():
+        quote = quotes.get(symbol)
+        # iNAV only applies to commodity ETFs with a spot price
+        spot_price = mcx_data.price(etf.get('commodity'))
+        inav = None
+        premium_discount = None
+        if quote and spot_price and usd_inr:
+            inav = round(inav_scalar(spot_price, usd_inr, etf.get('units_per_etf', 1),
+                                     daily_expense_accrual(etf)), 2)
+            # No LTP means no premium/discount, not a -100% one: None keeps it
+            # out of history, analytics and alerts
+            if inav and quote.ltp is not None:
+                premium_discount = premium_discount_scalar(quote.ltp, inav)
+        metrics[symbol] = {
+            'inav': inav,
+            'premium_discount': premium_discount,
+            'spot_usd_oz': spot_price,
+            'usd_inr': usd_inr
+        }
+    return metrics
+
+
+def inav_batch(spot_usd_oz, usd_inr, units_per_etf=1.0, expense_accrual=0.0, ltp=None):
+    """
+    Vectorized iNAV and premium/discount.
+
+    Every argument may be a scalar or anything NumPy can turn into an array
+    (lists, arrays, SeriesSlice columns), and they broadcast against each
+    other. For a ticks x symbols backfill pass spot/FX/LTP as 2-D arrays and
+    units/accrual as 1-D per-symbol arrays.
+
+    Missing inputs should be NaN; they come out as NaN rather than raising.
+
+    Returns:
+        Tuple of (inav, premium_discount) float64 arrays. premium_discount is
+        None when `ltp` is not given.
+    """
+    import numpy as np
+
+    spot_usd_oz = np.asarray(spot_usd_oz, dtype=np.float64)
+    usd_inr = np.asarray(usd_inr, dtype=np.float64)
+    units_per_etf = np.asarray(units_per_etf, dtype=np.float64)
+    expense_accrual = np.asarray(expense_accrual, dtype=np.float64)
+
+    # Same operation order as inav_scalar so results match bit for bit
+    inav = spot_usd_oz / TROY_OUNCE_GRAMS
+    inav *= usd_inr
+    inav = inav * units_per_etf
+    inav *= 1 - expense_accrual
+
+    if ltp is None:
+        return inav, None
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        premium_discount = (np.asarray(ltp, dtype=np.float64) - inav) / inav * 100
+    return inav, premium_discount
+
+
+def backfill(store, etfs, start_ns, end_ns):
+    """
+    Recompute iNAV and premium/discount from stored LTP, spot and FX history.
+
+    iNAV is rounded to 2 decimals and premium/discount computed from the
+    rounded value, as calculate_metrics() does for the live tick, so
+    unchanged inputs give back the values that were recorded.
+
+    Args:
+        store: storage.TimeSeriesStore holding the 'quotes' series
+        etfs: ETF registry, e.g. config.ETFS
+        start_ns: Range start, epoch ns
+        end_ns: Range end (exclusive), epoch ns
+
+    Returns:
+        Dict of symbol -> (timestamps, inav, premium_discount) as arrays
+    """
+    import numpy as np
+
+    results = {}
+    for symbol, etf in etfs.items():
+        parts = store.range(symbol, start_ns, end_ns)
+        if not parts:
+            continue
+        timestamps = np.concatenate([np.asarray(part.timestamps) for part in parts])
+        columns = {field: np.concatenate([np.asarray(part.column(field)) for part in parts])
+                   for field in ('ltp', 'spot_usd_oz', 'usd_inr')}
+        inav, _ = inav_batch(columns['spot_usd_oz'], columns['usd_inr'],
+                             etf.get('units_per_etf', 1), daily_expense_accrual(etf))
+        inav = np.round(inav, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            premium_discount = premium_discount_scalar(columns['ltp'], inav)
+        results[symbol] = (timestamps, inav, premium_discount)
+    return results
@@ -0,0 +1,138 @@
+"""
+NSE market calendar for ETF Tracker
+Trading sessions from market hours and a local holiday file, queried by binary search
+"""
+
+import bisect
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import config
+
+# India has no daylight saving, so exchange time is a fixed UTC+05:30 offset
+IST = timezone(timedelta(hours=5, minutes=30), 'IST')
+
+
+def parse_hhmm(value):
+    hour, minute = value.split(':')
+    return int(hour), int(minute)
+
+
+class MarketCalendar:
+    """
+    Trading sessions for NSE.
+
+    Sessions for a year are built once from MARKET_CONFIG hours, weekends and
+    the holiday file, then kept as two sorted lists of epoch-second open and
+    close times. `is_open`, `session_at` and `next_open` are a binary search
+    over those lists.
+    """
+
+    def __init__(self, tz=IST, market_config=None, holidays=None):
+        """
+        Args:
+            tz: Exchange timezone (datetime.tzinfo)
+            market_config: Overrides for config.MARKET_CONFIG
+            holidays: Parsed holiday file, loaded from MARKET_CONFIG['holidays_file'] if None
+        """
+        self.tz = tz
+        self.market_config = dict(config.MARKET_CONFIG, **(market_config or {}))
+        if holidays is None:
+            holidays = self.load_holidays(self.market_config['holidays_file'])
+        self.holidays = holidays.get('holidays', {})
+        self.special_sessions = holidays.get('special_sessions', {})
+        self._years = set()
+        self._opens = []
+        self._closes = []
+
+    @staticmethod
+    def load_holidays(path):
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Holiday file {path} unavailable, only weekends are closed: {e}")
+            return {}
+
+    def _session_bounds(self, day, open_time, close_time):
+        midnight = datetime(day.year, day.month, day.day)
+        open_hour, open_minute = parse_hhmm(open_time)
+        close_hour, close_minute = parse_hhmm(close_time)
+        return (midnight.replace(hour=open_hour, minute=open_minute, tzinfo=self.tz).timestamp(),
+                midnight.replace(hour=close_hour, minute=close_minute, tzinfo=self.tz).timestamp())
+
+    def build_year(self, year):
+        """List of (open, close) epoch seconds for every session in `year`"""
+        sessions = []
+        day = datetime(year, 1, 1).date()
+        while day.year == year:
+            iso = day.isoformat()
+            special = self.special_sessions.get(iso)
+            if special:
+                sessions.append(self._session_bounds(day, special['open'], special['close']))
+            elif iso not in self.holidays and not (
+                    self.market_config['weekdays_only'] and day.weekday() >= 5):
+                sessions.append(self._session_bounds(
+                    day, self.market_config['market_open_time'],
+                    self.market_config['market_close_time']))
+            day += timedelta(days=1)
+        return sessions
+
+    def _ensure_years(self, *years):
+        added = False
+        for year in years:
+            if year not in self._years:
+                self._years.add(year)
+                for market_open, market_close in self.build_year(year):
+                    self._opens.append(market_open)
+                    self._closes.append(market_close)
+                added = True
+        if added:
+            pairs = sorted(zip(self._opens, self._closes))
+            self._opens = [pair[0] for pair in pairs]
+            self._closes = [pair[1] for pair in pairs]
+
+    def _timestamp(self, when):
+        if isinstance(when, datetime):
+            year = when.astimezone(self.tz).year
+            when = when.timestamp()
+        else:
+            year = datetime.fromtimestamp(when, self.tz).year
+        if year not in self._years and not any(
+                day.startswith(f'{year}-') for day in self.holidays):
+            print(f"⚠️  No NSE holidays listed for {year}, treating every weekday as open")
+        # Next year too, so next_open works across New Year
+        self._ensure_years(year, year + 1)
+        return when
+
+    def _to_datetime(self, ts):
+        return datetime.fromtimestamp(ts, self.tz)
+
+    def session_at(self, when):
+        """(open, close) datetimes of the session containing `when`, or None"""
+        ts = self._timestamp(when)
+        i = bisect.bisect_right(self._opens, ts) - 1
+        if i >= 0 and ts <= self._closes[i]:
+            return self._to_datetime(self._opens[i]), self._to_datetime(self._closes[i])
+        return None
+
+    def is_open(self, when):
+        """Whether the market is trading at `when` (datetime or epoch seconds), close inclusive"""
+        return self.session_at(when) is not None
+
+    def next_open(self, when):
+        """Start of the first session strictly after `when`"""
+        ts = self._timestamp(when)
+        i = bisect.bisect_right(self._opens, ts)
+        if i == len(self._opens):
+            # Past the loaded years, load further ahead and retry
+            self._ensure_years(self._to_datetime(ts).year + 2)
+            i = bisect.bisect_right(self._opens, ts)
+        return self._to_datetime(self._opens[i])
+
+    def holiday_name(self, day):
+        """Name of the holiday on `day` (date), or None"""
+        return self.holidays.get(day.isoformat())
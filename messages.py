@@ -0,0 +1,231 @@
+"""
+Telegram message rendering for ETF Tracker
+Section templates compiled once from MESSAGE_CONFIG, per-ETF blocks cached by quote version
+"""
+
+import config
+
+RULE = "\n━━━━━━━━━━━━━━━━━━━━\n"
+
+HEADER = "\n📊 *ETF TRACKER UPDATE*\n⏰ {time}\n📈 Market Status: {status}\n"
+
+ETF_TITLE = RULE + "\n{icon} *{name} ({symbol})*\n"
+
+# (MESSAGE_CONFIG toggle or None for always, line template)
+QUOTE_LINES = (
+    (None, "💰 LTP: ₹{ltp}\n"),
+    (None, "📊 Open: ₹{open}\n"),
+    (None, "📈 High: ₹{high}\n"),
+    (None, "📉 Low: ₹{low}\n"),
+    (None, "🔄 Change: {change} ({pChange}%)\n"),
+    ('show_volume', "📦 Volume: {volume}\n"),
+)
+
+INAV_LINES = (
+    ('show_inav', "🎯 iNAV: ₹{inav}\n"),
+    ('show_premium_discount', "📊 Premium/Discount: {premium_discount:.{dp}f}%\n"),
+)
+
+INTERNATIONAL_TITLE = RULE + "\n🌍 *INTERNATIONAL PRICES*\n"
+
+# Spot lines in display order: commodity -> (icon, label)
+SPOT_LINES = {
+    'gold': ('💛', 'Gold'),
+    'silver': ('⚪', 'Silver'),
+}
+
+SPOT_LINE = "\n{icon} {label}: ${price:.{dp}f}/oz"
+
+FOREX = "\n\n💵 *FOREX*\nUSD/INR: ₹{usd_inr:.{dp}f}\n"
+
+KEY_METRICS_TITLE = RULE + "\n📌 *KEY METRICS*\n"
+
+WINNER = "\n🏆 Today's Winner: {icon} {label}"
+
+RATIO = "\n⚖️ Gold/Silver Ratio: {ratio:.{dp}f}"
+
+UNUSUAL_PREMIUM = "\n⚠️ {symbol} premium/discount {premium_discount:.{dp}f}% is {zscore:+.1f}σ from its recent mean"
+
+FOOTER = "\n\n_Automated update every 30 minutes_"
+
+# Quote fields shown as they come from NSE, in record order
+QUOTE_FIELDS = ('ltp', 'open', 'high', 'low', 'change', 'pChange')
+
+
+def format_number(num):
+    """Format large numbers for readability"""
+    try:
+        num = float(num)
+        if num >= 10000000:  # Crores
+            return f"{num/10000000:.2f}Cr"
+        elif num >= 100000:  # Lakhs
+            return f"{num/100000:.2f}L"
+        elif num >= 1000:  # Thousands
+            return f"{num/1000:.2f}K"
+        return f"{num:.0f}"
+    except:
+        return "N/A"
+
+
+def compile_lines(lines, message_config):
+    """Join the enabled lines into one format string block, None if none are enabled"""
+    template = ''.join(line for toggle, line in lines
+                       if toggle is None or message_config.get(toggle, True))
+    return "\n" + template if template else None
+
+
+class MessageRenderer:
+    """
+    Render the Telegram update from compiled templates.
+
+    The MESSAGE_CONFIG toggles are applied once, when the section templates
+    are joined into plain format strings, so rendering never re-checks them.
+    Each ETF block is rendered from a compact record of the values it shows.
+    That record is the block's quote version: the block is only re-rendered
+    when one of those values changes, and every watchlist containing the
+    ETF reuses the same string. The market section is cached the same way.
+    Within a tick every watchlist is handed the same Quote records, so
+    those are recognised by identity before the tuple is built; quotes are
+    fresh records per fetch and never changed in place.
+    """
+
+    def __init__(self, etfs=None, message_config=None):
+        """
+        Args:
+            etfs: ETF registry, config.ETFS if None
+            message_config: Overrides for config.MESSAGE_CONFIG
+        """
+        self.etfs = config.ETFS if etfs is None else etfs
+        self.message_config = dict(config.MESSAGE_CONFIG, **(message_config or {}))
+        self.dp = self.message_config['decimal_places']
+        self.zscore_threshold = config.ANALYTICS_CONFIG['zscore_threshold']
+        self.quote_template = compile_lines(QUOTE_LINES, self.message_config)
+        # Without a premium/discount only the iNAV line applies
+        self.inav_templates = {
+            True: compile_lines(INAV_LINES, self.message_config),
+            False: compile_lines(INAV_LINES[:1], self.message_config),
+        }
+        self.titles = {
+            symbol: ETF_TITLE.format(icon=etf['icon'], name=etf['name'].upper(),
+                                     symbol=etf['symbol'])
+            for symbol, etf in self.etfs.items()
+        }
+        # symbol -> (quote, metrics, record, rendered block)
+        self.blocks = {}
+        self.market = (None, None)
+        # Watchlist -> its symbols in registry order
+        self.watchlists = {}
+        self.rendered_blocks = 0
+
+    def record(self, quote, metrics):
+        """Compact, hashable version of everything an ETF block shows"""
+        if not quote:
+            return None
+        metrics = metrics or {}
+        return (quote.ltp, quote.open, quote.high, quote.low, quote.change, quote.pChange,
+                quote.volume, metrics.get('inav'), metrics.get('premium_discount'))
+
+    def render_block(self, symbol, record):
+        block = self.titles[symbol]
+        if record is None:
+            return block
+        fields = {field: 'N/A' if value is None else value
+                  for field, value in zip(QUOTE_FIELDS, record)}
+        fields['volume'] = format_number(record[-3])
+        block += self.quote_template.format_map(fields)
+        inav, premium_discount = record[-2:]
+        template = self.inav_templates[premium_discount is not None]
+        if inav and template:
+            block += template.format(inav=inav, premium_discount=premium_discount, dp=self.dp)
+        return block
+
+    def block(self, symbol, quote, metrics):
+        """Rendered block for one ETF, reused while its record is unchanged"""
+        cached = self.blocks.get(symbol)
+        if cached is not None and cached[0] is quote and cached[1] is metrics:
+            return cached[3]
+        record = self.record(quote, metrics)
+        if cached is not None and cached[2] == record:
+            block = cached[3]
+        else:
+            block = self.render_block(symbol, record)
+            self.rendered_blocks += 1
+        self.blocks[symbol] = (quote, metrics, record, block)
+        return block
+
+    def market_section(self, mcx_data, forex_data):
+        """International prices and forex, shared by every watchlist"""
+        prices = tuple(mcx_data.price(commodity) for commodity in SPOT_LINES)
+        usd_inr = forex_data.usd_inr if forex_data else None
+        key = (prices, bool(forex_data), usd_inr)
+        if self.market[0] == key:
+            return self.market[1]
+
+        section = ''
+        if self.message_config['show_international_prices']:
+            section += INTERNATIONAL_TITLE
+            for (icon, label), price in zip(SPOT_LINES.values(), prices):
+                if price:
+                    section += SPOT_LINE.format(icon=icon, label=label, price=price, dp=self.dp)
+        if forex_data and self.message_config['show_forex']:
+            section += FOREX.format(usd_inr=usd_inr, dp=self.dp)
+        self.market = (key, section)
+        return section
+
+    def key_metrics(self, quotes, symbols, analytics=None):
+        """
+        Performance comparison across every ETF in the watchlist that reported
+        a change, then the gold/silver ratio and premium/discounts whose
+        z-score reaches ANALYTICS_CONFIG['zscore_threshold'], if analytics
+        are given and shown.
+        """
+        section = ''
+        if self.message_config['show_performance_comparison']:
+            performers = [(quotes[symbol].pChange, self.etfs[symbol]) for symbol in symbols
+                          if quotes.get(symbol) and quotes[symbol].pChange is not None]
+            if len(performers) >= 2:
+                _, best = max(performers, key=lambda item: item[0])
+                label = best['commodity'].title() if best.get('commodity') else best['name']
+                section += WINNER.format(icon=best['icon'], label=label)
+        if analytics and self.message_config['show_analytics']:
+            ratio = analytics['MARKET']['gold_silver_ratio']
+            if ratio:
+                section += RATIO.format(ratio=ratio, dp=self.dp)
+            for symbol in symbols:
+                stats = analytics.get(symbol)
+                zscore = stats and stats['premium_zscore']
+                if zscore is not None and abs(zscore) >= self.zscore_threshold:
+                    section += UNUSUAL_PREMIUM.format(symbol=symbol, zscore=zscore, dp=self.dp,
+                                                      premium_discount=stats['premium_discount'])
+        if not section and not self.message_config['show_performance_comparison']:
+            return ''
+        return KEY_METRICS_TITLE + section
+
+    def render(self, time_text, status, quotes, mcx_data, forex_data, metrics, symbols=None,
+               analytics=None):
+        """
+        Full update message.
+
+        Args:
+            time_text: Timestamp shown in the header
+            status: Market status shown in the header
+            quotes: Dict of symbol -> records.Quote
+            mcx_data: records.SpotPrices
+            forex_data: records.FxRate, or None
+            metrics: Output of ETFTracker.calculate_metrics()
+            symbols: Watchlist to show, every ETF if None
+            analytics: Output of Analytics.update() for the tick, or None
+        """
+        key = None if symbols is None else tuple(symbols)
+        ordered = self.watchlists.get(key)
+        if ordered is None:
+            ordered = [symbol for symbol in self.etfs if key is None or symbol in key]
+            self.watchlists[key] = ordered
+        symbols = ordered
+        parts = [HEADER.format(time=time_text, status=status)]
+        parts.extend(self.block(symbol, quotes.get(symbol), metrics.get(symbol))
+                     for symbol in symbols)
+        parts.append(self.market_section(mcx_data, forex_data))
+        parts.append(self.key_metrics(quotes, symbols, analytics))
+        parts.append(FOOTER)
+        return ''.join(parts)
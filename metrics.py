@@ -0,0 +1,252 @@
+"""
+Metrics for ETF Tracker
+Stage timings, upstream latency, cache hits and retries, exported as OpenMetrics or JSON
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import config
+
+# Seconds; upstream calls and stages both fall in this range
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'etf_stage_duration_seconds': (
+        'histogram', 'Time spent in each stage of a run', LATENCY_BUCKETS),
+    'etf_upstream_request_duration_seconds': (
+        'histogram', 'HTTP response time per upstream host', LATENCY_BUCKETS),
+    'etf_upstream_responses': (
+        'counter', 'HTTP responses per upstream host and status class', None),
+    'etf_upstream_response_bytes': (
+        'counter', 'Response payload bytes per upstream host', None),
+    'etf_cache_requests': (
+        'counter', 'Cache lookups per source and result (hit, stale, miss)', None),
+    'etf_retries': (
+        'counter', 'Retried upstream calls per component', None),
+    'etf_runs': (
+        'counter', 'Completed tracker runs', None),
+}
+
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Counters and histograms keyed by metric name and sorted label pairs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.histograms = {}
+
+    def inc(self, name, amount, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = [0] * (len(buckets) + 2)
+                self.histograms[key] = series
+            series[bisect.bisect_left(buckets, value)] += 1
+            series[-1] += value
+
+    def exposition(self):
+        """Everything in the OpenMetrics text format"""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: list(series) for key, series in self.histograms.items()}
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'# HELP {name} {help_text}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}_total{_format_labels(labels)} {_format_value(value)}')
+                continue
+            for (metric, labels), series in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), series):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, ("le", bound))} {cumulative}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(series[-1])}')
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Counters and histogram count/sum/mean as plain JSON-friendly dicts"""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: list(series) for key, series in self.histograms.items()}
+
+        result = {'counters': {}, 'histograms': {}}
+        for (name, labels), value in sorted(counters.items()):
+            result['counters'].setdefault(name, []).append(
+                {'labels': dict(labels), 'value': value})
+        for (name, labels), series in sorted(histograms.items()):
+            count = sum(series[:-1])
+            result['histograms'].setdefault(name, []).append({
+                'labels': dict(labels),
+                'count': count,
+                'sum': round(series[-1], 6),
+                'mean': round(series[-1] / count, 6) if count else None,
+                'buckets': dict(zip([str(b) for b in METRICS[name][2]] + ['+Inf'], series[:-1])),
+            })
+        return result
+
+
+# None while metrics are disabled; every helper below is then a no-op
+_registry = None
+
+
+def configure(metrics_config=None):
+    """Enable or disable collection per METRICS_CONFIG. Returns the registry or None"""
+    global _registry
+    metrics_config = dict(config.METRICS_CONFIG, **(metrics_config or {}))
+    _registry = Registry() if metrics_config['enabled'] else None
+    return _registry
+
+
+def registry():
+    return _registry
+
+
+def inc(name, amount=1, **labels):
+    if _registry is not None:
+        _registry.inc(name, amount, labels)
+
+
+def observe(name, value, **labels):
+    if _registry is not None:
+        _registry.observe(name, value, labels)
+
+
+class _Timer:
+    __slots__ = ('labels', 'started')
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe('etf_stage_duration_seconds', time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage(name):
+    """Context manager timing one stage of a run"""
+    if _registry is None:
+        return _NULL_TIMER
+    return _Timer({'stage': name})
+
+
+def timed_stage(name, func):
+    """Wrap `func` so each call is timed as stage `name`; `func` itself when disabled"""
+    if _registry is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        with _Timer({'stage': name}):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def record_response(response, *args, **kwargs):
+    """requests response hook: latency, status class and payload bytes per upstream host"""
+    if _registry is None:
+        return
+    host = urlparse(response.url).hostname or 'unknown'
+    _registry.observe('etf_upstream_request_duration_seconds',
+                      response.elapsed.total_seconds(), {'upstream': host})
+    _registry.inc('etf_upstream_responses', 1,
+                  {'upstream': host, 'status': f'{response.status_code // 100}xx'})
+    _registry.inc('etf_upstream_response_bytes', len(response.content), {'upstream': host})
+
+
+def write_summary(path):
+    """Write the one-shot JSON summary"""
+    if _registry is None:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    summary = dict(_registry.summary(), created=time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, path)
+    print(f"📈 Metrics summary written to {path}")
+
+
+def serve(host, port):
+    """
+    Serve /metrics in the OpenMetrics format from a daemon thread.
+
+    Returns:
+        The running ThreadingHTTPServer, call shutdown() to stop it
+    """
+    # Only long-running modes serve metrics, so one-shot runs skip this import
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics' or _registry is None:
+                self.send_error(404)
+                return
+            body = _registry.exposition().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"📈 Metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
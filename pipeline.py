@@ -0,0 +1,63 @@
+"""
+Concurrent fetch stage for ETF Tracker
+Fans out independent upstream requests and collects whatever finishes in time
+"""
+
+import queue
+import threading
+import time
+
+
+def fan_out(jobs, deadline, max_workers=None):
+    """
+    Run every job concurrently and wait at most `deadline` seconds for them.
+
+    Args:
+        jobs: Dict of name -> (callable, *args)
+        deadline: Seconds to wait for the whole batch
+        max_workers: Optional cap on how many jobs run at the same time
+
+    Returns:
+        Dict of name -> result. Jobs that raised or missed the deadline map to None.
+    """
+    results = {name: None for name in jobs}
+    finished = queue.Queue()
+    slots = threading.Semaphore(max_workers) if max_workers else None
+
+    def worker(name, func, args):
+        if slots:
+            slots.acquire()
+        try:
+            finished.put((name, func(*args), None))
+        except Exception as e:
+            finished.put((name, None, e))
+        finally:
+            if slots:
+                slots.release()
+
+    # Daemon threads so a stalled upstream cannot keep the process alive
+    # after the deadline has passed
+    for name, (func, *args) in jobs.items():
+        threading.Thread(target=worker, args=(name, func, args),
+                         name=f"fetch-{name}", daemon=True).start()
+
+    pending = set(jobs)
+    end = time.monotonic() + deadline
+    while pending:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            name, result, error = finished.get(timeout=remaining)
+        except queue.Empty:
+            break
+        pending.discard(name)
+        if error is not None:
+            print(f"❌ {name} failed: {error}")
+        else:
+            results[name] = result
+
+    for name in sorted(pending):
+        print(f"⏱️  {name} missed the {deadline}s deadline")
+
+    return results
@@ -0,0 +1,350 @@
+"""
+Profiling for ETF Tracker
+cProfile, tracemalloc and per-request connect/TLS/TTFB/download timings around run(),
+plus recording of upstream responses as replayable fixtures
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import socket
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+import urllib3.connection
+import urllib3.response
+
+import config
+
+# Timing phases of one request, in the order they happen
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'download')
+
+# Bot tokens travel in the Telegram URL path
+TOKEN_PATH = re.compile(r'/bot[^/]+/')
+
+
+def upstream_names(api_config):
+    """
+    host:port -> upstream name for every configured upstream.
+
+    Spot sources are named 'spot:<source name>' so each can be replayed from
+    its own fixture server.
+    """
+    names = {urlparse(api_config['nse_base_url']).netloc: 'nse',
+             urlparse(api_config['forex_api_url']).netloc: 'forex',
+             urlparse(api_config['telegram_api_url']).netloc: 'telegram'}
+    for source in api_config['spot_sources']:
+        names.setdefault(urlparse(source['url']).netloc, f"spot:{source['name']}")
+    return names
+
+
+class RequestTimer:
+    """
+    Per-request connection timings for every requests.Session in the process.
+
+    requests only reports the time to the response headers, so while
+    installed the urllib3 connection and response classes are wrapped to
+    time DNS, TCP connect, the TLS handshake, time to first byte (from the
+    request being sent to the status line) and the body download. Each
+    request's phases are collected in a thread-local record, so requests
+    from fan_out's worker threads are timed separately. Connections reused
+    from a keep-alive pool show no DNS, connect or TLS time.
+
+    With `record` set, response bodies are also kept as fixtures for
+    stub_servers.start_fixtures(); Telegram responses never are.
+    """
+
+    def __init__(self, api_config, record=False):
+        self.api_config = api_config
+        self.names = upstream_names(api_config)
+        self.record = record
+        self.requests = []
+        self.fixtures = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._originals = []
+
+    def _add(self, phase, elapsed):
+        current = getattr(self._local, 'current', None)
+        if current is not None:
+            current[phase] += elapsed
+
+    def _patch(self, owner, name, wrapper):
+        original = owner.__dict__[name]
+        self._originals.append((owner, name, original))
+        setattr(owner, name, wrapper(original))
+
+    def install(self):
+        timer = self
+
+        def timed(phase):
+            def wrap(original):
+                def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return original(*args, **kwargs)
+                    finally:
+                        timer._add(phase, time.perf_counter() - start)
+                return wrapper
+            return wrap
+
+        def connect(original):
+            # Whatever an HTTPS connect() spends beyond DNS and the TCP
+            # connect is the TLS handshake (or proxy tunnelling)
+            def wrapper(conn, *args, **kwargs):
+                current = getattr(timer._local, 'current', None)
+                before = current['dns'] + current['connect'] if current else 0.0
+                start = time.perf_counter()
+                try:
+                    return original(conn, *args, **kwargs)
+                finally:
+                    if current is not None:
+                        spent = current['dns'] + current['connect'] - before
+                        current['tls'] += max(0.0, time.perf_counter() - start - spent)
+            return wrapper
+
+        def new_conn(original):
+            # DNS is timed inside, so only the rest counts as connect
+            def wrapper(conn, *args, **kwargs):
+                current = getattr(timer._local, 'current', None)
+                dns = current['dns'] if current else 0.0
+                start = time.perf_counter()
+                try:
+                    return original(conn, *args, **kwargs)
+                finally:
+                    if current is not None:
+                        current['connect'] += time.perf_counter() - start - (current['dns'] - dns)
+            return wrapper
+
+        def stream(original):
+            def wrapper(response, *args, **kwargs):
+                chunks = original(response, *args, **kwargs)
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration:
+                        timer._add('download', time.perf_counter() - start)
+                        return
+                    timer._add('download', time.perf_counter() - start)
+                    yield chunk
+            return wrapper
+
+        def send(original):
+            def wrapper(session, request, **kwargs):
+                outer = getattr(timer._local, 'current', None)
+                current = dict.fromkeys(PHASES, 0.0)
+                timer._local.current = current
+                start = time.perf_counter()
+                try:
+                    response = original(session, request, **kwargs)
+                except Exception as e:
+                    timer.finish(request, current, start, None, e)
+                    raise
+                finally:
+                    timer._local.current = outer
+                timer.finish(request, current, start, response)
+                return response
+            return wrapper
+
+        self._patch(socket, 'getaddrinfo', timed('dns'))
+        self._patch(urllib3.connection.HTTPConnection, '_new_conn', new_conn)
+        self._patch(urllib3.connection.HTTPSConnection, 'connect', connect)
+        self._patch(urllib3.connection.HTTPConnection, 'getresponse', timed('ttfb'))
+        self._patch(urllib3.response.HTTPResponse, 'stream', stream)
+        self._patch(requests.Session, 'send', send)
+        return self
+
+    def uninstall(self):
+        while self._originals:
+            owner, name, original = self._originals.pop()
+            setattr(owner, name, original)
+
+    def finish(self, request, current, start, response, error=None):
+        """Store the timings of a finished request, and its response as a fixture"""
+        total = time.perf_counter() - start
+        parsed = urlparse(request.url)
+        # Streamed responses are timed up to the headers, without a body
+        body = response.content if response is not None and response._content_consumed else None
+        upstream = self.names.get(parsed.netloc, parsed.netloc)
+        entry = {
+            'upstream': upstream,
+            'method': request.method,
+            'path': TOKEN_PATH.sub('/bot<token>/', parsed.path),
+            'status': response.status_code if response is not None else None,
+            'bytes': len(body or b''),
+            'reused': current['dns'] + current['connect'] + current['tls'] == 0.0,
+            'error': type(error).__name__ if error else None,
+        }
+        for phase in PHASES:
+            entry[f'{phase}_ms'] = round(current[phase] * 1000, 3)
+        entry['total_ms'] = round(total * 1000, 3)
+        with self._lock:
+            self.requests.append(entry)
+            if self.record and body is not None and upstream != 'telegram':
+                self.fixtures.append({
+                    'upstream': upstream,
+                    'method': request.method,
+                    'path': parsed.path,
+                    'query': parsed.query,
+                    'status': response.status_code,
+                    'content_type': response.headers.get('Content-Type', 'application/json'),
+                    'body': body.decode('utf-8', 'replace'),
+                })
+
+
+def save_fixtures(path, api_config, responses):
+    """
+    Write recorded upstream responses for stub_servers.start_fixtures().
+
+    Only the upstream URLs of `api_config` are kept; API keys live in
+    environment variables and never in the file.
+    """
+    fixtures = {
+        'schema': 1,
+        'recorded': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'api_config': {key: api_config[key]
+                       for key in ('nse_base_url', 'forex_api_url', 'spot_sources')},
+        'responses': responses,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(fixtures, f, indent=1)
+
+
+def load_fixtures(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class RunProfiler:
+    """
+    Profile whatever runs inside `with RunProfiler(api_config) as profiler:`.
+
+    cProfile sees the calling thread only: time the fetch stage spends in
+    fan_out's worker threads shows up as waiting in the caller, and the
+    request timings say which upstream and which phase it went to. Shard
+    worker processes are not profiled.
+    """
+
+    def __init__(self, api_config, profile_config=None):
+        """
+        Args:
+            api_config: Resolved API_CONFIG, to name upstreams and record fixtures
+            profile_config: Overrides for config.PROFILE_CONFIG
+        """
+        self.profile_config = dict(config.PROFILE_CONFIG, **(profile_config or {}))
+        self.api_config = api_config
+        self.timer = RequestTimer(api_config, record=self.profile_config['record_fixtures'])
+        self.profile = cProfile.Profile()
+        self.seconds = None
+        self.peak = self.retained = 0
+        self.snapshot = None
+
+    def __enter__(self):
+        self.timer.install()
+        tracemalloc.start()
+        self._start = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        self.seconds = time.perf_counter() - self._start
+        self.retained, self.peak = tracemalloc.get_traced_memory()
+        self.snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self.timer.uninstall()
+
+    def functions(self):
+        """Top functions by cumulative time"""
+        stats = pstats.Stats(self.profile, stream=io.StringIO())
+        rows = []
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+            where = f"{os.path.basename(filename)}:{line}({name})" if line else name
+            rows.append({'function': where, 'calls': calls,
+                         'own_ms': round(own * 1000, 3),
+                         'cumulative_ms': round(cumulative * 1000, 3)})
+        rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+        return rows[:self.profile_config['top_functions']]
+
+    def allocations(self):
+        """Top source lines by bytes still allocated at the end of the run"""
+        snapshot = self.snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        return [{'where': f"{os.path.basename(stat.traceback[0].filename)}:"
+                          f"{stat.traceback[0].lineno}",
+                 'size_kib': round(stat.size / 1024, 1), 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:self.profile_config['top_allocations']]]
+
+    def report(self):
+        return {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'seconds': round(self.seconds, 4),
+            'requests': self.timer.requests,
+            'functions': self.functions(),
+            'alloc_peak_kib': round(self.peak / 1024, 1),
+            'alloc_retained_kib': round(self.retained / 1024, 1),
+            'allocations': self.allocations(),
+        }
+
+    def write(self, directory):
+        """
+        Save run.prof (for pstats, snakeviz...), profile.json and, when
+        recording, fixtures.json.
+
+        Returns:
+            The report written to profile.json
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.profile.dump_stats(os.path.join(directory, 'run.prof'))
+        report = self.report()
+        with open(os.path.join(directory, 'profile.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+        if self.timer.record:
+            save_fixtures(os.path.join(directory, 'fixtures.json'), self.api_config,
+                          self.timer.fixtures)
+        return report
+
+
+def print_report(report, functions=10):
+    print(f"\n🔬 Run took {report['seconds'] * 1000:.1f} ms, "
+          f"allocations peaked at {report['alloc_peak_kib']:.1f} KiB")
+    print(f"  {'upstream':<22} {'status':>6} {'dns':>7} {'connect':>8} {'tls':>7} "
+          f"{'ttfb':>8} {'download':>9} {'total':>8} ms")
+    for entry in report['requests']:
+        status = entry['status'] if entry['status'] is not None else entry['error']
+        print(f"  {entry['upstream']:<22} {status!s:>6} {entry['dns_ms']:7.1f} "
+              f"{entry['connect_ms']:8.1f} {entry['tls_ms']:7.1f} {entry['ttfb_ms']:8.1f} "
+              f"{entry['download_ms']:9.1f} {entry['total_ms']:8.1f}")
+    print(f"  {'cumulative ms':>13}  function")
+    for row in report['functions'][:functions]:
+        print(f"  {row['cumulative_ms']:13.1f}  {row['function']}")
+
+
+def profile_run(tracker, directory=None, profile_config=None):
+    """
+    One tracker.run() under RunProfiler, saved to `directory`.
+
+    Returns:
+        What tracker.run() returned
+    """
+    profiler = RunProfiler(tracker.api_config, profile_config)
+    directory = directory or profiler.profile_config['path']
+    with profiler:
+        result = tracker.run()
+    report = profiler.write(directory)
+    print_report(report)
+    print(f"💾 Profile written to {directory} (python -m pstats {os.path.join(directory, 'run.prof')})")
+    return result
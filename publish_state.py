@@ -0,0 +1,90 @@
+"""
+Change detection for Telegram publishing
+Remembers what was last sent so unchanged updates can be skipped or edited in place
+"""
+
+import json
+import os
+
+import config
+
+# Snapshot keys compared in percentage points rather than relative change
+POINT_KEYS = ('premium_discount', 'pChange')
+
+
+def build_snapshot(quotes, mcx_data, forex_data, metrics, market_open):
+    """Flatten the values a message shows into {key: value} for comparison"""
+    snapshot = {
+        'market_open': market_open,
+        'gold_usd_oz': mcx_data.gold_usd_oz,
+        'silver_usd_oz': mcx_data.silver_usd_oz,
+        'usd_inr': forex_data.usd_inr if forex_data else None,
+    }
+    for symbol in config.ETFS:
+        quote = quotes.get(symbol)
+        snapshot[f'{symbol}.ltp'] = quote.ltp if quote else None
+        snapshot[f'{symbol}.pChange'] = quote.pChange if quote else None
+        snapshot[f'{symbol}.volume'] = quote.volume if quote else None
+        snapshot[f'{symbol}.premium_discount'] = (metrics.get(symbol) or {}).get('premium_discount')
+    return snapshot
+
+
+def changed_keys(previous, current, price_epsilon_pct, point_epsilon):
+    """
+    Keys whose value moved beyond the epsilon since the previous snapshot.
+
+    Prices compare by relative change in percent, premium/discount and
+    percent change by absolute percentage points, everything else exactly.
+    """
+    changed = []
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, bool) or isinstance(old, bool) or value is None or old is None:
+            if value != old:
+                changed.append(key)
+        elif key.endswith(POINT_KEYS):
+            if abs(value - old) > point_epsilon:
+                changed.append(key)
+        elif old == 0:
+            if value != 0:
+                changed.append(key)
+        elif abs(value - old) / abs(old) * 100 > price_epsilon_pct:
+            changed.append(key)
+    return changed
+
+
+class PublishState:
+    """Last published snapshot and Telegram message id, persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshot = {}
+        self.message_id = None
+        self.chat_id = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable publish state {self.path}: {e}")
+            return
+        self.snapshot = state.get('snapshot', {})
+        self.message_id = state.get('message_id')
+        self.chat_id = state.get('chat_id')
+
+    def save(self, snapshot, chat_id, message_id):
+        self.snapshot = snapshot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write then rename so a crash never leaves half a file behind
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'snapshot': snapshot, 'chat_id': chat_id, 'message_id': message_id}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,324 @@
+"""
+Query API for ETF Tracker
+Local HTTP/JSON server for the latest snapshot and stored history, pre-serialized with ETags
+
+    GET /v1/etfs                      configured ETFs
+    GET /v1/latest                    every ETF plus spot, forex and analytics
+    GET /v1/latest/<SYMBOL>           one ETF
+    GET /v1/market                    spot prices, forex and gold/silver analytics
+    GET /v1/history/<SYMBOL>?start=&end=
+                                      stored ticks, start/end as ISO dates or
+                                      datetimes (IST if naive) or epoch ns;
+                                      defaults to today so far
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from urllib.parse import parse_qs
+
+import config
+from market_calendar import IST
+from storage import TimeSeriesStore, day_of, day_start_ns
+
+NS = 1_000_000_000
+DAY_NS = 86400 * NS
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+KEEP_ALIVE = b'Connection: keep-alive\r\n\r\n'
+CLOSE = b'Connection: close\r\n\r\n'
+
+
+def iso_time(ts_ns):
+    return datetime.fromtimestamp(ts_ns / NS, IST).isoformat(timespec='seconds')
+
+
+def parse_time(value):
+    """Epoch ns from digits, an ISO date (IST midnight) or an ISO datetime (IST if naive)"""
+    if value.isdigit():
+        return int(value)
+    if len(value) == 10:
+        return day_start_ns(date.fromisoformat(value))
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=IST)
+    return int(moment.timestamp() * 1_000_000) * 1000
+
+
+class Response:
+    """
+    A response serialized once: body, ETag and header bytes.
+
+    Handing out the same object to every request means a hit costs a dict
+    lookup and one socket write; the ETag lets clients revalidate for free.
+    """
+
+    __slots__ = ('status', 'body', 'etag', 'head', 'not_modified')
+
+    def __init__(self, status, payload):
+        self.status = status
+        self.body = json.dumps(payload, separators=(',', ':')).encode()
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=8).hexdigest()}"'
+        cache = (f"ETag: {self.etag}\r\nCache-Control: no-cache\r\n"
+                 if status == 200 else "Cache-Control: no-store\r\n")
+        self.head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(self.body)}\r\n{cache}").encode()
+        self.not_modified = (f"HTTP/1.1 304 Not Modified\r\nETag: {self.etag}\r\n"
+                             f"Cache-Control: no-cache\r\n").encode()
+
+    def matches(self, if_none_match):
+        """Whether an If-None-Match header names this response's ETag"""
+        if self.status != 200 or not if_none_match:
+            return False
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*' or tag.removeprefix('W/') == self.etag:
+                return True
+        return False
+
+
+def error(status, message):
+    return Response(status, {'error': message})
+
+
+NOT_FOUND = error(404, 'not found')
+NO_DATA = error(503, 'no snapshot yet')
+BAD_METHOD = error(405, 'only GET and HEAD are supported')
+BAD_REQUEST = error(400, 'malformed request')
+
+
+class QueryServer:
+    """
+    Read-only JSON API over the tracker's latest tick and history store.
+
+    publish() runs in the tracker after each tick and serializes every
+    latest-data response up front, then swaps the whole table in one
+    assignment, so the server thread never sees a half-built snapshot and
+    never serializes on a request. History ranges are read from the
+    memory-mapped store on first request and kept in a small LRU; ranges
+    ending before the last tick never change, and open-ended ones are
+    rebuilt once per tick. No request reaches NSE or any other upstream.
+    """
+
+    def __init__(self, store_root=None, etfs=None, query_config=None):
+        """
+        Args:
+            store_root: History store directory, STORAGE_CONFIG['path'] if None
+            etfs: ETF registry, config.ETFS if None
+            query_config: Overrides for config.QUERY_CONFIG
+        """
+        self.etfs = config.ETFS if etfs is None else etfs
+        self.query_config = dict(config.QUERY_CONFIG, **(query_config or {}))
+        self.store = TimeSeriesStore(store_root or config.STORAGE_CONFIG['path'])
+        self.static = {'/v1/etfs': Response(200, {'etfs': list(self.etfs.values())})}
+        # path -> Response for the latest tick, replaced whole by publish()
+        self.latest = {}
+        self.version = 0
+        self.published_ns = 0
+        # (symbol, start_ns, end_ns or None) -> (version or None, Response)
+        self.history = OrderedDict()
+        self.requests = 0
+        self.loop = None
+        self.thread = None
+        self.address = None
+
+    def publish(self, quotes, mcx_data, forex_data, metrics, analytics=None, ts_ns=None):
+        """
+        Serialize a tick's snapshot for the latest-data endpoints.
+
+        Args:
+            quotes: Dict of symbol -> records.Quote
+            mcx_data: records.SpotPrices
+            forex_data: records.FxRate, or None
+            metrics: Output of inav.calculate_metrics()
+            analytics: Output of Analytics.update(), or None
+            ts_ns: Tick time, now if None
+        """
+        ts_ns = time.time_ns() if ts_ns is None else ts_ns
+        stamp = {'ts_ns': ts_ns, 'time': iso_time(ts_ns)}
+        analytics = analytics or {}
+        etfs = {}
+        for symbol, etf in self.etfs.items():
+            quote = quotes.get(symbol)
+            entry = metrics.get(symbol) or {}
+            etfs[symbol] = {
+                'symbol': symbol,
+                'name': etf['name'],
+                'commodity': etf.get('commodity'),
+                'quote': quote.to_dict() if quote else None,
+                'inav': entry.get('inav'),
+                'premium_discount': entry.get('premium_discount'),
+                'analytics': analytics.get(symbol),
+            }
+        market = {
+            'gold_usd_oz': mcx_data.gold_usd_oz,
+            'silver_usd_oz': mcx_data.silver_usd_oz,
+            'usd_inr': forex_data.usd_inr if forex_data else None,
+            'analytics': analytics.get('MARKET'),
+        }
+        latest = {
+            '/v1/latest': Response(200, dict(stamp, etfs=etfs, market=market)),
+            '/v1/market': Response(200, dict(stamp, **market)),
+        }
+        for symbol, entry in etfs.items():
+            latest[f'/v1/latest/{symbol}'] = Response(200, dict(stamp, **entry))
+        self.latest = latest
+        self.published_ns = ts_ns
+        self.version += 1
+
+    def history_response(self, symbol, query):
+        try:
+            params = parse_qs(query)
+            start = params.get('start')
+            end = params.get('end')
+            now_ns = time.time_ns()
+            start_ns = parse_time(start[0]) if start else day_start_ns(
+                datetime.fromtimestamp(now_ns / NS, IST).date())
+            end_ns = parse_time(end[0]) if end else None
+            # The store names days by date; epochs past datetime's range fail here
+            day_of(start_ns)
+            day_of(end_ns if end_ns is not None else now_ns)
+        except (ValueError, OverflowError, OSError) as e:
+            return error(400, f'bad start/end: {e}')
+        if end_ns is not None and end_ns <= start_ns:
+            return error(400, 'end must be after start')
+        if (end_ns or now_ns) - start_ns > self.query_config['max_range_days'] * DAY_NS:
+            return error(400, f"range longer than {self.query_config['max_range_days']} days")
+
+        key = (symbol, start_ns, end_ns)
+        cached = self.history.get(key)
+        if cached is not None and cached[0] in (None, self.version):
+            self.history.move_to_end(key)
+            return cached[1]
+
+        # Ranges that end before the last published tick are final
+        version = None if end_ns is not None and end_ns <= self.published_ns else self.version
+        columns = {field: [] for field in self.store.fields}
+        timestamps = []
+        for piece in self.store.range(symbol, start_ns, end_ns or now_ns + DAY_NS):
+            timestamps.extend(piece.timestamps)
+            for field, column in zip(self.store.fields, piece.columns):
+                columns[field].extend(None if value != value else value for value in column)
+        response = Response(200, {'symbol': symbol, 'start_ns': start_ns, 'end_ns': end_ns,
+                                  'count': len(timestamps), 'ts_ns': timestamps,
+                                  'columns': columns})
+        self.history[key] = (version, response)
+        if len(self.history) > self.query_config['history_cache']:
+            self.history.popitem(last=False)
+        return response
+
+    def route(self, target):
+        """Response for a request target"""
+        path, _, query = target.partition('?')
+        path = path.rstrip('/') or '/'
+        response = self.static.get(path) or self.latest.get(path)
+        if response is not None:
+            return response
+        if path.startswith('/v1/latest') or path == '/v1/market':
+            return NOT_FOUND if self.version else NO_DATA
+        if path.startswith('/v1/history/'):
+            symbol = path[len('/v1/history/'):].upper()
+            if symbol not in self.etfs:
+                return NOT_FOUND
+            return self.history_response(symbol, query)
+        return NOT_FOUND
+
+    async def handle(self, reader, writer):
+        """One HTTP/1.1 connection, kept alive until the client closes it"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                parts = lines[0].split(' ')
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(':')
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                if len(parts) != 3:
+                    method, response = 'GET', BAD_REQUEST
+                elif parts[0] not in ('GET', 'HEAD'):
+                    method, response = parts[0], BAD_METHOD
+                else:
+                    method = parts[0]
+                    response = self.route(parts[1])
+                self.requests += 1
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = (response is not BAD_REQUEST and response is not BAD_METHOD
+                              and connection != 'close'
+                              and (parts[-1] != 'HTTP/1.0' or connection == 'keep-alive'))
+                tail = KEEP_ALIVE if keep_alive else CLOSE
+                if response.matches(headers.get('if-none-match')):
+                    writer.write(response.not_modified + tail)
+                elif method == 'HEAD':
+                    writer.write(response.head + tail)
+                else:
+                    writer.write(response.head + tail + response.body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def serve(self, host, port):
+        """
+        Serve from an event loop in a daemon thread.
+
+        Returns:
+            self, with `address` set to the bound (host, port)
+        """
+        ready = threading.Event()
+        failure = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                server = loop.run_until_complete(asyncio.start_server(self.handle, host, port))
+            except OSError as e:
+                failure.append(e)
+                ready.set()
+                loop.close()
+                return
+            self.loop = loop
+            self.address = server.sockets[0].getsockname()[:2]
+            ready.set()
+            try:
+                loop.run_forever()
+            finally:
+                server.close()
+                # Kept-alive connections would otherwise hold the loop open
+                tasks = asyncio.all_tasks(loop)
+                for task in tasks:
+                    task.cancel()
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+                loop.close()
+
+        self.thread = threading.Thread(target=run, name='query-server', daemon=True)
+        self.thread.start()
+        ready.wait()
+        if failure:
+            raise failure[0]
+        print(f"🔎 Query API at http://{self.address[0]}:{self.address[1]}/v1/latest")
+        return self
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+            self.loop = None
+        self.store.close()
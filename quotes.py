@@ -0,0 +1,192 @@
+"""
+Batch quote engine for ETF Tracker
+Fetches every ETF in config.ETFS from NSE bulk listings, one request per listing
+"""
+
+import time
+
+import config
+from pipeline import fan_out
+from records import Quote, loads, response_json, to_float
+
+# Bulk NSE endpoints that return many symbols in a single response.
+# 'etf' covers every listed ETF; any other listing name is treated as an
+# index for /api/equity-stockIndices.
+ETF_LISTING = 'etf'
+
+
+def parse_etf_row(row, ts_ns):
+    """Convert one /api/etf row into a Quote"""
+    get = row.get
+    return Quote(get('symbol'), to_float(get('ltP')), to_float(get('open')),
+                 to_float(get('high')), to_float(get('low')), None,
+                 to_float(get('prevClose')), to_float(get('chn')), to_float(get('per')),
+                 to_float(get('qty')), to_float(get('trdVal')), ts_ns)
+
+
+def parse_index_row(row, ts_ns):
+    """Convert one /api/equity-stockIndices row into a Quote"""
+    get = row.get
+    return Quote(get('symbol'), to_float(get('lastPrice')), to_float(get('open')),
+                 to_float(get('dayHigh')), to_float(get('dayLow')), None,
+                 to_float(get('previousClose')), to_float(get('change')),
+                 to_float(get('pChange')), to_float(get('totalTradedVolume')),
+                 to_float(get('totalTradedValue')), ts_ns)
+
+
+def listing_rows(body, symbols):
+    """Decode a bulk listing body and keep the rows for `symbols`"""
+    return [row for row in loads(body).get('data', []) if row.get('symbol') in symbols]
+
+
+def row_parser(listing):
+    """Row parser, callable(row, ts_ns) -> Quote, for a bulk listing"""
+    return parse_etf_row if listing == ETF_LISTING else parse_index_row
+
+
+def parse_rows(listing, rows, ts_ns):
+    """{symbol: Quote} for rows of one bulk listing"""
+    parse = row_parser(listing)
+    quotes = {}
+    for row in rows:
+        quote = parse(row, ts_ns)
+        quotes[quote.symbol] = quote
+    return quotes
+
+
+def fetch_quote(nse, symbol):
+    """Fetch one symbol from NSE quote-equity as a Quote, None on failure"""
+    try:
+        response = nse.get('/api/quote-equity', params={'symbol': symbol})
+
+        if response.status_code == 200:
+            data = response_json(response)
+            price_info = data.get('priceInfo', {})
+            high_low = price_info.get('intraDayHighLow', {})
+            order_book = data.get('marketDeptOrderBook', {})
+
+            return Quote(symbol,
+                         ltp=price_info.get('lastPrice'),
+                         open=price_info.get('open'),
+                         high=high_low.get('max'),
+                         low=high_low.get('min'),
+                         close=price_info.get('close'),
+                         prev_close=price_info.get('previousClose'),
+                         change=price_info.get('change'),
+                         pChange=price_info.get('pChange'),
+                         volume=order_book.get('totalTradedVolume'),
+                         value=order_book.get('totalTradedValue'),
+                         ts_ns=time.time_ns())
+    except Exception as e:
+        print(f"Error fetching NSE data for {symbol}: {e}")
+    return None
+
+
+class QuoteEngine:
+    """
+    Fetch quotes for every ETF in the registry with as few NSE requests as possible.
+
+    Symbols are grouped by the bulk listing they appear in (`nse_listing` on
+    the ETF entry, QUOTE_CONFIG['default_listing'] otherwise). Each listing is
+    a single request no matter how many symbols it covers, and listings are
+    fetched concurrently. Only rows for registry symbols are parsed, so a
+    shard of the registry only pays for its own symbols. Symbols missing
+    from their listing fall back to per-symbol quotes, also with bounded
+    concurrency.
+    """
+
+    def __init__(self, nse, fetch_symbol=None, etfs=None, quote_config=None):
+        """
+        Args:
+            nse: NSESession used for bulk requests
+            fetch_symbol: Optional callable(symbol) -> quote for the per-symbol fallback
+            etfs: ETF registry, defaults to config.ETFS
+            quote_config: Overrides for config.QUOTE_CONFIG
+        """
+        self.nse = nse
+        self.fetch_symbol = fetch_symbol
+        self.etfs = config.ETFS if etfs is None else etfs
+        self.quote_config = dict(config.QUOTE_CONFIG, **(quote_config or {}))
+        self.symbols = frozenset(self.etfs)
+
+    def plan_batches(self):
+        """Group the registry into {listing: [symbols]}"""
+        batches = {}
+        default_listing = self.quote_config['default_listing']
+        for symbol, etf in self.etfs.items():
+            listing = etf.get('nse_listing', default_listing)
+            batches.setdefault(listing, []).append(symbol)
+        return batches
+
+    def fetch_body(self, listing):
+        """
+        Fetch one bulk listing without decoding it.
+
+        Returns:
+            Tuple of (ts_ns, response body bytes), or None on failure
+        """
+        if listing == ETF_LISTING:
+            response = self.nse.get('/api/etf')
+        else:
+            response = self.nse.get('/api/equity-stockIndices', params={'index': listing})
+
+        if response.status_code != 200:
+            print(f"❌ NSE listing {listing} returned HTTP {response.status_code}")
+            return None
+        return time.time_ns(), response.content
+
+    def fetch_listing(self, listing):
+        """Fetch one bulk listing and return {symbol: Quote} for its registry rows"""
+        fetched = self.fetch_body(listing)
+        if fetched is None:
+            return {}
+        ts_ns, body = fetched
+        return parse_rows(listing, listing_rows(body, self.symbols), ts_ns)
+
+    def listing_jobs(self):
+        """Jobs for pipeline.fan_out, one per bulk listing"""
+        return {f"listing:{listing}": (self.fetch_listing, listing)
+                for listing in self.plan_batches()}
+
+    def body_jobs(self):
+        """Like listing_jobs(), but each job returns fetch_body() for decoding elsewhere"""
+        return {f"body:{listing}": (self.fetch_body, listing)
+                for listing in self.plan_batches()}
+
+    def collect(self, results):
+        """
+        Pick registry symbols out of fetched listings.
+
+        Args:
+            results: Output of fan_out over listing_jobs(), may contain other keys
+
+        Returns:
+            Tuple of ({symbol: quote}, [symbols still missing])
+        """
+        quotes = {}
+        missing = []
+        for listing, symbols in self.plan_batches().items():
+            rows = results.get(f"listing:{listing}") or {}
+            for symbol in symbols:
+                if symbol in rows:
+                    quotes[symbol] = rows[symbol]
+                else:
+                    missing.append(symbol)
+        return quotes, missing
+
+    def fetch_missing(self, symbols, deadline):
+        """Per-symbol fallback for symbols no listing covered"""
+        if not symbols or not self.fetch_symbol or not self.quote_config['fallback_to_quote']:
+            return {}
+        results = fan_out({symbol: (self.fetch_symbol, symbol) for symbol in symbols},
+                          deadline, max_workers=self.quote_config['max_concurrency'])
+        return {symbol: quote for symbol, quote in results.items() if quote}
+
+    def fetch(self, deadline):
+        """Fetch every registry symbol within `deadline` seconds"""
+        end = time.monotonic() + deadline
+        results = fan_out(self.listing_jobs(), deadline,
+                          max_workers=self.quote_config['max_concurrency'])
+        quotes, missing = self.collect(results)
+        quotes.update(self.fetch_missing(missing, end - time.monotonic()))
+        return quotes
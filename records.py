@@ -0,0 +1,118 @@
+"""
+Quote records for ETF Tracker
+Slotted NSE quotes, spot prices and FX rates with epoch-ns timestamps, decoded with orjson if installed
+"""
+
+import json
+
+NS = 1_000_000_000
+
+# Set on first use, so runs that never decode a response skip importing orjson
+_decode = None
+
+
+def decoder():
+    """orjson.loads if orjson is installed, json.loads otherwise"""
+    global _decode
+    if _decode is None:
+        try:
+            import orjson
+            _decode = orjson.loads
+        except ImportError:  # Optional, the standard library decoder is used instead
+            _decode = json.loads
+    return _decode
+
+
+def loads(data):
+    """Parse JSON from bytes or str"""
+    return (_decode or decoder())(data)
+
+
+def response_json(response):
+    """Parsed body of a requests response, without requests' charset sniffing"""
+    return loads(response.content)
+
+
+def to_float(value):
+    """Parse NSE numbers, which may arrive as strings with thousands separators"""
+    if value is None or value == '' or value == '-':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(str(value).replace(',', ''))
+    except ValueError:
+        return None
+
+
+class Quote:
+    """One NSE quote. Prices and volumes are floats or None, `ts_ns` is when it was fetched"""
+
+    __slots__ = ('symbol', 'ltp', 'open', 'high', 'low', 'close', 'prev_close', 'change',
+                 'pChange', 'volume', 'value', 'ts_ns')
+
+    def __init__(self, symbol, ltp=None, open=None, high=None, low=None, close=None,
+                 prev_close=None, change=None, pChange=None, volume=None, value=None, ts_ns=0):
+        self.symbol = symbol
+        self.ltp = ltp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.prev_close = prev_close
+        self.change = change
+        self.pChange = pChange
+        self.volume = volume
+        self.value = value
+        self.ts_ns = ts_ns
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __reduce__(self):
+        # Pickled as constructor arguments, which unpickle about twice as fast
+        # as slot state; shard workers send quotes this way
+        return Quote, (self.symbol, self.ltp, self.open, self.high, self.low, self.close,
+                       self.prev_close, self.change, self.pChange, self.volume, self.value,
+                       self.ts_ns)
+
+    def __repr__(self):
+        return f"Quote({self.symbol}, ltp={self.ltp}, volume={self.volume})"
+
+
+class SpotPrices:
+    """International spot prices in USD per troy oz for one tick"""
+
+    __slots__ = ('gold_usd_oz', 'silver_usd_oz', 'ts_ns')
+
+    def __init__(self, gold_usd_oz=None, silver_usd_oz=None, ts_ns=0):
+        self.gold_usd_oz = gold_usd_oz
+        self.silver_usd_oz = silver_usd_oz
+        self.ts_ns = ts_ns
+
+    def price(self, commodity):
+        """Spot price for a config.ETFS commodity, None if there is none"""
+        if commodity == 'gold':
+            return self.gold_usd_oz
+        if commodity == 'silver':
+            return self.silver_usd_oz
+        return None
+
+
+class FxRate:
+    """USD/INR rate; `ts_ns` is the provider's last update"""
+
+    __slots__ = ('usd_inr', 'ts_ns')
+
+    def __init__(self, usd_inr, ts_ns=0):
+        self.usd_inr = usd_inr
+        self.ts_ns = ts_ns
+
+    @classmethod
+    def from_cached(cls, value):
+        """From the JSON-friendly dict kept in the TTL cache, None if there is none"""
+        if not value:
+            return None
+        return cls(value['usd_inr'], int(value.get('timestamp') or 0) * NS)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Historical replay for ETF Tracker
+Runs stored or imported quotes, spot prices and FX through the live iNAV and alert code
+
+    python replay.py import quotes.csv            # or .parquet, into the history store
+    python replay.py run --start 2025-01-01 --workers 4 --alerts tuned.json
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import config
+from alerts import AlertEngine, alert_values, rules_from_config
+from analytics import Analytics
+from inav import calculate_metrics
+from market_calendar import IST
+from records import NS, FxRate, Quote, SpotPrices, to_float
+from storage import TimeSeriesStore, day_of
+
+# Columns read from imports; iNAV and premium/discount are always recomputed
+IMPORT_FIELDS = ('ltp', 'volume', 'spot_usd_oz', 'usd_inr')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def parse_timestamp(value):
+    """Epoch ns from a datetime, an ISO 8601 string (naive = IST), epoch seconds or epoch ns"""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=IST)
+        delta = value - EPOCH
+        return (delta.days * 86400 + delta.seconds) * NS + delta.microseconds * 1000
+    # Nanosecond epochs are 19 digits, second epochs 10
+    return int(value) if abs(value) >= 1e15 else int(round(value * NS))
+
+
+def read_rows(path, batch_rows=100_000):
+    """Yield row dicts from a CSV file, or a Parquet file in batches (needs pyarrow)"""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet needs pyarrow: pip install pyarrow") from None
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+            yield from batch.to_pylist()
+        return
+    with open(path, newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def import_file(path, store, batch_rows=100_000):
+    """
+    Append a CSV or Parquet export of quotes to a TimeSeriesStore.
+
+    Columns are `timestamp`, `symbol`, `ltp` and optionally `volume`,
+    `spot_usd_oz` (of the ETF's commodity) and `usd_inr`, one row per symbol
+    per tick, in time order. Rows are streamed, so memory stays flat
+    whatever the file size. Days the store already has for a symbol are
+    skipped rather than mixed into, as are rows out of time order.
+
+    Returns:
+        Dict with the number of rows 'imported' and 'skipped'
+    """
+    writable = {}
+    last_ts = {}
+    imported = skipped = 0
+    for row in read_rows(path, batch_rows):
+        symbol = row['symbol']
+        ts_ns = parse_timestamp(row['timestamp'])
+        key = (symbol, day_of(ts_ns))
+        allowed = writable.get(key)
+        if allowed is None:
+            allowed = writable[key] = not os.path.exists(store.path(*key))
+            if not allowed:
+                print(f"⚠️  {symbol} {key[1]} is already stored, skipping it")
+        if not allowed or ts_ns < last_ts.get(symbol, ts_ns):
+            skipped += 1
+            continue
+        last_ts[symbol] = ts_ns
+        store.append(symbol, ts_ns, {field: to_float(row.get(field)) for field in IMPORT_FIELDS})
+        imported += 1
+    store.close()
+    return {'imported': imported, 'skipped': skipped}
+
+
+def day_ticks(store, etfs, day):
+    """
+    Yield (ts_ns, quotes, SpotPrices, FxRate or None) for one stored day.
+
+    Symbols are merged by timestamp. Columns are read straight from the
+    mapped day files, one day at a time, so memory is bounded by a day.
+    """
+    streams = []
+    for order, symbol in enumerate(etfs):
+        part = store.day(symbol, day)
+        if part is None:
+            continue
+        columns = (symbol, etfs[symbol].get('commodity'), part.column('ltp'),
+                   part.column('volume'), part.column('spot_usd_oz'), part.column('usd_inr'))
+        streams.append([(ts_ns, order, i, columns) for i, ts_ns in enumerate(part.timestamps)])
+
+    ts_ns = None
+    for next_ts, _, i, (symbol, commodity, ltp, volume, spot, usd_inr) in heapq.merge(*streams):
+        if next_ts != ts_ns:
+            if ts_ns is not None:
+                yield ts_ns, quotes, SpotPrices(gold, silver, ts_ns), fx
+            ts_ns = next_ts
+            quotes = {}
+            gold = silver = fx = None
+        # NaN marks a missing value in the store
+        price = ltp[i]
+        traded = volume[i]
+        quotes[symbol] = Quote(symbol, ltp=price if price == price else None,
+                               volume=traded if traded == traded else None, ts_ns=ts_ns)
+        price = spot[i]
+        if price == price:
+            if commodity == 'gold':
+                gold = price
+            elif commodity == 'silver':
+                silver = price
+        rate = usd_inr[i]
+        if rate == rate:
+            fx = FxRate(rate, ts_ns)
+    if ts_ns is not None:
+        yield ts_ns, quotes, SpotPrices(gold, silver, ts_ns), fx
+
+
+class Replay:
+    """
+    Feed historical ticks through the live iNAV and alert code.
+
+    Each tick goes through inav.calculate_metrics, analytics.Analytics and
+    alerts.alert_values into an AlertEngine built by rules_from_config, the
+    same calls a live run makes, so a replay shows what a given
+    ALERT_CONFIG would have sent, z-score rules included.
+    """
+
+    def __init__(self, etfs=None, alert_config=None):
+        self.etfs = config.ETFS if etfs is None else etfs
+        self.engine = AlertEngine(rules_from_config(alert_config, self.etfs))
+        self.analytics = Analytics(self.etfs)
+        self.ticks = 0
+        # (ts_ns, rule_id, value) in time order
+        self.fired = []
+        # symbol -> [count, sum, min, max] of premium/discount
+        self.premium = {}
+
+    def tick(self, ts_ns, quotes, mcx_data, forex_data, record=True):
+        """Process one tick. Without `record` only the alert and analytics state moves, for warm-up"""
+        metrics = calculate_metrics(self.etfs, quotes, mcx_data, forex_data)
+        analytics = self.analytics.update(ts_ns, quotes, mcx_data, metrics)
+        fired = self.engine.evaluate(
+            alert_values(self.engine, quotes, metrics, mcx_data, forex_data, analytics))
+        if not record:
+            return
+        self.ticks += 1
+        for rule, value in fired:
+            self.fired.append((ts_ns, rule.rule_id, value))
+        for symbol, entry in metrics.items():
+            premium = entry['premium_discount']
+            if premium is None:
+                continue
+            stats = self.premium.get(symbol)
+            if stats is None:
+                self.premium[symbol] = [1, premium, premium, premium]
+            else:
+                stats[0] += 1
+                stats[1] += premium
+                if premium < stats[2]:
+                    stats[2] = premium
+                if premium > stats[3]:
+                    stats[3] = premium
+
+    def partial(self):
+        return {'ticks': self.ticks, 'fired': self.fired, 'premium': self.premium}
+
+
+def replay_days(root, days, warmup=(), etfs=None, alert_config=None):
+    """
+    Replay stored days in order; `warmup` days first only prime the alert state.
+
+    Module level so ProcessPoolExecutor workers can run it.
+    """
+    store = TimeSeriesStore(root)
+    replay = Replay(etfs, alert_config)
+    for record, group in ((False, warmup), (True, days)):
+        for day in group:
+            for tick in day_ticks(store, replay.etfs, day):
+                replay.tick(*tick, record=record)
+    return replay.partial()
+
+
+def merge(partials):
+    """Combine replay_days() results of consecutive ranges into one report"""
+    ticks = 0
+    fired = []
+    premium = {}
+    for part in partials:
+        ticks += part['ticks']
+        fired.extend(part['fired'])
+        for symbol, (count, total, low, high) in part['premium'].items():
+            stats = premium.setdefault(symbol, [0, 0.0, low, high])
+            stats[0] += count
+            stats[1] += total
+            stats[2] = min(stats[2], low)
+            stats[3] = max(stats[3], high)
+
+    per_rule = {}
+    for _, rule_id, _ in fired:
+        per_rule[rule_id] = per_rule.get(rule_id, 0) + 1
+    return {
+        'ticks': ticks,
+        'alerts': len(fired),
+        'alerts_per_rule': dict(sorted(per_rule.items())),
+        'fired': fired,
+        'premium_discount': {
+            symbol: {'ticks': count, 'mean': total / count, 'min': low, 'max': high}
+            for symbol, (count, total, low, high) in premium.items()
+        },
+    }
+
+
+def run(root, start=None, end=None, workers=1, warmup_days=1, etfs=None, alert_config=None):
+    """
+    Replay stored history between two days.
+
+    With several workers the days are split into consecutive ranges, one
+    process each. Every range, the first included, primes its alert state
+    with the `warmup_days` stored days before it, so a range starts with
+    the same previous values and re-arm state a continuous run would have,
+    except for rules still disarmed from before the warm-up.
+
+    Args:
+        root: TimeSeriesStore root, e.g. STORAGE_CONFIG['path']
+        start: First day to replay, ISO date string, or None for the first stored day
+        end: Day to stop before (exclusive), ISO date string, or None for no end
+        workers: Worker processes
+        warmup_days: Stored days replayed before each range without reporting
+        etfs: ETF registry, config.ETFS if None
+        alert_config: Overrides for config.ALERT_CONFIG, e.g. thresholds to try
+
+    Returns:
+        Report dict from merge()
+    """
+    etfs = config.ETFS if etfs is None else etfs
+    store = TimeSeriesStore(root)
+    stored = sorted({day for symbol in etfs for day in store.days(symbol)})
+    days = [day for day in stored if (start is None or day >= start) and (end is None or day < end)]
+    if not days:
+        return merge([])
+    first = stored.index(days[0])
+
+    workers = max(1, min(workers, len(days)))
+    size = -(-len(days) // workers)
+    jobs = []
+    for offset in range(0, len(days), size):
+        index = first + offset
+        jobs.append((root, days[offset:offset + size],
+                     stored[max(0, index - warmup_days):index], etfs, alert_config))
+
+    if len(jobs) == 1:
+        return merge([replay_days(*jobs[0])])
+    # Spawned workers; results come back in range order
+    with ProcessPoolExecutor(len(jobs), mp_context=multiprocessing.get_context('spawn')) as pool:
+        return merge(pool.map(replay_days, *zip(*jobs)))
+
+
+def print_report(report, elapsed):
+    print(f"⏪ Replayed {report['ticks']} ticks in {elapsed:.2f}s "
+          f"({report['ticks'] / elapsed if elapsed else 0:,.0f} ticks/s)")
+    for symbol, stats in report['premium_discount'].items():
+        print(f"  {symbol}: premium/discount mean {stats['mean']:+.3f}%, "
+              f"range {stats['min']:+.3f}% to {stats['max']:+.3f}%")
+    print(f"🚨 {report['alerts']} alert(s) would have fired")
+    for rule_id, count in report['alerts_per_rule'].items():
+        print(f"  {count:6d}  {rule_id}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ETF Tracker historical import and replay")
+    parser.add_argument('--store', default=config.STORAGE_CONFIG['path'],
+                        help="time-series store root (default STORAGE_CONFIG['path'])")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help="append a CSV or Parquet export to the store")
+    importer.add_argument('path')
+
+    replayer = commands.add_parser('run', help="replay stored days through iNAV and alerts")
+    replayer.add_argument('--start', help="first day, YYYY-MM-DD")
+    replayer.add_argument('--end', help="day to stop before, YYYY-MM-DD")
+    replayer.add_argument('--workers', type=int, default=1, help="worker processes")
+    replayer.add_argument('--warmup-days', type=int, default=1,
+                          help="stored days before each range that only prime alert state")
+    replayer.add_argument('--alerts', metavar='PATH',
+                          help="JSON file of ALERT_CONFIG overrides to try")
+    replayer.add_argument('--json', metavar='PATH', help="write the report, with every alert")
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        started = time.perf_counter()
+        try:
+            counts = import_file(args.path, TimeSeriesStore(args.store))
+        except ImportError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"📥 Imported {counts['imported']} rows ({counts['skipped']} skipped) "
+              f"in {time.perf_counter() - started:.2f}s")
+        return 0
+
+    alert_config = None
+    if args.alerts:
+        with open(args.alerts) as f:
+            alert_config = json.load(f)
+    started = time.perf_counter()
+    report = run(args.store, args.start, args.end, args.workers, args.warmup_days,
+                 alert_config=alert_config)
+    print_report(report, time.perf_counter() - started)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
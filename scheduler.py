@@ -0,0 +1,139 @@
+"""
+In-process scheduler for ETF Tracker daemon mode
+Runs ticks on a grid aligned to market hours, keeping sessions and caches warm
+"""
+
+import math
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+
+
+class Scheduler:
+    """
+    Drive ETFTracker ticks from a long-running process.
+
+    Sessions come from the tracker's MarketCalendar, so weekends and NSE
+    holidays are skipped. While the market is open, ticks land on a grid of
+    `open_interval` seconds counted from the open, plus one final tick at
+    the close. Ticks that fall on a `publish_interval` boundary, and the
+    open and close ticks, also send the Telegram message; the others only
+    fetch and record history. While the market is closed the scheduler
+    sleeps until the next open, or ticks every `closed_interval` seconds if
+    that is set.
+
+    If the process wakes up late (suspend, a slow tick) and misses grid
+    points, it runs a single catch-up tick and realigns to the grid.
+    """
+
+    def __init__(self, tracker, daemon_config=None, clock=None):
+        """
+        Args:
+            tracker: ETFTracker to drive
+            daemon_config: Overrides for config.DAEMON_CONFIG
+            clock: Optional callable returning the current aware datetime
+        """
+        self.tracker = tracker
+        self.calendar = tracker.calendar
+        self.daemon_config = dict(config.DAEMON_CONFIG, **(daemon_config or {}))
+        self.tz = tracker.ist
+        self.clock = clock or (lambda: datetime.now(self.tz))
+        self.open_interval = timedelta(seconds=self.daemon_config['open_interval'])
+        self.publish_interval = timedelta(seconds=self.daemon_config['publish_interval'])
+        closed_interval = self.daemon_config['closed_interval']
+        self.closed_interval = timedelta(seconds=closed_interval) if closed_interval else None
+        self._stop = threading.Event()
+
+    def next_tick(self, now):
+        """
+        First scheduled tick at or after `now`.
+
+        Returns:
+            Tuple of (tick datetime, whether that tick publishes to Telegram)
+        """
+        session = self.calendar.session_at(now)
+        if session:
+            market_open, market_close = session
+            steps = math.ceil((now - market_open) / self.open_interval)
+            tick = min(market_open + steps * self.open_interval, market_close)
+            return tick, self.is_publish_tick(tick, market_open, market_close)
+
+        tick = self.calendar.next_open(now)
+        if self.closed_interval:
+            epoch = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            steps = math.ceil((now - epoch) / self.closed_interval)
+            tick = min(tick, epoch + steps * self.closed_interval)
+        return tick, True
+
+    def is_publish_tick(self, tick, market_open, market_close):
+        if tick in (market_open, market_close):
+            return True
+        return (tick - market_open) % self.publish_interval == timedelta(0)
+
+    def publish_missed(self, missed_from, now):
+        """Whether any publish tick fell in [missed_from, now)"""
+        tick, publish = self.next_tick(missed_from)
+        while tick < now:
+            if publish:
+                return True
+            tick, publish = self.next_tick(tick + timedelta(microseconds=1))
+        return False
+
+    def tick(self, publish):
+        try:
+            self.tracker.run(publish=publish)
+        except Exception as e:
+            print(f"❌ Tick failed: {e}")
+
+    def stop(self, *args):
+        """Ask the loop to exit after the current tick"""
+        if not self._stop.is_set():
+            print("🛑 Stopping ETF Tracker daemon...")
+        self._stop.set()
+
+    def sleep_until(self, when):
+        # Wake at least once a minute so wall-clock jumps are noticed
+        while not self._stop.is_set():
+            remaining = (when - self.clock()).total_seconds()
+            if remaining <= 0:
+                return
+            self._stop.wait(min(remaining, 60))
+
+    def run_forever(self):
+        """Tick until stop() is called or SIGINT/SIGTERM arrives"""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        grace = timedelta(seconds=self.daemon_config['catch_up_grace'])
+        print("🕒 ETF Tracker daemon started")
+        due, publish = self.next_tick(self.clock())
+        while not self._stop.is_set():
+            self.sleep_until(due)
+            if self._stop.is_set():
+                break
+
+            now = self.clock()
+            catching_up = now - due > grace
+            if catching_up:
+                print(f"⏩ Missed tick at {due.strftime('%H:%M:%S')}, catching up")
+                publish = publish or self.publish_missed(due, now)
+
+            started = time.monotonic()
+            self.tick(publish)
+            print(f"⏱️  Tick took {time.monotonic() - started:.2f}s, "
+                  f"{'published' if publish else 'recorded'}")
+
+            if catching_up:
+                # One catch-up tick covers everything missed, then realign
+                due, publish = self.next_tick(self.clock())
+            else:
+                # May already be in the past if the tick overran, which the
+                # next iteration treats as a missed tick
+                due, publish = self.next_tick(due + timedelta(microseconds=1))
+
+        self.tracker.close()
+        print("✅ ETF Tracker daemon stopped")
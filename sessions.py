@@ -0,0 +1,88 @@
+"""
+Pooled HTTP sessions for ETF Tracker
+Keeps connections to every upstream alive across requests and NSE cookies warm
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+NSE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'application/json',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+def create_pooled_session(pool_size=10):
+    """Create a requests.Session with a keep-alive pool large enough for the fetch stage"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.hooks['response'].append(metrics.record_response)
+    return session
+
+
+class NSESession:
+    """
+    Shared NSE session that primes cookies once and reuses the connection.
+
+    The home page GET that hands out NSE's anti-bot cookies is only repeated
+    when the cookies expire, `cookie_max_age` passes or NSE answers 401/403.
+    """
+
+    def __init__(self, base_url, timeout=10, cookie_max_age=600, pool_size=10):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cookie_max_age = cookie_max_age
+        self.session = create_pooled_session(pool_size)
+        self.session.headers.update(NSE_HEADERS)
+        self._lock = threading.Lock()
+        self._primed_at = None
+        # Bumped on every priming so concurrent 401s trigger a single refresh
+        self._generation = 0
+
+    def _cookies_valid(self):
+        if self._primed_at is None:
+            return False
+        if time.monotonic() - self._primed_at > self.cookie_max_age:
+            return False
+        return not any(cookie.is_expired() for cookie in self.session.cookies)
+
+    def prime(self, stale_generation=None):
+        """
+        Fetch fresh cookies from the NSE home page if needed.
+
+        Args:
+            stale_generation: Generation that was rejected by NSE. Cookies are
+                refreshed only if nobody refreshed them since.
+        """
+        with self._lock:
+            if stale_generation is None:
+                if self._cookies_valid():
+                    return
+            elif stale_generation != self._generation:
+                return
+
+            self.session.cookies.clear()
+            self.session.get(self.base_url, timeout=self.timeout)
+            self._primed_at = time.monotonic()
+            self._generation += 1
+
+    def get(self, path, params=None):
+        """GET an NSE API path, refreshing cookies once if NSE rejects them"""
+        self.prime()
+        generation = self._generation
+        url = f"{self.base_url}{path}"
+
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        if response.status_code in (401, 403):
+            metrics.inc('etf_retries', component='nse')
+            self.prime(stale_generation=generation)
+            response = self.session.get(url, params=params, timeout=self.timeout)
+        return response
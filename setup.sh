@@ -39,6 +39,8 @@ pip install --upgrade pip
 pip install -r requirements.txt
 
 echo -e "${GREEN}✅ Dependencies installed${NC}"
+echo "Optional: pip install -r requirements-optional.txt for numpy (backfills),"
+echo "orjson (faster JSON) and pyarrow (Parquet replay imports)"
 
 # Copy .env.example to .env if it doesn't exist
 if [ ! -f .env ]; then
@@ -0,0 +1,255 @@
+"""
+Sharded quote polling for ETF Tracker
+Spreads config.ETFS over worker processes by consistent hashing; each decodes, parses and prices its share of the listings
+and answers with what changed since its last reply
+"""
+
+import bisect
+import hashlib
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+from multiprocessing.reduction import ForkingPickler
+
+import config
+from inav import calculate_metrics
+
+
+def ring_hash(key):
+    """Stable 64-bit hash; hash() is salted per process, so it cannot be shared"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring over shard numbers.
+
+    Every shard is placed on the ring `virtual_nodes` times and a symbol
+    belongs to the first shard point after its own hash. Changing the number
+    of shards therefore only moves the symbols next to the points that were
+    added or removed, about 1/N of them, and every process computes the same
+    assignment.
+    """
+
+    def __init__(self, shards, virtual_nodes=64):
+        points = sorted((ring_hash(f"shard-{shard}#{node}"), shard)
+                        for shard in range(shards) for node in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def owner(self, key):
+        """Shard number owning `key`"""
+        index = bisect.bisect(self.hashes, ring_hash(key))
+        return self.shards[index % len(self.shards)]
+
+    def assign(self, etfs):
+        """Split a registry into {shard: {symbol: etf}}, keeping registry order"""
+        parts = {}
+        for symbol, etf in etfs.items():
+            parts.setdefault(self.owner(symbol), {})[symbol] = etf
+        return parts
+
+
+def run_worker(shard, etfs, conn):
+    """
+    Worker process loop.
+
+    Per tick the aggregator sends (seq, {shard: applied_seq}, {listing:
+    (ts_ns, body)}, SpotPrices, FxRate) with the raw listing bodies. The
+    worker decodes them, keeps the rows of its own symbols, parses the rows
+    that changed since its last reply and computes iNAV. When the aggregator
+    applied that last reply (applied_seq matches) only changed quotes and
+    metrics are sent back, otherwise all of them, as
+    (seq, full, quotes, metrics, [its symbols no listing had], cpu_seconds).
+    None stops the worker.
+    """
+    from quotes import listing_rows, row_parser
+
+    symbols = frozenset(etfs)
+    sent_seq = None
+    rows = {}
+    quotes = {}
+    metrics = {}
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            seq, applied, bodies, mcx_data, forex_data = message
+            started = time.process_time()
+            full = applied.get(shard) != sent_seq
+            if full:
+                rows, quotes, metrics = {}, {}, {}
+            changed_quotes = {}
+            changed_metrics = {}
+            try:
+                seen = {}
+                for listing, (ts_ns, body) in bodies.items():
+                    parse = row_parser(listing)
+                    for row in listing_rows(body, symbols):
+                        symbol = row.get('symbol')
+                        seen[symbol] = row
+                        if rows.get(symbol) != row:
+                            changed_quotes[symbol] = parse(row, ts_ns)
+                quotes = {symbol: changed_quotes.get(symbol) or quotes[symbol] for symbol in seen}
+                rows = seen
+                current = calculate_metrics(etfs, quotes, mcx_data, forex_data)
+                changed_metrics = {symbol: values for symbol, values in current.items()
+                                   if metrics.get(symbol) != values}
+                metrics = current
+            except Exception as e:
+                print(f"❌ Shard {shard} failed: {e}")
+                # Start over, the aggregator drops this shard's records too
+                full, changed_quotes, changed_metrics = True, {}, {}
+                rows, quotes, metrics = {}, {}, {}
+            missing = [symbol for symbol in etfs if symbol not in quotes]
+            conn.send((seq, full, changed_quotes, changed_metrics, missing,
+                       time.process_time() - started))
+            sent_seq = seq
+    except (EOFError, KeyboardInterrupt):
+        pass
+
+
+class ShardedPoller:
+    """
+    Decode, parse and price config.ETFS in a pool of worker processes.
+
+    Symbols are consistently hashed over SHARD_CONFIG['workers'] processes.
+    The tracker fetches each bulk listing once per tick, as in one process,
+    and process() hands the undecoded bodies to every worker with the tick's
+    market data. Each worker decodes them, keeps its own symbols' rows,
+    turns them into slotted Quotes and runs the iNAV math, so NSE still sees
+    one request per listing per tick.
+
+    Unpickling every record in the parent would cost about as much as
+    parsing them, so workers only send the quotes and metrics that changed
+    since the reply the parent last applied from them. The parent keeps
+    each shard's records and patches them; unchanged symbols keep the
+    previous tick's Quote (with this tick's ts_ns) and metrics dict. A
+    restarted worker, or one whose reply missed a deadline, sees that the
+    parent's applied seq is not its own and sends everything again.
+    """
+
+    def __init__(self, etfs=None, shard_config=None):
+        """
+        Args:
+            etfs: ETF registry, config.ETFS if None
+            shard_config: Overrides for config.SHARD_CONFIG
+        """
+        self.etfs = config.ETFS if etfs is None else etfs
+        self.shard_config = dict(config.SHARD_CONFIG, **(shard_config or {}))
+        self.ring = HashRing(self.shard_config['workers'], self.shard_config['virtual_nodes'])
+        self.shards = self.ring.assign(self.etfs)
+        # Spawned rather than forked: the parent holds sessions and cache threads
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = {}
+        self.seq = 0
+        # Per shard: (seq of the last reply applied, {symbol: Quote}, {symbol: metrics})
+        self.applied = {shard: (None, {}, {}) for shard in self.shards}
+        default_listing = config.QUOTE_CONFIG['default_listing']
+        self.listings = {symbol: etf.get('nse_listing', default_listing)
+                         for symbol, etf in self.etfs.items()}
+        # Worker CPU seconds spent on the last tick, per shard
+        self.cpu = {}
+        for shard in self.shards:
+            self.start_worker(shard)
+        print(f"🧩 Parsing {len(self.etfs)} ETFs in {len(self.shards)} worker processes")
+
+    def start_worker(self, shard):
+        parent, child = self.context.Pipe()
+        process = self.context.Process(
+            target=run_worker, name=f"etf-shard-{shard}", daemon=True,
+            args=(shard, self.shards[shard], child))
+        process.start()
+        child.close()
+        self.workers[shard] = (process, parent)
+
+    def process(self, bodies, mcx_data, forex_data, deadline):
+        """
+        Decode, parse and price one tick's listings in the workers.
+
+        Args:
+            bodies: Dict of listing -> (ts_ns, body), from QuoteEngine.fetch_body()
+            mcx_data: records.SpotPrices
+            forex_data: records.FxRate, or None
+            deadline: Seconds to wait for the workers
+
+        Returns:
+            Tuple of ({symbol: Quote}, {symbol: metrics}, [symbols no listing
+            had]) for the shards that answered in time
+        """
+        self.seq += 1
+        seq = self.seq
+        # Every worker gets the same message, so it is pickled once
+        applied = {shard: state[0] for shard, state in self.applied.items()}
+        payload = ForkingPickler.dumps((seq, applied, bodies, mcx_data, forex_data))
+        pending = {}
+        for shard in list(self.workers):
+            process, conn = self.workers[shard]
+            try:
+                conn.send_bytes(payload)
+            except OSError:
+                # The pipe breaks when the worker exits
+                print(f"🔁 Shard {shard} worker exited, restarting it")
+                conn.close()
+                process.join(timeout=1)
+                self.start_worker(shard)
+                process, conn = self.workers[shard]
+                try:
+                    conn.send_bytes(payload)
+                except OSError as e:
+                    print(f"❌ Shard {shard} unreachable: {e}")
+                    continue
+            pending[conn] = shard
+
+        quotes = {}
+        metrics = {}
+        missing = []
+        fetched = {listing: ts_ns for listing, (ts_ns, _) in bodies.items()}
+        self.cpu = {}
+        end = time.monotonic() + deadline + self.shard_config['reply_grace']
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            for conn in wait(list(pending), timeout=remaining):
+                try:
+                    reply_seq, full, changed_quotes, changed_metrics, shard_missing, cpu = conn.recv()
+                except (EOFError, OSError):
+                    print(f"❌ Shard {pending.pop(conn)} worker died")
+                    continue
+                # A late answer to an earlier tick; this tick's follows it
+                if reply_seq != seq:
+                    continue
+                shard = pending.pop(conn)
+                self.cpu[shard] = cpu
+                _, shard_quotes, shard_metrics = self.applied[shard]
+                if full:
+                    shard_quotes, shard_metrics = {}, {}
+                for symbol in shard_missing:
+                    shard_quotes.pop(symbol, None)
+                for symbol, quote in shard_quotes.items():
+                    quote.ts_ns = fetched[self.listings[symbol]]
+                shard_quotes.update(changed_quotes)
+                shard_metrics.update(changed_metrics)
+                self.applied[shard] = (seq, shard_quotes, shard_metrics)
+                quotes.update(shard_quotes)
+                metrics.update(shard_metrics)
+                missing.extend(shard_missing)
+
+        for shard in sorted(pending.values()):
+            print(f"⏱️  Shard {shard} missed the {deadline}s deadline")
+        return quotes, metrics, missing
+
+    def close(self):
+        for process, conn in self.workers.values():
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process, conn in self.workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self.workers = {}
@@ -0,0 +1,173 @@
+"""
+Single-flight runs for ETF Tracker
+Overlapping triggers share one fetch and publish per window through a SQLite lease
+"""
+
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import config
+
+RUNNING = 'running'
+DONE = 'done'
+
+# Leases older than this are deleted when a new one is taken
+KEEP_SECONDS = 7 * 86400
+
+
+def window_key(now, window, anchor='09:15', scope='run'):
+    """
+    Key of the window `now` falls in, e.g. 'run:2026-03-02T09:45'.
+
+    Windows are `window` seconds long and counted from `anchor` (local time
+    of `now`) each day, so a trigger that is late by less than a window
+    still lands in the window it was scheduled for.
+    """
+    hour, minute = map(int, anchor.split(':'))
+    start = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    elapsed = (now - start).total_seconds()
+    window_start = start + timedelta(seconds=elapsed // window * window)
+    return f"{scope}:{window_start:%Y-%m-%dT%H:%M}"
+
+
+class SingleFlight:
+    """
+    At most one run per key, across processes sharing the SQLite file.
+
+    The first run takes a lease on the key and marks it done when it
+    finishes. A run that finds the lease taken waits for the running one
+    and then stands down, so overlapping triggers cause one set of upstream
+    fetches and one Telegram publish. A lease not finished within
+    `lease_ttl` seconds is treated as crashed and can be taken over, and a
+    run that fails gives its lease back so a later trigger can retry.
+    """
+
+    def __init__(self, path, lease_ttl=120, wait=60, poll_interval=0.5, owner=None,
+                 clock=time.time):
+        """
+        Args:
+            path: SQLite file, shared by every run that should be deduplicated
+            lease_ttl: Seconds before a running lease counts as abandoned
+            wait: Seconds a duplicate run waits for the running one to finish
+            poll_interval: Seconds between checks while waiting
+            owner: Name recorded on the lease, unique per instance by default
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lease_ttl = lease_ttl
+        self.wait = wait
+        self.poll_interval = poll_interval
+        # PIDs repeat across containers and reboots, so add a random suffix
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{os.urandom(3).hex()}"
+        self.clock = clock
+        # Transactions are explicit, so BEGIN IMMEDIATE serializes takers
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS leases ('
+            'key TEXT PRIMARY KEY, owner TEXT NOT NULL, state TEXT NOT NULL, '
+            'trigger TEXT, acquired_at REAL NOT NULL, expires_at REAL NOT NULL)')
+
+    def try_acquire(self, key, trigger=None):
+        """
+        One attempt at the lease.
+
+        Returns:
+            Tuple of (acquired, state, owner, trigger), the last three
+            describing the holder when not acquired
+        """
+        now = self.clock()
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._conn.execute(
+                'SELECT state, owner, trigger, expires_at FROM leases WHERE key = ?',
+                (key,)).fetchone()
+            if row is not None and (row[0] == DONE or row[3] > now):
+                self._conn.execute('COMMIT')
+                return (False,) + row[:3]
+            if row is not None:
+                print(f"⚠️  Taking over {key} from {row[1]}, whose lease expired")
+            self._conn.execute(
+                'INSERT OR REPLACE INTO leases (key, owner, state, trigger, acquired_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, self.owner, RUNNING, trigger, now, now + self.lease_ttl))
+            self._conn.execute('DELETE FROM leases WHERE acquired_at < ?', (now - KEEP_SECONDS,))
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        return True, RUNNING, self.owner, trigger
+
+    def acquire(self, key, trigger=None):
+        """
+        Take the lease on `key`, waiting while another run holds it.
+
+        Returns:
+            True if this process should do the work, False if another run
+            did it or is still doing it after `wait` seconds
+        """
+        end = time.monotonic() + self.wait
+        announced = False
+        while True:
+            acquired, state, owner, holder_trigger = self.try_acquire(key, trigger)
+            if acquired:
+                return True
+            via = f" ({holder_trigger})" if holder_trigger else ""
+            if state == DONE:
+                print(f"🔁 {key} was already handled by {owner}{via}, skipping")
+                return False
+            if time.monotonic() >= end:
+                print(f"⏱️  {key} is still running in {owner}{via}, not starting another run")
+                return False
+            if not announced:
+                print(f"⏳ {key} is running in {owner}{via}, waiting for it")
+                announced = True
+            time.sleep(self.poll_interval)
+
+    def complete(self, key):
+        self._conn.execute('UPDATE leases SET state = ? WHERE key = ? AND owner = ?',
+                           (DONE, key, self.owner))
+
+    def abandon(self, key):
+        """Give the lease back so another trigger can retry the window"""
+        self._conn.execute('DELETE FROM leases WHERE key = ? AND owner = ? AND state = ?',
+                           (key, self.owner, RUNNING))
+
+    @contextmanager
+    def claim(self, key, trigger=None):
+        """
+        Context manager around one run: yields whether to run, marks the
+        key done on success and releases it on an exception. A run that
+        finishes without succeeding calls abandon() inside the block, which
+        leaves nothing to mark done.
+        """
+        if not self.acquire(key, trigger):
+            yield False
+            return
+        try:
+            yield True
+        except BaseException:
+            self.abandon(key)
+            raise
+        self.complete(key)
+
+    def close(self):
+        self._conn.close()
+
+
+def create_single_flight(flight_config=None):
+    """SingleFlight per config.SINGLE_FLIGHT_CONFIG, None if disabled or unavailable"""
+    flight_config = dict(config.SINGLE_FLIGHT_CONFIG, **(flight_config or {}))
+    if not flight_config['enabled']:
+        return None
+    try:
+        return SingleFlight(flight_config['path'], flight_config['lease_ttl'],
+                            flight_config['wait'])
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️  Lease file unavailable, runs are not deduplicated: {e}")
+        return None
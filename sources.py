@@ -0,0 +1,216 @@
+"""
+Spot price sources for ETF Tracker
+Ordered upstreams with hedged requests, jittered retries and per-source circuit breakers
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+
+import config
+import metrics
+from records import response_json
+
+
+class CircuitBreaker:
+    """
+    Stop calling a source that keeps failing.
+
+    After `failure_threshold` consecutive failures the breaker opens and the
+    source is skipped for `reset_timeout` seconds. Then a single trial call
+    is let through (half-open): success closes the breaker, failure opens it
+    again.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=60, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Whether a call may go to the source now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        """Returns True if this failure opened the breaker"""
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                return True
+            return False
+
+
+def extract(payload, path):
+    """Value at a dotted path in parsed JSON; numeric parts index lists"""
+    for part in path.split('.'):
+        if isinstance(payload, list):
+            payload = payload[int(part)]
+        else:
+            payload = payload[part]
+    return payload
+
+
+class SpotSource:
+    """One upstream from API_CONFIG['spot_sources']"""
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.url = spec['url']
+        self.symbols = spec.get('symbols', {})
+        self.price_path = spec.get('price_path', 'price')
+        self.headers = dict(spec.get('headers', {}))
+        self.enabled = True
+        api_key_env = spec.get('api_key_env')
+        if api_key_env:
+            api_key = os.environ.get(api_key_env)
+            # Keyed sources are skipped rather than called without a key
+            self.enabled = bool(api_key)
+            self.headers[spec.get('api_key_header', 'x-access-token')] = api_key or ''
+
+    def supports(self, metal):
+        return self.enabled and (not self.symbols or metal in self.symbols)
+
+    def fetch(self, http, metal, timeout):
+        """USD per troy oz, raises on any failure"""
+        url = self.url.format(metal=metal, symbol=self.symbols.get(metal, metal))
+        response = http.get(url, headers=self.headers, timeout=timeout)
+        response.raise_for_status()
+        return float(extract(response_json(response), self.price_path))
+
+
+class SourceChain:
+    """
+    Ask spot sources in order, hedging when one is slow.
+
+    The first healthy source is called right away. If it has not answered
+    after `hedge_delay` seconds, or as soon as it fails, the next one is
+    started as well, and so on; the first valid price wins. A tick therefore
+    waits about `hedge_delay` plus the fastest healthy source, not a full
+    timeout on a stalled primary. Each source retries transient errors with
+    jittered backoff and sits behind its own circuit breaker.
+    """
+
+    def __init__(self, http, sources, source_config=None, timeout=10):
+        """
+        Args:
+            http: Pooled requests.Session
+            sources: List of source specs, see API_CONFIG['spot_sources']
+            source_config: Overrides for config.SOURCE_CONFIG
+            timeout: Seconds per HTTP request
+        """
+        self.http = http
+        self.sources = [SpotSource(spec) for spec in sources]
+        self.source_config = dict(config.SOURCE_CONFIG, **(source_config or {}))
+        self.timeout = timeout
+        self.breakers = {
+            source.name: CircuitBreaker(self.source_config['failure_threshold'],
+                                        self.source_config['reset_timeout'])
+            for source in self.sources
+        }
+
+    def fetch_with_retries(self, source, metal):
+        retries = self.source_config['retries']
+        for attempt in range(retries + 1):
+            try:
+                return source.fetch(self.http, metal, self.timeout)
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                # Full jitter so concurrent ticks do not retry in lockstep
+                delay = random.uniform(0, self.source_config['retry_base_delay'] * 2 ** attempt)
+                print(f"🔁 {source.name} {metal} failed ({e}), retrying in {delay:.2f}s")
+                metrics.inc('etf_retries', component=source.name)
+                time.sleep(delay)
+
+    def fetch(self, metal):
+        """
+        Spot price in USD per troy oz for 'gold' or 'silver'.
+
+        Returns:
+            The first valid price, or None if every source failed or the
+            SOURCE_CONFIG deadline passed
+        """
+        candidates = [source for source in self.sources if source.supports(metal)]
+        if not candidates:
+            print(f"❌ No spot source configured for {metal}")
+            return None
+
+        answers = queue.Queue()
+
+        def worker(source, breaker):
+            try:
+                price = self.fetch_with_retries(source, metal)
+            except Exception as e:
+                if breaker.record_failure():
+                    print(f"🔌 {source.name} circuit open after repeated failures")
+                answers.put((source, None, e))
+            else:
+                breaker.record_success()
+                answers.put((source, price, None))
+
+        def launch_next():
+            while candidates:
+                source = candidates.pop(0)
+                breaker = self.breakers[source.name]
+                if breaker.allow():
+                    threading.Thread(target=worker, args=(source, breaker),
+                                     name=f"spot-{source.name}", daemon=True).start()
+                    return True
+            return False
+
+        end = time.monotonic() + self.source_config['deadline']
+        pending = 1 if launch_next() else 0
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            wait = min(self.source_config['hedge_delay'], remaining) if candidates else remaining
+            try:
+                source, price, error = answers.get(timeout=wait)
+            except queue.Empty:
+                # Slow source, hedge with the next one
+                if launch_next():
+                    pending += 1
+                continue
+
+            pending -= 1
+            if error is None:
+                return price
+            print(f"⚠️  {source.name} failed for {metal}: {error}")
+            if launch_next():
+                pending += 1
+
+        if pending:
+            print(f"⏱️  No {metal} spot price within {self.source_config['deadline']}s")
+        else:
+            print(f"❌ Every spot source failed or is paused for {metal}")
+        return None
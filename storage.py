@@ -0,0 +1,179 @@
+"""
+Time-series store for ETF Tracker
+Append-only binary files, one per symbol per trading day, read back through mmap
+"""
+
+import bisect
+import math
+import mmap
+import os
+import struct
+from datetime import date, datetime
+
+# Partition by the Indian trading day, not the UTC day
+from market_calendar import IST
+
+MAGIC = b'ETFTS1\x00\x00'
+HEADER = struct.Struct('<8sII')  # magic, field count, reserved
+
+# Columns recorded for every ETF on every tick
+QUOTE_FIELDS = ('ltp', 'inav', 'premium_discount', 'volume', 'spot_usd_oz', 'usd_inr')
+
+
+def day_of(ts_ns):
+    """Trading day (IST) a nanosecond timestamp falls on"""
+    return datetime.fromtimestamp(ts_ns / 1e9, IST).date()
+
+
+def day_start_ns(day):
+    """Nanosecond timestamp of IST midnight at the start of `day`"""
+    start = datetime(day.year, day.month, day.day, tzinfo=IST)
+    return int(start.timestamp()) * 1_000_000_000
+
+
+class SeriesSlice:
+    """
+    Zero-copy view over a range of one day's records.
+
+    `timestamps` and each entry of `columns` are strided memoryviews into the
+    mapped file, so they behave like read-only sequences without copying.
+    """
+
+    def __init__(self, fields, timestamps, columns, mapping):
+        self.fields = fields
+        self.timestamps = timestamps
+        self.columns = columns
+        self._mapping = mapping  # Keeps the mmap alive while views exist
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def column(self, field):
+        return self.columns[self.fields.index(field)]
+
+    def rows(self):
+        """Yield (ts_ns, {field: value}) with NaN turned back into None"""
+        for i, ts in enumerate(self.timestamps):
+            yield ts, {field: (None if math.isnan(col[i]) else col[i])
+                       for field, col in zip(self.fields, self.columns)}
+
+
+class TimeSeriesStore:
+    """
+    Append-only per-symbol, per-day store.
+
+    Each file is a small header followed by fixed-size records of an int64
+    epoch-ns timestamp and one float64 per field (NaN for missing values).
+    Appends are a single write to an already open file, and range queries
+    mmap only the days they touch and binary search the timestamp column.
+    """
+
+    def __init__(self, root, series='quotes', fields=QUOTE_FIELDS):
+        self.root = root
+        self.series = series
+        self.fields = tuple(fields)
+        self.record = struct.Struct(f'<q{len(self.fields)}d')
+        self._handles = {}
+
+    def path(self, symbol, day):
+        return os.path.join(self.root, self.series, symbol, f'{day.isoformat()}.bin')
+
+    def _handle(self, symbol, day):
+        key = (symbol, day)
+        handle = self._handles.get(key)
+        if handle is None:
+            # Only one trading day is written at a time, close older files
+            for old_key in [k for k in self._handles if k[0] == symbol]:
+                self._handles.pop(old_key).close()
+
+            path = self.path(symbol, day)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle = open(path, 'ab', buffering=0)
+            if handle.tell() < HEADER.size:
+                # New file, or a crash before the header was fully written
+                handle.truncate(0)
+                handle.write(HEADER.pack(MAGIC, len(self.fields), 0))
+            else:
+                # Drop a torn record left by a crash mid-write
+                handle.truncate(HEADER.size + (handle.tell() - HEADER.size)
+                                // self.record.size * self.record.size)
+            self._handles[key] = handle
+        return handle
+
+    def append(self, symbol, ts_ns, values):
+        """
+        Append one record.
+
+        Args:
+            symbol: ETF symbol
+            ts_ns: Epoch timestamp in nanoseconds, not earlier than the last append
+            values: Dict of field -> number or None
+        """
+        row = [values.get(field) for field in self.fields]
+        row = [math.nan if value is None else float(value) for value in row]
+        self._handle(symbol, day_of(ts_ns)).write(self.record.pack(ts_ns, *row))
+
+    def close(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
+
+    def days(self, symbol):
+        """Trading days with data for `symbol`, as sorted ISO date strings"""
+        try:
+            names = os.listdir(os.path.join(self.root, self.series, symbol))
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-4] for name in names if name.endswith('.bin'))
+
+    def _open_file(self, path):
+        size = os.path.getsize(path)
+        count = (size - HEADER.size) // self.record.size
+        if count <= 0:
+            return None
+
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, field_count, _ = HEADER.unpack_from(mapping)
+        if magic != MAGIC or field_count != len(self.fields):
+            raise ValueError(f"{path} is not a {self.series} series file")
+
+        body = memoryview(mapping)[HEADER.size:HEADER.size + count * self.record.size]
+        return mapping, body.cast('q'), body.cast('d')
+
+    def range(self, symbol, start_ns, end_ns):
+        """
+        Records with start_ns <= ts < end_ns, as a list of SeriesSlice (one per day).
+        """
+        width = len(self.fields) + 1
+        first = day_of(start_ns).isoformat()
+        last = day_of(end_ns - 1).isoformat()
+        directory = os.path.join(self.root, self.series, symbol)
+
+        slices = []
+        for name in self.days(symbol):
+            if name < first or name > last:
+                continue
+            opened = self._open_file(os.path.join(directory, f'{name}.bin'))
+            if opened is None:
+                continue
+            mapping, ints, floats = opened
+            timestamps = ints[0::width]
+            lo, hi = 0, len(timestamps)
+            # Only the boundary days need a binary search
+            if name == first:
+                lo = bisect.bisect_left(timestamps, start_ns)
+            if name == last:
+                hi = bisect.bisect_left(timestamps, end_ns)
+            if hi > lo:
+                columns = [floats[1 + i::width][lo:hi] for i in range(len(self.fields))]
+                slices.append(SeriesSlice(self.fields, timestamps[lo:hi], columns, mapping))
+        return slices
+
+    def day(self, symbol, day):
+        """All records for one trading day, e.g. an intraday premium/discount curve"""
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        start = day_start_ns(day)
+        slices = self.range(symbol, start, start + 86400 * 1_000_000_000)
+        return slices[0] if slices else None
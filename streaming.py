@@ -0,0 +1,318 @@
+"""
+Streaming intraday ingestion for ETF Tracker
+Polls quotes at high frequency and aggregates them into OHLC/VWAP bars on the fly
+"""
+
+import signal
+import threading
+import time
+from collections import deque
+
+import config
+from storage import IST, TimeSeriesStore
+
+NS = 1_000_000_000
+DAY_NS = 86400 * NS
+IST_OFFSET_NS = int(IST.utcoffset(None).total_seconds()) * NS
+
+# Columns of a stored bar; the record timestamp is the bar's start
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'vwap', 'session_vwap',
+              'premium_discount', 'rolling_premium')
+
+
+def interval_label(seconds):
+    return f'{seconds // 60}m' if seconds % 60 == 0 else f'{seconds}s'
+
+
+class Tick:
+    """One observation of a symbol"""
+
+    __slots__ = ('symbol', 'ts_ns', 'ltp', 'volume', 'premium_discount')
+
+    def __init__(self, symbol, ts_ns, ltp, volume=None, premium_discount=None):
+        self.symbol = symbol
+        self.ts_ns = ts_ns
+        self.ltp = ltp
+        self.volume = volume
+        self.premium_discount = premium_discount
+
+
+class Bar:
+    """OHLC bar being built for one symbol and interval"""
+
+    __slots__ = ('symbol', 'interval', 'start_ns', 'open', 'high', 'low', 'close',
+                 'volume', 'pv', 'premium_sum', 'premium_count', 'session_vwap',
+                 'rolling_premium')
+
+    def __init__(self, symbol, interval, start_ns, price):
+        self.symbol = symbol
+        self.interval = interval
+        self.start_ns = start_ns
+        self.open = self.high = self.low = self.close = price
+        self.volume = 0.0
+        self.pv = 0.0
+        self.premium_sum = 0.0
+        self.premium_count = 0
+        self.session_vwap = None
+        self.rolling_premium = None
+
+    @property
+    def end_ns(self):
+        return self.start_ns + self.interval * NS
+
+    def update(self, price, traded, premium, session_vwap, rolling_premium):
+        if price > self.high:
+            self.high = price
+        elif price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += traded
+        self.pv += price * traded
+        if premium is not None:
+            self.premium_sum += premium
+            self.premium_count += 1
+        self.session_vwap = session_vwap
+        self.rolling_premium = rolling_premium
+
+    def values(self):
+        """
+        Fields for the bar store; vwap and premium are averages over the bar,
+        session_vwap and rolling_premium their values at its last tick
+        """
+        return {
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'volume': self.volume,
+            'vwap': self.pv / self.volume if self.volume else None,
+            'session_vwap': self.session_vwap,
+            'premium_discount': (self.premium_sum / self.premium_count
+                                 if self.premium_count else None),
+            'rolling_premium': self.rolling_premium,
+        }
+
+
+class RollingMean:
+    """Mean over the last `window` seconds, capped at `max_items` observations"""
+
+    def __init__(self, window, max_items):
+        self.window_ns = int(window * NS)
+        self.items = deque(maxlen=max_items)
+        self.total = 0.0
+
+    def push(self, ts_ns, value):
+        if len(self.items) == self.items.maxlen:
+            # deque drops the oldest on append, keep the sum in step
+            self.total -= self.items[0][1]
+        self.items.append((ts_ns, value))
+        self.total += value
+        cutoff = ts_ns - self.window_ns
+        while self.items[0][0] <= cutoff:
+            self.total -= self.items.popleft()[1]
+        return self.mean
+
+    @property
+    def mean(self):
+        return self.total / len(self.items) if self.items else None
+
+
+class SymbolState:
+    __slots__ = ('last_volume', 'day', 'session_pv', 'session_volume', 'bars', 'premium')
+
+    def __init__(self, premium_window, max_window_ticks):
+        self.last_volume = None
+        self.day = None
+        self.session_pv = 0.0
+        self.session_volume = 0.0
+        self.bars = {}
+        self.premium = RollingMean(premium_window, max_window_ticks)
+
+
+class BarPipeline:
+    """
+    Incremental bars, session VWAP and rolling premium/discount per symbol.
+
+    Each tick updates one open bar per interval, the session VWAP sums and a
+    bounded rolling window, so the work per tick is constant and memory only
+    grows with the number of symbols. A bar is handed back as soon as its
+    window has ended. Windows are aligned to the epoch, which for 1, 5 and
+    15 minutes is also aligned to IST.
+    """
+
+    def __init__(self, intervals=(60, 300, 900), premium_window=300, max_window_ticks=1000):
+        self.intervals = tuple(intervals)
+        self.premium_window = premium_window
+        self.max_window_ticks = max_window_ticks
+        self.symbols = {}
+        # Earliest end among open bars, so advance() is a comparison most of the time
+        self.next_end_ns = None
+
+    def state(self, symbol):
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = SymbolState(self.premium_window, self.max_window_ticks)
+            self.symbols[symbol] = state
+        return state
+
+    def push(self, tick):
+        """
+        Add one tick.
+
+        Returns:
+            List of bars closed by this tick
+        """
+        if tick.ltp is None:
+            return []
+        state = self.state(tick.symbol)
+
+        # NSE volume is cumulative for the day; a smaller value means a new day
+        day = (tick.ts_ns + IST_OFFSET_NS) // DAY_NS
+        if state.day != day or (tick.volume is not None and state.last_volume is not None
+                                and tick.volume < state.last_volume):
+            state.day = day
+            state.session_pv = 0.0
+            state.session_volume = 0.0
+            state.last_volume = None
+        traded = 0.0
+        if tick.volume is not None:
+            if state.last_volume is not None:
+                traded = float(tick.volume - state.last_volume)
+            state.last_volume = tick.volume
+        state.session_pv += tick.ltp * traded
+        state.session_volume += traded
+        session_vwap = state.session_pv / state.session_volume if state.session_volume else None
+
+        if tick.premium_discount is not None:
+            state.premium.push(tick.ts_ns, tick.premium_discount)
+
+        closed = []
+        for interval in self.intervals:
+            bar = state.bars.get(interval)
+            if bar is not None and tick.ts_ns >= bar.end_ns:
+                closed.append(bar)
+                bar = None
+            if bar is None:
+                start = tick.ts_ns - tick.ts_ns % (interval * NS)
+                bar = Bar(tick.symbol, interval, start, tick.ltp)
+                state.bars[interval] = bar
+                if self.next_end_ns is None or bar.end_ns < self.next_end_ns:
+                    self.next_end_ns = bar.end_ns
+            bar.update(tick.ltp, traded, tick.premium_discount, session_vwap,
+                       state.premium.mean)
+        return closed
+
+    def advance(self, now_ns):
+        """Close bars whose window ended by `now_ns`, even without a new tick"""
+        if self.next_end_ns is None or now_ns < self.next_end_ns:
+            return []
+        closed = []
+        next_end_ns = None
+        for state in self.symbols.values():
+            for interval, bar in list(state.bars.items()):
+                if now_ns >= bar.end_ns:
+                    closed.append(state.bars.pop(interval))
+                elif next_end_ns is None or bar.end_ns < next_end_ns:
+                    next_end_ns = bar.end_ns
+        self.next_end_ns = next_end_ns
+        return closed
+
+    def flush(self):
+        """Close every open bar, e.g. at shutdown"""
+        closed = []
+        for state in self.symbols.values():
+            closed.extend(state.bars.values())
+            state.bars.clear()
+        self.next_end_ns = None
+        return closed
+
+    def rolling_premium(self, symbol):
+        """Mean premium/discount over the last `premium_window` seconds"""
+        state = self.symbols.get(symbol)
+        return state.premium.mean if state else None
+
+    def session_vwap(self, symbol):
+        state = self.symbols.get(symbol)
+        if not state or not state.session_volume:
+            return None
+        return state.session_pv / state.session_volume
+
+
+def poll_ticks(tracker, interval, stop, force=False):
+    """
+    Yield ticks for every configured ETF every `interval` seconds.
+
+    Each poll is one tracker.poll(), so it costs the bulk NSE listings plus
+    cached spot/forex. Raw quotes are also recorded in the history store
+    and handed to the query API.
+    Stops when `stop` is set or, unless `force`, when the market closes.
+    """
+    while not stop.is_set():
+        started = time.monotonic()
+        if not force and not tracker.is_market_open():
+            print("🔔 Market closed, stopping the stream")
+            return
+        ts_ns = time.time_ns()
+        try:
+            quotes, mcx_data, forex_data, metrics = tracker.poll(deadline=interval)
+            tracker.record_history(quotes, metrics, ts_ns)
+            tracker.publish_query(quotes, mcx_data, forex_data, metrics, ts_ns=ts_ns)
+        except Exception as e:
+            print(f"❌ Poll failed: {e}")
+            quotes, metrics = {}, {}
+        for symbol, quote in quotes.items():
+            if quote:
+                yield Tick(symbol, ts_ns, quote.ltp, quote.volume,
+                           (metrics.get(symbol) or {}).get('premium_discount'))
+        stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+def aggregate(ticks, pipeline):
+    """Turn a tick stream into a stream of closed bars, flushing open bars at the end"""
+    for tick in ticks:
+        yield from pipeline.push(tick)
+        yield from pipeline.advance(tick.ts_ns)
+    yield from pipeline.flush()
+
+
+def bar_stores(root, intervals):
+    """One TimeSeriesStore per interval, series 'bars_1m', 'bars_5m', ..."""
+    return {interval: TimeSeriesStore(root, series=f'bars_{interval_label(interval)}',
+                                      fields=BAR_FIELDS)
+            for interval in intervals}
+
+
+def write_bars(bars, stores):
+    """Append each bar to its interval's store as it arrives. Returns the count"""
+    count = 0
+    for bar in bars:
+        stores[bar.interval].append(bar.symbol, bar.start_ns, bar.values())
+        count += 1
+    return count
+
+
+def run_stream(tracker, stream_config=None, force=False):
+    """
+    Poll at STREAM_CONFIG['poll_interval'] and write bars until the market
+    closes or SIGINT/SIGTERM arrives.
+    """
+    stream_config = dict(config.STREAM_CONFIG, **(stream_config or {}))
+    stop = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, lambda *args: stop.set())
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+
+    intervals = stream_config['bar_intervals']
+    pipeline = BarPipeline(intervals, stream_config['premium_window'],
+                           stream_config['max_window_ticks'])
+    stores = bar_stores(config.STORAGE_CONFIG['path'], intervals)
+    print(f"📡 Streaming every {stream_config['poll_interval']}s, "
+          f"bars: {', '.join(interval_label(i) for i in intervals)}")
+    try:
+        ticks = poll_ticks(tracker, stream_config['poll_interval'], stop, force)
+        count = write_bars(aggregate(ticks, pipeline), stores)
+    finally:
+        for store in stores.values():
+            store.close()
+        tracker.close()
+    print(f"✅ Stream stopped, {count} bars written")
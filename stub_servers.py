@@ -0,0 +1,351 @@
+"""
+Local stub upstreams for ETF Tracker
+Stand-ins for NSE, metals.live, exchangerate-api and Telegram used by benchmark.py,
+and servers replaying upstream responses recorded by `etf_tracker.py --profile`
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, parse_qsl, urlparse
+
+
+def nse_quote_payload(symbol, ltp=100.0):
+    """Build a quote-equity response shaped like NSE's"""
+    return {
+        'info': {'symbol': symbol},
+        'priceInfo': {
+            'lastPrice': ltp,
+            'open': ltp - 0.5,
+            'close': ltp - 0.25,
+            'change': 0.25,
+            'pChange': 0.25,
+            'intraDayHighLow': {'min': ltp - 1.0, 'max': ltp + 1.0},
+        },
+        'marketDeptOrderBook': {
+            'totalTradedVolume': 125000,
+            'totalTradedValue': 12500000.0,
+        },
+    }
+
+
+def nse_etf_row(symbol, ltp=100.0):
+    """Build one /api/etf row; NSE sends most numbers as strings"""
+    return {
+        'symbol': symbol,
+        'ltP': f"{ltp:,.2f}",
+        'open': f"{ltp - 0.5:,.2f}",
+        'high': f"{ltp + 1.0:,.2f}",
+        'low': f"{ltp - 1.0:,.2f}",
+        'prevClose': f"{ltp - 0.25:,.2f}",
+        'chn': '0.25',
+        'per': '0.25',
+        'qty': '125000',
+        'trdVal': '12500000.00',
+    }
+
+
+class StubServer:
+    """
+    Threaded HTTP server answering from a route table.
+
+    Each route maps a path to a handler `(request) -> (status, payload[, headers])`
+    where `request` is the BaseHTTPRequestHandler with a parsed `query` and
+    the raw request `body` added. Payloads are sent as JSON, bytes as they
+    are (with the handler's Content-Type header, if any).
+    `latency` delays every response so slow upstreams can be simulated,
+    `error_rate` is the share of requests answered with a 503 instead, and
+    `padding` adds that many bytes to every JSON object response.
+    """
+
+    def __init__(self, routes, latency=0.0, error_rate=0.0, padding=0):
+        self.routes = routes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.padding = padding
+        self.request_count = 0
+        self.error_count = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        # Seeded so error patterns repeat from run to run
+        self._random = random.Random(42)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out as separate writes; without this, Nagle
+            # and delayed ACKs add ~40ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def _respond(self):
+                with stub._lock:
+                    stub.request_count += 1
+                    fail = stub.error_rate and stub._random.random() < stub.error_rate
+                    if fail:
+                        stub.error_count += 1
+                length = int(self.headers.get('Content-Length') or 0)
+                self.body = self.rfile.read(length) if length else b''
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                parsed = urlparse(self.path)
+                self.query = parse_qs(parsed.query)
+                handler = stub.routes.get(parsed.path)
+                if fail:
+                    status, payload, headers = 503, {'error': 'stub error'}, {}
+                elif handler is None:
+                    status, payload, headers = 404, {'error': 'not found'}, {}
+                else:
+                    status, payload, *extra = handler(self)
+                    headers = extra[0] if extra else {}
+                if stub.padding and isinstance(payload, dict):
+                    payload = dict(payload, _padding='x' * stub.padding)
+
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                with stub._lock:
+                    stub.bytes_sent += len(body)
+                self.send_response(status)
+                self.send_header('Content-Type', headers.get('Content-Type', 'application/json'))
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers.items():
+                    if name != 'Content-Type':
+                        self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _respond
+            do_POST = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def nse_stub(latency=0.0):
+    """
+    NSE home page (cookie priming), quote-equity and the bulk ETF listing.
+
+    Like the real site, API calls without the cookie handed out by the home
+    page are rejected with 401. Set `server.cookie` to rotate it and
+    `server.etf_symbols` to choose which symbols /api/etf lists.
+    """
+    def authorized(request):
+        return f"nsit={server.cookie}" in (request.headers.get('Cookie') or '')
+
+    def home(request):
+        return 200, {}, {'Set-Cookie': f"nsit={server.cookie}; Path=/"}
+
+    def quote(request):
+        if not authorized(request):
+            return 401, {'error': 'unauthorized'}
+        symbol = request.query.get('symbol', ['UNKNOWN'])[0]
+        return 200, nse_quote_payload(symbol)
+
+    def etf_listing(request):
+        if not authorized(request):
+            return 401, {'error': 'unauthorized'}
+        return 200, {'data': [nse_etf_row(symbol) for symbol in server.etf_symbols]}
+
+    server = StubServer({
+        '/': home,
+        '/api/quote-equity': quote,
+        '/api/etf': etf_listing,
+    }, latency)
+    server.cookie = 'stub-1'
+    server.etf_symbols = ['TATAGOLD', 'TATSILV']
+    return server
+
+
+def spot_stub(latency=0.0):
+    """
+    metals.live and goldapi.io style spot prices.
+
+    Set `server.prices` to move them and `server.failing` to answer 500.
+    """
+    def price(metal):
+        def respond(request):
+            if server.failing:
+                return 500, {'error': 'upstream unavailable'}
+            return 200, {'price': server.prices[metal]}
+        return respond
+
+    server = StubServer({
+        '/v1/spot/gold': price('gold'),
+        '/v1/spot/silver': price('silver'),
+        '/api/XAU/USD': price('gold'),
+        '/api/XAG/USD': price('silver'),
+    }, latency)
+    server.prices = {'gold': 2045.30, 'silver': 23.45}
+    server.failing = False
+    return server
+
+
+def spot_source(server, name='metals.live'):
+    """API_CONFIG['spot_sources'] entry pointing at a spot stub"""
+    return {'name': name, 'url': f"{server.url}/v1/spot/{{metal}}", 'price_path': 'price'}
+
+
+def forex_stub(latency=0.0):
+    """exchangerate-api.com style USD rates"""
+    return StubServer({
+        '/v4/latest/USD': lambda request: (200, {
+            'rates': {'INR': 83.15},
+            'time_last_updated': int(time.time()),
+        }),
+    }, latency)
+
+
+def telegram_stub(token, latency=0.0):
+    """
+    Telegram Bot API sendMessage and editMessageText, counted in `server.calls`.
+
+    Per chat, `server.chat_latency` adds extra delay and `server.flood` is
+    the number of 429 responses to give before accepting. Accepted messages
+    are recorded in `server.delivered` as (chat_id, arrival time).
+    """
+    lock = threading.Lock()
+
+    def handler(method):
+        def respond(request):
+            chat_id = str(json.loads(request.body or b'{}').get('chat_id'))
+            time.sleep(server.chat_latency.get(chat_id, 0.0))
+            with lock:
+                if server.flood.get(chat_id):
+                    server.flood[chat_id] -= 1
+                    server.rejected += 1
+                    return 429, {'ok': False, 'error_code': 429,
+                                 'description': 'Too Many Requests: retry after 1',
+                                 'parameters': {'retry_after': 1}}
+                server.calls[method] += 1
+                server.delivered.append((chat_id, time.monotonic()))
+                message_id = server.calls['sendMessage']
+            return 200, {'ok': True, 'result': {'message_id': message_id}}
+        return respond
+
+    server = StubServer({
+        f'/bot{token}/sendMessage': handler('sendMessage'),
+        f'/bot{token}/editMessageText': handler('editMessageText'),
+    }, latency)
+    server.calls = {'sendMessage': 0, 'editMessageText': 0}
+    server.chat_latency = {}
+    server.flood = {}
+    server.rejected = 0
+    server.delivered = []
+    return server
+
+
+def fixture_stub(responses, latency=0.0):
+    """
+    Replays recorded responses (see profiling.RequestTimer).
+
+    A request gets the recorded response with the same path and query;
+    when one was recorded several times they are handed out in turn.
+    """
+    lock = threading.Lock()
+    recorded = {}
+    for entry in responses:
+        key = (entry['path'], tuple(sorted(parse_qsl(entry['query']))))
+        recorded.setdefault(key, []).append(entry)
+    turns = {}
+
+    def respond(request):
+        parsed = urlparse(request.path)
+        key = (parsed.path, tuple(sorted(parse_qsl(parsed.query))))
+        entries = recorded.get(key)
+        if not entries:
+            return 404, {'error': 'no fixture'}
+        with lock:
+            turn = turns.get(key, 0)
+            turns[key] = turn + 1
+        entry = entries[turn % len(entries)]
+        return entry['status'], entry['body'].encode(), {'Content-Type': entry['content_type']}
+
+    return StubServer({path: respond for path, _ in recorded}, latency)
+
+
+def start_fixtures(fixtures, latency=0.0, token='stub-token'):
+    """
+    Start one fixture server per recorded upstream, plus a Telegram stub.
+
+    Args:
+        fixtures: Contents of a fixtures.json written by `--profile`
+        latency: Delay in seconds added to every replayed response
+        token: Telegram bot token the tracker will use
+
+    Returns:
+        Tuple of (servers dict, api_config overrides for ETFTracker). Spot
+        sources without recorded responses are left out.
+    """
+    from profiling import upstream_names
+
+    recorded = dict(fixtures['api_config'], telegram_api_url='')
+    names = upstream_names(recorded)
+    by_upstream = {'nse': [], 'forex': []}
+    for entry in fixtures['responses']:
+        by_upstream.setdefault(entry['upstream'], []).append(entry)
+    servers = {name: fixture_stub(responses, latency).start()
+               for name, responses in by_upstream.items()}
+    servers['telegram'] = telegram_stub(token).start()
+
+    def moved(url):
+        server = servers[names[urlparse(url).netloc]]
+        return urlparse(url)._replace(scheme='http', netloc=urlparse(server.url).netloc).geturl()
+
+    spot_sources = []
+    for source in recorded['spot_sources']:
+        if names[urlparse(source['url']).netloc] in servers:
+            source = dict(source, url=moved(source['url']))
+            # Recorded responses need no API key
+            source.pop('api_key_env', None)
+            spot_sources.append(source)
+    api_config = {
+        'nse_base_url': moved(recorded['nse_base_url']),
+        'spot_sources': spot_sources,
+        'forex_api_url': moved(recorded['forex_api_url']),
+        'telegram_api_url': servers['telegram'].url,
+    }
+    return servers, api_config
+
+
+def start_all(latencies, token='stub-token', error_rates=None, padding=None):
+    """
+    Start one stub server per upstream.
+
+    Args:
+        latencies: Dict with 'nse', 'spot', 'forex' and 'telegram' delays in seconds
+        token: Telegram bot token the tracker will use
+        error_rates: Optional dict of upstream -> share of requests failing with 503
+        padding: Optional dict of upstream -> extra bytes per JSON response
+
+    Returns:
+        Tuple of (servers dict, api_config overrides for ETFTracker)
+    """
+    servers = {
+        'nse': nse_stub(latencies.get('nse', 0.0)).start(),
+        'spot': spot_stub(latencies.get('spot', 0.0)).start(),
+        'forex': forex_stub(latencies.get('forex', 0.0)).start(),
+        'telegram': telegram_stub(token, latencies.get('telegram', 0.0)).start(),
+    }
+    for name, server in servers.items():
+        server.error_rate = (error_rates or {}).get(name, 0.0)
+        server.padding = (padding or {}).get(name, 0)
+    api_config = {
+        'nse_base_url': servers['nse'].url,
+        'spot_sources': [spot_source(servers['spot'])],
+        'forex_api_url': f"{servers['forex'].url}/v4/latest/USD",
+        'telegram_api_url': servers['telegram'].url,
+    }
+    return servers, api_config
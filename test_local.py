@@ -40,13 +40,6 @@ def test_imports():
         print("  ❌ requests - Run: pip install requests")
         return False
     
-    try:
-        import pytz
-        print("  ✅ pytz")
-    except ImportError:
-        print("  ❌ pytz - Run: pip install pytz")
-        return False
-    
     return True
 
 def test_telegram_connection():